@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Any, List, Generic, Optional, TypeVar, Union
+from typing import Any, Dict, List, Generic, Optional, TypeVar, Union
 import abc
 from environment import Environment
 
@@ -18,6 +18,7 @@ Expr = Union[
     "Set",
     "This",
     "Super",
+    "Inlined",
 ]
 
 Stmt = Union[
@@ -35,7 +36,7 @@ Program = List[Stmt]
 T = TypeVar("T")
 
 
-@dataclass
+@dataclass(slots=True)
 class Expression:
     expression: Expr
 
@@ -43,17 +44,18 @@ class Expression:
         return visitor.visit_expression(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Class:
     name: Token
     superclass: Optional["Variable"]
     methods: List["Function"]
+    slot: Optional[int] = None
 
     def accept(self, visitor: "StmtVisitor[T]") -> T:
         return visitor.visit_class(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class If:
     condition: Expr
     then_branch: Stmt
@@ -63,7 +65,7 @@ class If:
         return visitor.visit_if(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Print:
     expression: Expr
 
@@ -71,7 +73,7 @@ class Print:
         return visitor.visit_print(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class While:
     condition: Expr
     body: Stmt
@@ -80,34 +82,69 @@ class While:
         return visitor.visit_while(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Var:
     name: Token
     initializer: Optional[Expr]
+    # Slot in the enclosing scope, set by the Resolver. None for globals.
+    slot: Optional[int] = None
 
     def accept(self, visitor: "StmtVisitor[T]") -> T:
         return visitor.visit_var(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Block:
     statements: List[Stmt]
+    # Number of locals the block declares. A block that declares nothing
+    # gets no environment of its own.
+    slot_count: int = 0
+    # Set by the Resolver when the block is a counted `for` loop.
+    counted_loop: Optional["CountedLoop"] = None
 
     def accept(self, visitor: "StmtVisitor[T]") -> T:
         return visitor.visit_block(self)
 
 
-@dataclass
+@dataclass(slots=True)
+class CountedLoop:
+    """A `for` loop over a number the body never assigns, which desugars to
+    `{ var i = start; while (i < limit) { body; i = i + step; } }`. The
+    engines keep `i` in a Python variable while the loop runs."""
+
+    variable: Var
+    loop: While
+    increment: "Assign"
+
+
+@dataclass(slots=True)
+class Hit:
+    """Stands in for `statement`, on source line `line`, in a program run
+    with `--heatmap`, which counts and times every run of it. Only the
+    tree-walking and closure engines know how to run one."""
+
+    statement: Stmt
+    line: int
+    heatmap: Any
+
+    def accept(self, visitor: "StmtVisitor[T]") -> T:
+        return visitor.visit_hit(self)
+
+
+@dataclass(slots=True)
 class Function:
     name: Token
     params: List[Token]
     body: List[Stmt]
+    slot: Optional[int] = None
+    # Parameters plus the locals declared directly in the body.
+    slot_count: int = 0
 
     def accept(self, visitor: "StmtVisitor[T]") -> T:
         return visitor.visit_function(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Return:
     keyword: Token
     value: Optional[Expr]
@@ -115,15 +152,17 @@ class Return:
     def accept(self, visitor: "StmtVisitor[T]") -> T:
         return visitor.visit_return(self)
     
-@dataclass
+@dataclass(slots=True)
 class Break:
     keyword: Token
-    loop_depth: Optional[Expr]
+    # Number of loops enclosing the break within its function; 0 is an error.
+    loop_depth: int
+
     def accept(self, visitor: "StmtVisitor"):
         return visitor.visit_break(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Binary:
     left: Expr
     operator: Token
@@ -133,7 +172,7 @@ class Binary:
         return visitor.visit_binary(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Logical:
     left: Expr
     operator: Token
@@ -143,7 +182,7 @@ class Logical:
         return visitor.visit_logical(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Grouping:
     expression: Expr
 
@@ -151,7 +190,7 @@ class Grouping:
         return visitor.visit_grouping(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Literal:
     value: Any
 
@@ -159,15 +198,18 @@ class Literal:
         return visitor.visit_literal(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Variable:
     name: Token
+    # Scope distance and slot, set by the Resolver. None for globals.
+    depth: Optional[int] = None
+    slot: Optional[int] = None
 
     def accept(self, visitor: "ExprVisitor[T]") -> T:
         return visitor.visit_variable(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Unary:
     operator: Token
     right: Expr
@@ -176,7 +218,7 @@ class Unary:
         return visitor.visit_unary(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Call:
     callee: Expr
     token: Token
@@ -186,16 +228,18 @@ class Call:
         return visitor.visit_call(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Assign:
     name: Token
     value: Expr
+    depth: Optional[int] = None
+    slot: Optional[int] = None
 
     def accept(self, visitor: "ExprVisitor[T]") -> T:
         return visitor.visit_assign(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Set:
     object: Expr
     name: Token
@@ -205,32 +249,51 @@ class Set:
         return visitor.visit_set(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Get:
     object: Expr
     name: Token
+    # Inline cache of receiver class -> method, filled in by the interpreter.
+    cache: Optional[Dict[Any, Any]] = None
 
     def accept(self, visitor: "ExprVisitor[T]") -> T:
         return visitor.visit_get(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class This:
     keyword: Token
+    depth: Optional[int] = None
+    slot: Optional[int] = None
 
     def accept(self, visitor: "ExprVisitor[T]") -> T:
         return visitor.visit_this(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class Super:
     keyword: Token
     method: Token
+    # `this` lives in slot 0 of the scope one closer than `super`.
+    depth: Optional[int] = None
+    slot: Optional[int] = None
 
     def accept(self, visitor: "ExprVisitor[T]") -> T:
         return visitor.visit_super(self)
 
 
+@dataclass(slots=True)
+class Inlined:
+    # The body of a call to `name` that the -O pass inlined, with the
+    # arguments substituted. Like the function body it stands for, it is a
+    # runtime-error boundary: an error is reported and the value is nil.
+    name: Token
+    body: Expr
+
+    def accept(self, visitor: "ExprVisitor[T]") -> T:
+        return visitor.visit_inlined(self)
+
+
 class AbstractInterpreter(Generic[T]):
     @abc.abstractmethod
     def visit_statements(
@@ -240,6 +303,8 @@ class AbstractInterpreter(Generic[T]):
 
 
 class LoxCallable(abc.ABC):
+    __slots__ = ()
+
     @abc.abstractmethod
     def call(self, interpreter: AbstractInterpreter[Any], arguments: List[Any]) -> Any:
         raise NotImplementedError
@@ -340,3 +405,7 @@ class ExprVisitor(abc.ABC, Generic[T]):
     @abc.abstractmethod
     def visit_super(self, expr: Super) -> T:
         pass
+
+    @abc.abstractmethod
+    def visit_inlined(self, expr: Inlined) -> T:
+        pass
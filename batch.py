@@ -0,0 +1,145 @@
+"""`pylox.py --batch`: runs many scripts, in parallel, as if one at a time.
+
+Every script is scanned, parsed, resolved and run on its own, with a
+fresh interpreter, by one of a pool of processes forked from this one,
+so none of them pays Python's start-up or the imports. What each script
+prints is captured and written in the order the scripts were given, as
+though they had run one after the other; with --json, one line of JSON
+per script instead, with its exit status and timings.
+"""
+import gc
+import glob
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+from dataclasses import asdict, dataclass
+from functools import partial
+from typing import Iterator, List
+
+from errors import Globals
+from optimizer import Optimizer
+from program_cache import load_program, save_program, source_digest
+from pylox import parse_program, run_program
+from scanner import read_chunks
+
+
+@dataclass
+class Outcome:
+    """How running one script went: its exit status as pylox.py would give
+    it, what it printed, and how long compiling (loading from the cache,
+    or scanning, parsing and resolving, then -O) and executing took."""
+
+    script: str
+    status: int
+    stdout: str
+    stderr: str
+    compile_ms: float
+    execute_ms: float
+
+
+def scripts(pattern: str) -> List[str]:
+    """The scripts under the directory `pattern`, or matching the glob
+    `pattern`, sorted by path."""
+    if os.path.isdir(pattern):
+        found = [
+            os.path.join(root, name)
+            for (root, _, names) in os.walk(pattern)
+            for name in names
+            if name.endswith((".lox", ".pylox"))
+        ]
+    else:
+        found = [path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path)]
+    return sorted(found)
+
+
+def run_script(script: str, args) -> Outcome:
+    """Runs `script` as run_file would, with what it prints captured."""
+    Globals.had_error = False
+    Globals.had_runtime_error = False
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    status = 0
+    compiled = executed = start = time.perf_counter()
+    with redirect_stdout(stdout), redirect_stderr(stderr):
+        try:
+            program = None
+            if not args.no_cache:
+                digest = source_digest(script)
+                program = load_program(script, digest)
+            if program is None:
+                program = parse_program(read_chunks(script))
+                if not args.no_cache and program is not None:
+                    save_program(script, digest, program)
+            if program is not None and args.optimize:
+                program = Optimizer(args.inline_size).optimize(program)
+            compiled = executed = time.perf_counter()
+
+            if program is not None:
+                # As in run_file, but the process outlives the program.
+                gc.freeze()
+                try:
+                    run_program(
+                        program,
+                        args.engine,
+                        args.disassemble,
+                        args.stats,
+                        args.max_depth,
+                    )
+                finally:
+                    gc.unfreeze()
+                executed = time.perf_counter()
+
+            if Globals.had_error:
+                status = 65
+            elif Globals.had_runtime_error:
+                status = 70
+        except Exception:
+            traceback.print_exc()
+            status = 1
+
+    return Outcome(
+        script,
+        status,
+        stdout.getvalue(),
+        stderr.getvalue(),
+        round((compiled - start) * 1000, 3),
+        round((executed - compiled) * 1000, 3),
+    )
+
+
+def outcomes(paths: List[str], args) -> Iterator[Outcome]:
+    """The outcome of every script in `paths`, in order, as they finish."""
+    task = partial(run_script, args=args)
+    if args.jobs == 1:
+        yield from map(task, paths)
+        return
+
+    # Larger chunks cost fewer round trips to the workers; smaller ones
+    # keep the last worker from finishing long after the others.
+    chunksize = max(1, min(64, len(paths) // (args.jobs * 8)))
+    with multiprocessing.get_context("fork").Pool(args.jobs) as pool:
+        yield from pool.imap(task, paths, chunksize)
+
+
+def run_batch(args) -> int:
+    """Runs the scripts `args.batch` names and writes what they printed;
+    returns the highest exit status of any."""
+    paths = scripts(args.batch)
+    if not paths:
+        print(f"pylox.py: no scripts match {args.batch}", file=sys.stderr)
+        return 64
+
+    status = 0
+    for outcome in outcomes(paths, args):
+        if args.json:
+            print(json.dumps(asdict(outcome)))
+        else:
+            sys.stdout.write(outcome.stdout)
+            sys.stderr.write(outcome.stderr)
+        status = max(status, outcome.status)
+    return status
@@ -0,0 +1,55 @@
+"""Memory held by the AST of a large generated program.
+
+    python bench/ast_memory.py [--size MB]
+
+Parses (and resolves) a generated program and reports the bytes still
+allocated afterwards, which is the AST together with the tokens it keeps,
+per line of source and per node.
+"""
+import argparse
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scanner import Scanner
+from parsers import Parser
+from resolver import Resolver
+from scanner_throughput import generate
+
+
+def count_nodes(node) -> int:
+    """Counts the AST nodes reachable from `node`, which may be a list."""
+    if isinstance(node, list):
+        return sum(count_nodes(item) for item in node)
+    if not hasattr(node, "accept"):
+        return 0
+    return 1 + sum(
+        count_nodes(getattr(node, field)) for field in node.__dataclass_fields__
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=float, default=4.0, help="source size in MB")
+    args = parser.parse_args()
+
+    source = generate(int(args.size * 1_000_000))
+    lines = source.count("\n") + 1
+
+    tracemalloc.start()
+    statements = Parser(Scanner(source).scan()).parse()
+    Resolver().resolve_list(statements)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    nodes = count_nodes(statements)
+    print(f"source:   {len(source) / 1_000_000:.1f} MB, {lines} lines, {nodes} nodes")
+    print(f"AST:      {size / 1_000_000:.1f} MB")
+    print(f"per line: {size / lines:.0f} bytes")
+    print(f"per node: {size / nodes:.0f} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Allocates many small Lox instances and reports the memory each one costs.
+
+    python bench/instance_memory.py [--count N] [--engine ENGINE]
+
+The instances are kept alive in a linked list whose fields only hold
+shared values (nil, true and the previous node), so the figure is the
+cost of the instance itself and its field storage.
+"""
+import argparse
+import sys
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scanner import Scanner
+from parsers import Parser
+from resolver import Resolver
+from pylox import ENGINES
+
+SOURCE = """
+class Node {}
+var head = nil;
+for (var i = 0; i < %d; i = i + 1) {
+  var node = Node();
+  node.next = head;
+  node.flag = true;
+  head = node;
+}
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--engine", choices=ENGINES, default="closure")
+    args = parser.parse_args()
+
+    statements = Parser(Scanner(SOURCE % args.count).scan_tokens()).parse()
+    Resolver().resolve_list(statements)
+    interpreter = ENGINES[args.engine]()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    interpreter.visit_statements(statements)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"instances:          {args.count}")
+    print(f"retained bytes:     {after - before}")
+    print(f"bytes per instance: {(after - before) / args.count:.1f}")
+
+
+if __name__ == "__main__":
+    main()
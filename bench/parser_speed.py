@@ -0,0 +1,60 @@
+"""Parser speed on generated Lox source and on long expressions.
+
+    python bench/parser_speed.py [--size MB] [--terms N] [--depth N] [--repeat N]
+
+Tokens are scanned once up front; only parsing is timed. Prints the best
+of N runs for the generated program, a flat sum of --terms terms and a sum
+nested to the right --depth levels deep, which needs a few Python frames
+per level.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scanner import Scanner
+from parsers import Parser
+from scanner_throughput import generate
+
+
+def best_parse(source: str, repeat: int) -> str:
+    tokens = Scanner(source).scan_tokens()
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            Parser(tokens).parse()
+        except RecursionError:
+            return "RecursionError"
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return f"{best:.3f} s"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=float, default=2.0, help="program size in MB")
+    parser.add_argument("--terms", type=int, default=10_000)
+    parser.add_argument("--depth", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    terms = [str(i) for i in range(max(args.terms, args.depth))]
+    cases = {
+        f"program ({args.size:g} MB)": generate(int(args.size * 1_000_000)),
+        f"flat sum ({args.terms} terms)": "print "
+        + " + ".join(terms[: args.terms])
+        + ";",
+        f"nested sum ({args.depth} deep)": "print "
+        + " + (".join(terms[: args.depth])
+        + ")" * (args.depth - 1)
+        + ";",
+    }
+    for (name, source) in cases.items():
+        print(f"{name:<28} {best_parse(source, args.repeat)}")
+
+
+if __name__ == "__main__":
+    main()
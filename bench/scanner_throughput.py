@@ -0,0 +1,77 @@
+"""Scanner throughput on a generated multi-megabyte Lox file.
+
+    python bench/scanner_throughput.py [--size MB] [--repeat N]
+
+Prints the best of N runs in MB/s and tokens/s.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scanner import Scanner
+
+SNIPPET = """
+// Function %(n)d: mixes every kind of token the scanner knows.
+class Shape%(n)d < Base {
+  init(width, height) {
+    this.width = width;
+    this.height = height;
+  }
+
+  area() {
+    return this.width * this.height / 2.5 + %(n)d;
+  }
+}
+
+fun check%(n)d(a, b) {
+  var label = "shape number %(n)d";
+  if (a >= b and !(a == nil) or b != 0.125) {
+    for (var i = 0; i < a; i = i + 1) {
+      print label + " " + i;
+    }
+  } else {
+    while (b <= a) { b = b - 1; }
+  }
+  return Shape%(n)d(a, b).area();
+}
+"""
+
+
+def generate(size: int) -> str:
+    parts = []
+    total = 0
+    n = 0
+    while total < size:
+        part = SNIPPET % {"n": n}
+        parts.append(part)
+        total += len(part)
+        n += 1
+    return "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=float, default=4.0, help="source size in MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    source = generate(int(args.size * 1_000_000))
+    megabytes = len(source.encode("utf8")) / 1_000_000
+
+    best = None
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        tokens = Scanner(source).scan_tokens()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f"source:   {megabytes:.1f} MB, {len(tokens)} tokens")
+    print(f"time:     {best:.3f} s (best of {args.repeat})")
+    print(f"speed:    {megabytes / best:.2f} MB/s, {len(tokens) / best:,.0f} tokens/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Start-up time of pylox.py with and without the compiled .loxc cache.
+
+    python bench/startup_cache.py [--size MB] [--repeat N]
+
+Writes a generated script that only declares classes and functions, so
+the run is almost all front end, then times fresh `pylox.py` processes
+with --no-cache and with a warm cache. Prints the median of N runs.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from scanner_throughput import generate
+
+PYLOX = Path(__file__).resolve().parent.parent / "pylox.py"
+
+
+def timed_run(script: Path, *options: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, str(PYLOX), str(script), *options], check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=float, default=1.0, help="script size in MB")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # The cache honours PYTHONDONTWRITEBYTECODE like .pyc files do.
+    os.environ.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        script = Path(tmp) / "large.lox"
+        source = "class Base {}\n" + generate(int(args.size * 1_000_000))
+        script.write_text(source, encoding="utf8")
+        timed_run(script)
+
+        cold = [timed_run(script, "--no-cache") for _ in range(args.repeat)]
+        warm = [timed_run(script) for _ in range(args.repeat)]
+
+    print(f"script:    {len(source) / 1_000_000:.1f} MB")
+    print(f"no cache:  {statistics.median(cold):.3f} s")
+    print(f"cached:    {statistics.median(warm):.3f} s")
+
+
+if __name__ == "__main__":
+    main()
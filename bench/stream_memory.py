@@ -0,0 +1,84 @@
+"""Peak memory of the front end on a large generated Lox file.
+
+    python bench/stream_memory.py [--size MB] [--parse]
+
+Writes a generated script of the given size (100 MB by default) to a
+temporary directory, then runs each front end in a fresh process and
+prints its peak RSS:
+
+    list    read the whole file, build the full token list
+    stream  scan the file in chunks, pulling tokens one at a time
+
+With --parse the tokens are also parsed into an AST, which then dominates
+the peak for both front ends.
+"""
+import argparse
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scanner import Scanner, read_chunks
+from parsers import Parser
+from scanner_throughput import SNIPPET
+
+
+def write_source(path: Path, size: int) -> None:
+    # Written a snippet at a time: a child's peak RSS starts from its
+    # parent's, so the parent must not hold the whole source either.
+    with open(path, "w", encoding="utf8") as f:
+        n = 0
+        while f.tell() < size:
+            f.write(SNIPPET % {"n": n})
+            n += 1
+
+
+def front_end(mode: str, path: str, parse: bool) -> int:
+    if mode == "list":
+        tokens = Scanner(Path(path).read_text(encoding="utf8")).scan_tokens()
+    else:
+        tokens = Scanner(read_chunks(path)).scan()
+
+    if parse:
+        return len(Parser(tokens).parse())
+    return sum(1 for _ in tokens)
+
+
+def child(mode: str, path: str, parse: bool) -> None:
+    start = time.perf_counter()
+    count = front_end(mode, path, parse)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    what = "statements" if parse else "tokens"
+    print(f"{mode:<7} {peak:9.1f} MB peak RSS  {elapsed:7.2f} s  {count} {what}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=float, default=100.0, help="source size in MB")
+    parser.add_argument("--parse", action="store_true", help="also build the AST")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child, args.parse)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "large.lox"
+        write_source(path, int(args.size * 1_000_000))
+        print(f"source: {path.stat().st_size / 1_000_000:.1f} MB")
+        for mode in ("list", "stream"):
+            command = [sys.executable, __file__, "--child", mode, str(path)]
+            if args.parse:
+                command.append("--parse")
+            subprocess.run(command, check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""Runs the workloads in bench/suite and compares the results of two runs.
+
+    python bench/suite.py run [--engine ENGINE] [-O] [--repeat N] [--output FILE] [NAME ...]
+    python bench/suite.py compare BASELINE RESULTS [--threshold PERCENT] [--min-ms MS]
+
+`run` runs every workload, or only the named ones, N times, each time in
+a fresh Python process. It times scanning, parsing, resolving, -O when
+given, and executing separately, and writes the median and standard
+deviation of each phase as JSON, to stdout or --output FILE.
+
+`compare` reads two such files and flags every phase that got slower by
+more than the threshold, by more than the two runs' deviations added
+together and by at least --min-ms. It exits with status 1 if it flagged
+any.
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scanner import Scanner, read_chunks
+from parsers import Parser
+from resolver import Resolver
+from optimizer import Optimizer
+from errors import Globals
+from pylox import ENGINES, run_program
+
+SUITE = Path(__file__).resolve().parent / "suite"
+
+
+def phases(script: Path, engine: str, optimize: bool) -> dict:
+    """Seconds each phase of running `script` took in this process."""
+    times = {}
+
+    start = time.perf_counter()
+    tokens = list(Scanner(read_chunks(script)).scan())
+    times["scan"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    program = Parser(tokens).parse()
+    times["parse"] = time.perf_counter() - start
+
+    if program is None or Globals.had_error:
+        raise SystemExit(f"{script}: does not parse")
+
+    start = time.perf_counter()
+    Resolver().resolve_list(program)
+    times["resolve"] = time.perf_counter() - start
+
+    if Globals.had_error:
+        raise SystemExit(f"{script}: does not resolve")
+
+    if optimize:
+        start = time.perf_counter()
+        program = Optimizer().optimize(program)
+        times["optimize"] = time.perf_counter() - start
+
+    # As in pylox.run_file.
+    gc.freeze()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        run_program(program, engine)
+        times["execute"] = time.perf_counter() - start
+
+    if Globals.had_runtime_error:
+        raise SystemExit(f"{script}: runtime error")
+
+    times["total"] = sum(times.values())
+    return times
+
+
+def fresh_run(script: Path, engine: str, optimize: bool) -> dict:
+    command = [sys.executable, __file__, "phases", str(script), "--engine", engine]
+    if optimize:
+        command.append("-O")
+    output = subprocess.run(command, check=True, capture_output=True, text=True)
+    return json.loads(output.stdout)
+
+
+def summary(samples: list) -> dict:
+    return {
+        "median": statistics.median(samples),
+        "stddev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "samples": samples,
+    }
+
+
+def run(args) -> None:
+    scripts = sorted(SUITE.glob("*.lox"))
+    if args.names:
+        unknown = set(args.names) - {script.stem for script in scripts}
+        if unknown:
+            raise SystemExit(f"no such benchmark: {', '.join(sorted(unknown))}")
+        scripts = [script for script in scripts if script.stem in args.names]
+
+    benchmarks = {}
+    for script in scripts:
+        runs = [fresh_run(script, args.engine, args.optimize) for _ in range(args.repeat)]
+        benchmarks[script.stem] = {
+            phase: summary([times[phase] for times in runs]) for phase in runs[0]
+        }
+        total = benchmarks[script.stem]["total"]
+        print(
+            f"{script.stem:<12} {total['median'] * 1000:>10.1f} ms "
+            f"± {total['stddev'] * 1000:.1f}",
+            file=sys.stderr,
+        )
+
+    results = {
+        "python": platform.python_version(),
+        "engine": args.engine,
+        "optimize": args.optimize,
+        "repeat": args.repeat,
+        "benchmarks": benchmarks,
+    }
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w", encoding="utf8") as out:
+            json.dump(results, out, indent=2)
+            out.write("\n")
+
+
+def compare(args) -> None:
+    with open(args.baseline, encoding="utf8") as f:
+        baseline = json.load(f)
+    with open(args.results, encoding="utf8") as f:
+        results = json.load(f)
+
+    for (name, data) in (("baseline", baseline), ("results", results)):
+        print(
+            f"{name}: engine {data['engine']}, -O {data['optimize']}, "
+            f"Python {data['python']}, {data['repeat']} runs"
+        )
+    print()
+    print(f"{'benchmark':<12} {'phase':<9} {'baseline ms':>12} {'ms':>10} {'change':>8}")
+
+    regressions = 0
+    for (name, phases) in results["benchmarks"].items():
+        if name not in baseline["benchmarks"]:
+            continue
+        for (phase, new) in phases.items():
+            old = baseline["benchmarks"][name].get(phase)
+            if old is None:
+                continue
+            change = (new["median"] - old["median"]) / old["median"] * 100
+            noise = max(old["stddev"] + new["stddev"], args.min_ms / 1000)
+            slower = new["median"] - old["median"] > noise
+            flag = ""
+            if change > args.threshold and slower:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(
+                f"{name:<12} {phase:<9} {old['median'] * 1000:>12.2f} "
+                f"{new['median'] * 1000:>10.2f} {change:>+7.1f}%{flag}"
+            )
+
+    if regressions:
+        print(f"\n{regressions} regression(s) over {args.threshold:g}%")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the suite")
+    run_parser.add_argument("names", nargs="*", metavar="NAME")
+    run_parser.add_argument("--engine", choices=ENGINES, default="tree")
+    run_parser.add_argument("-O", "--optimize", action="store_true")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--output", metavar="FILE")
+
+    compare_parser = commands.add_parser("compare", help="compare two runs")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument("--threshold", type=float, default=5.0, metavar="PERCENT")
+    compare_parser.add_argument("--min-ms", type=float, default=1.0, metavar="MS")
+
+    # What `run` starts in each fresh process.
+    phases_parser = commands.add_parser("phases")
+    phases_parser.add_argument("script", type=Path)
+    phases_parser.add_argument("--engine", choices=ENGINES, default="tree")
+    phases_parser.add_argument("-O", "--optimize", action="store_true")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    elif args.command == "compare":
+        compare(args)
+    else:
+        print(json.dumps(phases(args.script, args.engine, args.optimize)))
+
+
+if __name__ == "__main__":
+    main()
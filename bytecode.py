@@ -0,0 +1,611 @@
+import math
+from array import array
+from enum import Enum, auto
+from typing import Tuple
+from AstPrinter import *
+from tokens import *
+
+# Opcodes are plain ints so the VM dispatch loop compares small integers.
+# Operands follow their opcode as extra words in Chunk.code.
+OPCODES = [
+    # name, operand count
+    ("CONSTANT", 1),
+    ("NIL", 0),
+    ("TRUE", 0),
+    ("FALSE", 0),
+    ("POP", 0),
+    ("GET_LOCAL", 1),
+    ("SET_LOCAL", 1),
+    ("GET_GLOBAL", 1),
+    ("DEFINE_GLOBAL", 1),
+    ("SET_GLOBAL", 1),
+    ("GET_UPVALUE", 1),
+    ("SET_UPVALUE", 1),
+    ("GET_PROPERTY", 1),
+    ("SET_PROPERTY", 1),
+    ("GET_SUPER", 1),
+    ("GET_METHOD", 1),
+    ("EQUAL", 0),
+    ("NOT_EQUAL", 0),
+    ("GREATER", 0),
+    ("GREATER_EQUAL", 0),
+    ("LESS", 0),
+    ("LESS_EQUAL", 0),
+    ("ADD", 0),
+    ("SUBTRACT", 0),
+    ("MULTIPLY", 0),
+    ("DIVIDE", 0),
+    ("NOT", 0),
+    ("NEGATE", 0),
+    ("PRINT", 0),
+    ("JUMP", 1),
+    ("POP_JUMP_IF_FALSE", 1),
+    ("JUMP_IF_FALSE_OR_POP", 1),
+    ("JUMP_IF_TRUE_OR_POP", 1),
+    ("PUSH_HANDLER", 1),
+    ("POP_HANDLER", 0),
+    ("CALL", 1),
+    ("INVOKE", 1),
+    # `return f(...)`: the callee replaces the caller's frame.
+    ("TAIL_CALL", 1),
+    ("TAIL_INVOKE", 1),
+    ("CLOSURE", 1),  # followed by (is_local, index) per upvalue
+    ("CLOSE_UPVALUE", 0),
+    ("RETURN", 0),
+    ("CHECK_SUPERCLASS", 0),
+    ("CLASS", 2),
+]
+
+OPCODE_NAMES = [name for (name, _) in OPCODES]
+OPERAND_COUNTS = [count for (_, count) in OPCODES]
+
+(
+    CONSTANT,
+    NIL,
+    TRUE,
+    FALSE,
+    POP,
+    GET_LOCAL,
+    SET_LOCAL,
+    GET_GLOBAL,
+    DEFINE_GLOBAL,
+    SET_GLOBAL,
+    GET_UPVALUE,
+    SET_UPVALUE,
+    GET_PROPERTY,
+    SET_PROPERTY,
+    GET_SUPER,
+    GET_METHOD,
+    EQUAL,
+    NOT_EQUAL,
+    GREATER,
+    GREATER_EQUAL,
+    LESS,
+    LESS_EQUAL,
+    ADD,
+    SUBTRACT,
+    MULTIPLY,
+    DIVIDE,
+    NOT,
+    NEGATE,
+    PRINT,
+    JUMP,
+    POP_JUMP_IF_FALSE,
+    JUMP_IF_FALSE_OR_POP,
+    JUMP_IF_TRUE_OR_POP,
+    PUSH_HANDLER,
+    POP_HANDLER,
+    CALL,
+    INVOKE,
+    TAIL_CALL,
+    TAIL_INVOKE,
+    CLOSURE,
+    CLOSE_UPVALUE,
+    RETURN,
+    CHECK_SUPERCLASS,
+    CLASS,
+) = range(len(OPCODES))
+
+BINARY_OPCODES = {
+    TokenType.BANG_EQUAL: NOT_EQUAL,
+    TokenType.EQUAL_EQUAL: EQUAL,
+    TokenType.GREATER: GREATER,
+    TokenType.GREATER_EQUAL: GREATER_EQUAL,
+    TokenType.LESS: LESS,
+    TokenType.LESS_EQUAL: LESS_EQUAL,
+    TokenType.MINUS: SUBTRACT,
+    TokenType.PLUS: ADD,
+    TokenType.SLASH: DIVIDE,
+    TokenType.STAR: MULTIPLY,
+}
+
+
+class FunctionType(Enum):
+    SCRIPT = auto()
+    FUNCTION = auto()
+    METHOD = auto()
+    INITIALIZER = auto()
+
+
+class Chunk:
+    def __init__(self):
+        self.code = array("i")
+        self.lines = array("i")
+        self.constants: List[Any] = []
+        self.constant_index: Dict[Tuple[type, Any], int] = {}
+
+    def write(self, word: int, line: int) -> int:
+        self.code.append(word)
+        self.lines.append(line)
+        return len(self.code) - 1
+
+    def add_constant(self, value: Any) -> int:
+        key = constant_key(value)
+        if key not in self.constant_index:
+            self.constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return self.constant_index[key]
+
+
+def constant_key(value: Any) -> Tuple[Any, ...]:
+    """A key under which equal constants can be shared. It includes the type
+    and the sign of floats, since 1, 1.0 and true, or 0.0 and -0.0, are
+    equal in Python but not the same Lox value."""
+    if type(value) is float:
+        return (float, value, math.copysign(1.0, value))
+    return (type(value), value)
+
+
+class FunctionProto:
+    def __init__(
+        self,
+        name: str,
+        arity: int,
+        kind: FunctionType,
+        declaration: Optional[Function] = None,
+    ):
+        self.name = name
+        self.arity = arity
+        self.kind = kind
+        # The function's AST, for natives that inspect it, like memoize.
+        self.declaration = declaration
+        self.chunk = Chunk()
+        self.upvalue_count = 0
+
+    def __str__(self):
+        if self.kind == FunctionType.SCRIPT:
+            return "<script>"
+        return f"<fn {self.name}>"
+
+
+class Local:
+    def __init__(self, name: str, depth: int):
+        self.name = name
+        self.depth = depth
+        self.is_captured = False
+
+
+class Loop:
+    def __init__(self, scope_depth: int, handler_depth: int):
+        # What a break has to unwind to get back to the loop's level.
+        self.scope_depth = scope_depth
+        self.handler_depth = handler_depth
+        self.break_jumps: List[int] = []
+
+
+class FunctionState:
+    def __init__(
+        self, enclosing: Optional["FunctionState"], proto: FunctionProto
+    ) -> None:
+        self.enclosing = enclosing
+        self.proto = proto
+        self.scope_depth = 0
+        # Number of blocks with an active error handler.
+        self.handler_depth = 0
+        self.loops: List[Loop] = []
+        self.upvalues: List[Tuple[bool, int]] = []
+        # Slot 0 holds the callee, or the receiver for methods.
+        receiver = "this" if proto.kind in (
+            FunctionType.METHOD,
+            FunctionType.INITIALIZER,
+        ) else ""
+        self.locals: List[Local] = [Local(receiver, 0)]
+
+    def resolve_local(self, name: str) -> Optional[int]:
+        for slot in range(len(self.locals) - 1, -1, -1):
+            if self.locals[slot].name == name:
+                return slot
+        return None
+
+    def add_upvalue(self, is_local: bool, index: int) -> int:
+        upvalue = (is_local, index)
+        if upvalue in self.upvalues:
+            return self.upvalues.index(upvalue)
+        self.upvalues.append(upvalue)
+        self.proto.upvalue_count = len(self.upvalues)
+        return len(self.upvalues) - 1
+
+    def resolve_upvalue(self, name: str) -> Optional[int]:
+        if self.enclosing is None:
+            return None
+
+        local = self.enclosing.resolve_local(name)
+        if local is not None:
+            self.enclosing.locals[local].is_captured = True
+            return self.add_upvalue(True, local)
+
+        upvalue = self.enclosing.resolve_upvalue(name)
+        if upvalue is not None:
+            return self.add_upvalue(False, upvalue)
+
+        return None
+
+
+class Compiler(StmtVisitor[None], ExprVisitor[None]):
+    """Compiles a resolved program into bytecode for the VM in vm.py.
+
+    Locals live in stack slots and are resolved here, the same way the
+    Resolver resolves them for the tree-walker; anything not found in an
+    enclosing scope is a global.
+    """
+
+    def __init__(self):
+        self.state: FunctionState = FunctionState(
+            None, FunctionProto("script", 0, FunctionType.SCRIPT)
+        )
+        self.line = 0
+
+    def compile(self, stmts: List[Stmt]) -> FunctionProto:
+        self.compile_list(stmts)
+        self.emit(NIL)
+        self.emit(RETURN)
+        return self.state.proto
+
+    def compile_list(self, stmts: List[Stmt]):
+        for stmt in stmts:
+            stmt.accept(self)
+
+    def compile_expr(self, expr: Expr):
+        expr.accept(self)
+
+    @property
+    def chunk(self) -> Chunk:
+        return self.state.proto.chunk
+
+    def emit(self, *words: int) -> int:
+        for word in words:
+            offset = self.chunk.write(word, self.line)
+        return offset
+
+    def emit_jump(self, op: int) -> int:
+        return self.emit(op, -1)
+
+    def patch_jump(self, operand: int):
+        self.chunk.code[operand] = len(self.chunk.code)
+
+    def emit_constant(self, value: Any):
+        self.emit(CONSTANT, self.chunk.add_constant(value))
+
+    def name_constant(self, name: str) -> int:
+        return self.chunk.add_constant(name)
+
+    def begin_scope(self):
+        self.state.scope_depth += 1
+
+    def end_scope(self):
+        state = self.state
+        state.scope_depth -= 1
+
+        while state.locals and state.locals[-1].depth > state.scope_depth:
+            if state.locals[-1].is_captured:
+                self.emit(CLOSE_UPVALUE)
+            else:
+                self.emit(POP)
+            state.locals.pop()
+
+    def add_local(self, name: str):
+        self.state.locals.append(Local(name, self.state.scope_depth))
+
+    def declare_variable(self, name: Token):
+        """Declares `name` in the current scope; returns the global constant
+        index to define it with, or None for a local already on the stack."""
+        if self.state.scope_depth == 0:
+            return self.name_constant(name.lexeme)
+        self.add_local(name.lexeme)
+        return None
+
+    def define_variable(self, global_index: Optional[int]):
+        if global_index is not None:
+            self.emit(DEFINE_GLOBAL, global_index)
+
+    def named_variable(self, name: Token, assign: bool = False):
+        self.line = name.line
+        lexeme = name.lexeme
+
+        slot = self.state.resolve_local(lexeme)
+        if slot is not None:
+            self.emit(SET_LOCAL if assign else GET_LOCAL, slot)
+            return
+
+        upvalue = self.state.resolve_upvalue(lexeme)
+        if upvalue is not None:
+            self.emit(SET_UPVALUE if assign else GET_UPVALUE, upvalue)
+            return
+
+        self.emit(SET_GLOBAL if assign else GET_GLOBAL, self.name_constant(lexeme))
+
+    def function(self, func: Function, kind: FunctionType):
+        self.line = func.name.line
+        proto = FunctionProto(func.name.lexeme, len(func.params), kind, func)
+        self.state = FunctionState(self.state, proto)
+        self.begin_scope()
+
+        for param in func.params:
+            self.add_local(param.lexeme)
+
+        # The body is the function's error boundary: a runtime error ends the
+        # call, which returns nil (or `this` from an initializer).
+        self.compile_list(func.body)
+        self.emit_return()
+
+        state = self.state
+        self.state = state.enclosing
+
+        self.line = func.name.line
+        self.emit(CLOSURE, self.chunk.add_constant(proto))
+        for (is_local, index) in state.upvalues:
+            self.emit(1 if is_local else 0, index)
+
+    def emit_return(self):
+        if self.state.proto.kind == FunctionType.INITIALIZER:
+            self.emit(GET_LOCAL, 0)
+        else:
+            self.emit(NIL)
+        self.emit(RETURN)
+
+    def visit_block(self, block: Block):
+        handler = self.emit_jump(PUSH_HANDLER)
+        self.state.handler_depth += 1
+        self.begin_scope()
+        self.compile_list(block.statements)
+        self.end_scope()
+        self.emit(POP_HANDLER)
+        self.state.handler_depth -= 1
+        self.patch_jump(handler)
+
+    def visit_print(self, print_stmt: Print):
+        self.compile_expr(print_stmt.expression)
+        self.emit(PRINT)
+
+    def visit_expression(self, stmt: Expression):
+        self.compile_expr(stmt.expression)
+        self.emit(POP)
+
+    def visit_if(self, if_stmt: If):
+        self.compile_expr(if_stmt.condition)
+        else_jump = self.emit_jump(POP_JUMP_IF_FALSE)
+        if_stmt.then_branch.accept(self)
+
+        if if_stmt.else_branch:
+            end_jump = self.emit_jump(JUMP)
+            self.patch_jump(else_jump)
+            if_stmt.else_branch.accept(self)
+            self.patch_jump(end_jump)
+        else:
+            self.patch_jump(else_jump)
+
+    def visit_while(self, while_stmt: While):
+        loop_start = len(self.chunk.code)
+        self.compile_expr(while_stmt.condition)
+        exit_jump = self.emit_jump(POP_JUMP_IF_FALSE)
+
+        loop = Loop(self.state.scope_depth, self.state.handler_depth)
+        self.state.loops.append(loop)
+        while_stmt.body.accept(self)
+        self.state.loops.pop()
+
+        self.emit(JUMP, loop_start)
+        self.patch_jump(exit_jump)
+        for break_jump in loop.break_jumps:
+            self.patch_jump(break_jump)
+
+    def visit_var(self, var_stmt: Var):
+        self.line = var_stmt.name.line
+        if var_stmt.initializer is not None:
+            self.compile_expr(var_stmt.initializer)
+        else:
+            self.emit(NIL)
+        self.define_variable(self.declare_variable(var_stmt.name))
+
+    def visit_function(self, func_stmt: Function):
+        # Declared before the body is compiled so the function can refer to
+        # itself recursively.
+        global_index = None
+        if self.state.scope_depth == 0:
+            global_index = self.name_constant(func_stmt.name.lexeme)
+        else:
+            self.add_local(func_stmt.name.lexeme)
+        self.function(func_stmt, FunctionType.FUNCTION)
+        self.define_variable(global_index)
+
+    def visit_return(self, return_stmt: Return):
+        self.line = return_stmt.keyword.line
+        if return_stmt.value is None:
+            self.emit_return()
+            return
+        if isinstance(return_stmt.value, Call):
+            # RETURN still follows for callees that can't take over the
+            # frame, such as natives.
+            self.call(return_stmt.value, True)
+        else:
+            self.compile_expr(return_stmt.value)
+        self.emit(RETURN)
+
+    def visit_break(self, break_stmt: Break):
+        self.line = break_stmt.keyword.line
+        state = self.state
+        loop = state.loops[-1]
+
+        # Leave the blocks between the break and the loop: drop their locals
+        # and error handlers, then jump past the loop.
+        for local in reversed(state.locals):
+            if local.depth <= loop.scope_depth:
+                break
+            self.emit(CLOSE_UPVALUE if local.is_captured else POP)
+        for _ in range(state.handler_depth - loop.handler_depth):
+            self.emit(POP_HANDLER)
+        loop.break_jumps.append(self.emit_jump(JUMP))
+
+    def visit_class(self, stmt: Class):
+        name = stmt.name
+        self.line = name.line
+
+        global_index = None
+        if self.state.scope_depth == 0:
+            global_index = self.name_constant(name.lexeme)
+        else:
+            self.emit(NIL)
+            self.add_local(name.lexeme)
+
+        if stmt.superclass:
+            self.compile_expr(stmt.superclass)
+            self.line = stmt.superclass.name.line
+            self.emit(CHECK_SUPERCLASS)
+            # The superclass stays on the stack as the local `super`, which
+            # methods capture as an upvalue.
+            self.begin_scope()
+            self.add_local("super")
+
+        if global_index is not None:
+            self.emit(NIL)
+            self.emit(DEFINE_GLOBAL, global_index)
+
+        if stmt.superclass:
+            self.emit(GET_LOCAL, len(self.state.locals) - 1)
+        else:
+            self.emit(NIL)
+
+        for method in stmt.methods:
+            kind = FunctionType.METHOD
+            if method.name.lexeme == "init":
+                kind = FunctionType.INITIALIZER
+            self.function(method, kind)
+
+        self.line = name.line
+        self.emit(CLASS, self.name_constant(name.lexeme), len(stmt.methods))
+        self.named_variable(name, assign=True)
+        self.emit(POP)
+
+        if stmt.superclass:
+            self.end_scope()
+
+    def visit_variable(self, expr: Variable):
+        self.named_variable(expr.name)
+
+    def visit_assign(self, expr: Assign):
+        self.compile_expr(expr.value)
+        self.named_variable(expr.name, assign=True)
+
+    def visit_call(self, call_expr: Call):
+        self.call(call_expr, False)
+
+    def call(self, call_expr: Call, tail: bool):
+        if type(call_expr.callee) is Get:
+            # obj.name(...): GET_METHOD leaves the receiver and the method on
+            # the stack, so INVOKE can call it without a BoundMethod.
+            get = call_expr.callee
+            self.compile_expr(get.object)
+            self.line = get.name.line
+            self.emit(GET_METHOD, self.name_constant(get.name.lexeme))
+            call = TAIL_INVOKE if tail else INVOKE
+        else:
+            self.compile_expr(call_expr.callee)
+            call = TAIL_CALL if tail else CALL
+
+        for arg in call_expr.arguments:
+            self.compile_expr(arg)
+        self.line = call_expr.token.line
+        self.emit(call, len(call_expr.arguments))
+
+    def visit_literal(self, literal: Literal):
+        if literal.value is None:
+            self.emit(NIL)
+        elif literal.value is True:
+            self.emit(TRUE)
+        elif literal.value is False:
+            self.emit(FALSE)
+        else:
+            self.emit_constant(literal.value)
+
+    def visit_grouping(self, grouping: Grouping):
+        self.compile_expr(grouping.expression)
+
+    def visit_unary(self, unary: Unary):
+        self.compile_expr(unary.right)
+        self.line = unary.operator.line
+        if unary.operator.ttype == TokenType.MINUS:
+            self.emit(NEGATE)
+        else:
+            self.emit(NOT)
+
+    def visit_binary(self, binary: Binary):
+        # A left-leaning chain, like a long sum, is compiled from its
+        # innermost operand out rather than by recursing down it; the VM
+        # runs it without recursing either.
+        chain = []
+        while type(binary) is Binary:
+            chain.append(binary)
+            binary = binary.left
+        self.compile_expr(binary)
+        for binary in reversed(chain):
+            self.compile_expr(binary.right)
+            self.line = binary.operator.line
+            self.emit(BINARY_OPCODES[binary.operator.ttype])
+
+    def visit_logical(self, logical: Logical):
+        chain = []
+        while type(logical) is Logical:
+            chain.append(logical)
+            logical = logical.left
+        self.compile_expr(logical)
+        for logical in reversed(chain):
+            self.line = logical.operator.line
+            if logical.operator.ttype == TokenType.OR:
+                end_jump = self.emit_jump(JUMP_IF_TRUE_OR_POP)
+            else:
+                end_jump = self.emit_jump(JUMP_IF_FALSE_OR_POP)
+            self.compile_expr(logical.right)
+            self.patch_jump(end_jump)
+
+    def visit_get(self, expr: Get):
+        self.compile_expr(expr.object)
+        self.line = expr.name.line
+        self.emit(GET_PROPERTY, self.name_constant(expr.name.lexeme))
+
+    def visit_set(self, expr: Set):
+        self.compile_expr(expr.object)
+        self.compile_expr(expr.value)
+        self.line = expr.name.line
+        self.emit(SET_PROPERTY, self.name_constant(expr.name.lexeme))
+
+    def visit_this(self, expr: This):
+        self.named_variable(expr.keyword)
+
+    def visit_super(self, expr: Super):
+        self.named_variable(Token(TokenType.THIS, "this", None, expr.keyword.line))
+        self.named_variable(expr.keyword)
+        self.line = expr.method.line
+        self.emit(GET_SUPER, self.name_constant(expr.method.lexeme))
+
+    def visit_inlined(self, expr: Inlined):
+        # An error in the body unwinds the stack to where it started and
+        # continues at the NIL, as a call returning nil would.
+        handler = self.emit_jump(PUSH_HANDLER)
+        self.state.handler_depth += 1
+        self.compile_expr(expr.body)
+        self.emit(POP_HANDLER)
+        self.state.handler_depth -= 1
+        end = self.emit_jump(JUMP)
+        self.patch_jump(handler)
+        self.emit(NIL)
+        self.patch_jump(end)
@@ -0,0 +1,101 @@
+"""Runs a script on a `pylox.py --serve` daemon.
+
+    python client.py [--socket PATH] [pylox options] script.lox
+    python client.py [--socket PATH] [pylox options] - < script.lox
+
+Takes the same options as pylox.py and exits with the same status. The
+script runs in a process the daemon forked ahead of time, with the
+interpreter already imported, and its output is streamed back as it is
+printed. `-` sends the source read from stdin instead of a path.
+
+Starting the client costs little more than starting Python: it uses
+_socket rather than socket, which imports enum, and frames rather than
+JSON, which imports re.
+"""
+import _socket
+import os
+import struct
+import sys
+
+DEFAULT_SOCKET = os.environ.get(
+    "PYLOX_SOCKET",
+    os.path.join(os.environ.get("TMPDIR", "/tmp"), f"pylox-{os.getuid()}.sock"),
+)
+
+# Both sides send frames: a kind, the length of the payload and the
+# payload. The client sends its working directory, its arguments and the
+# source if any, then RUN; the daemon answers with output, and the exit
+# status last.
+FRAME = struct.Struct(">cI")
+CWD = b"c"
+ARGUMENT = b"a"
+SOURCE = b"s"
+RUN = b"r"
+STDOUT = b"o"
+STDERR = b"e"
+EXIT = b"x"
+
+
+def send_frame(conn, kind: bytes, payload: bytes) -> None:
+    conn.sendall(FRAME.pack(kind, len(payload)) + payload)
+
+
+def receive_frame(conn):
+    (kind, size) = FRAME.unpack(receive_exactly(conn, FRAME.size))
+    return (kind, receive_exactly(conn, size))
+
+
+def receive_exactly(conn, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("the daemon closed the connection")
+        data += chunk
+    return data
+
+
+def main():
+    argv = sys.argv[1:]
+    path = DEFAULT_SOCKET
+    if argv[:1] == ["--socket"] and len(argv) > 1:
+        path = argv[1]
+        argv = argv[2:]
+
+    conn = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+    except OSError as err:
+        print(f"client.py: no pylox daemon at {path}: {err.strerror}", file=sys.stderr)
+        print("start one with: python pylox.py --serve", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        send_frame(conn, CWD, os.getcwd().encode())
+        for argument in argv:
+            send_frame(conn, ARGUMENT, argument.encode())
+        if "-" in argv:
+            send_frame(conn, SOURCE, sys.stdin.read().encode())
+        send_frame(conn, RUN, b"")
+        while True:
+            (kind, payload) = receive_frame(conn)
+            if kind == EXIT:
+                sys.exit(int(payload))
+            write(sys.stdout if kind == STDOUT else sys.stderr, payload)
+    except ConnectionError as err:
+        print(f"client.py: {err}", file=sys.stderr)
+        sys.exit(1)
+
+
+def write(stream, data: bytes) -> None:
+    try:
+        stream.buffer.write(data)
+        stream.flush()
+    except BrokenPipeError:
+        # Whatever read it went away, as with `| head`; the script still
+        # runs to the end for its exit status.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), stream.fileno())
+
+
+if __name__ == "__main__":
+    main()
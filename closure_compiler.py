@@ -0,0 +1,747 @@
+from typing import Callable
+from environment import Environment
+from errors import InterpretationError, NativeError, runtime_error
+from interpret import (
+    BREAK,
+    INLINE_CACHE_SIZE,
+    LoxClass,
+    LoxFunction,
+    LoxInstance,
+    COUNTED_ORDERS,
+    check_both_number_operands,
+    counted_range,
+    counted_step,
+    gen_globals,
+    is_truthy,
+    stringify,
+)
+from AstPrinter import *
+from tokens import *
+
+# Every node is compiled once into a Python closure. Expression closures take
+# the current environment and return the value. Statement closures take the
+# current environment and return the statement's completion, the same values
+# the tree-walker uses: None, a 1-tuple holding a returned value, or BREAK.
+ExprFn = Callable[[Environment], Any]
+StmtFn = Callable[[Environment], Any]
+
+NUMBER = (int, float)
+
+
+def sequence(stmts: List[StmtFn]) -> StmtFn:
+    stmts = tuple(stmts)
+
+    if len(stmts) == 1:
+        return stmts[0]
+
+    def run(env):
+        for stmt in stmts:
+            result = stmt(env)
+            if result is not None:
+                return result
+
+    return run
+
+
+def guarded(body: StmtFn) -> StmtFn:
+    # Same contract as Interpreter.visit_statements: a runtime error is
+    # reported and ends the statement list it was raised in.
+    def run(env):
+        try:
+            return body(env)
+        except InterpretationError as err:
+            runtime_error(err)
+
+    return run
+
+
+class CompiledFunction(LoxFunction):
+    __slots__ = ("body", "param_count", "slot_count")
+
+    def __init__(
+        self,
+        declaration: Function,
+        closure: Environment,
+        is_initializer: bool,
+        body: StmtFn,
+    ):
+        super().__init__(declaration, closure, is_initializer)
+        self.body = body
+        self.param_count = len(declaration.params)
+        self.slot_count = declaration.slot_count
+
+    def call(self, interpreter: AbstractInterpreter[Any], arguments: List[Any]) -> Any:
+        local = Environment(self.closure, self.slot_count)
+        local.values[: len(arguments)] = arguments
+        result = self.body(local)
+
+        if result is not None:
+            return result[0]
+
+        return None
+
+    def call_method(
+        self, interpreter: AbstractInterpreter[Any], this: Any, arguments: List[Any]
+    ) -> Any:
+        local = Environment(self.closure, self.slot_count)
+        values = local.values
+        values[0] = this
+        values[1 : len(arguments) + 1] = arguments
+        result = self.body(local)
+
+        if self.is_initializer:
+            return this
+
+        if result is not None:
+            return result[0]
+
+        return None
+
+
+class ClosureCompiler(StmtVisitor[StmtFn], ExprVisitor[ExprFn]):
+    def __init__(self, interpreter: "ClosureInterpreter"):
+        self.interpreter = interpreter
+        self.globals = interpreter.globals
+        # Every inline cache the compiled code fills, for a host that runs
+        # it more than once to empty between runs.
+        self.caches: List[Dict[LoxClass, LoxFunction]] = []
+
+    def compile(self, stmts: List[Stmt]) -> StmtFn:
+        return guarded(self.compile_list(stmts))
+
+    def compile_list(self, stmts: List[Stmt]) -> StmtFn:
+        return sequence([stmt.accept(self) for stmt in stmts])
+
+    def compile_expr(self, expr: Expr) -> ExprFn:
+        return expr.accept(self)
+
+    def local_get(self, distance: int, slot: int) -> ExprFn:
+        if distance == 0:
+            return lambda env: env.values[slot]
+        if distance == 1:
+            return lambda env: env.enclosing.values[slot]
+        if distance == 2:
+            return lambda env: env.enclosing.enclosing.values[slot]
+        return lambda env: env.ancestor(distance).values[slot]
+
+    def global_get(self, token: Token) -> ExprFn:
+        values = self.globals.values
+        name = token.lexeme
+
+        def run(env):
+            try:
+                return values[name]
+            except KeyError:
+                raise InterpretationError(
+                    token, f"Undefined variable: '{name}'"
+                ) from None
+
+        return run
+
+    def lookup_variable(self, name: Token, expr: Expr) -> ExprFn:
+        if expr.depth is not None:
+            return self.local_get(expr.depth, expr.slot)
+        else:
+            return self.global_get(name)
+
+    def define(self, slot: Optional[int], name: str, value: ExprFn) -> StmtFn:
+        if slot is None:
+            values = self.globals.values
+
+            def run_global(env):
+                values[name] = value(env)
+
+            return run_global
+
+        def run(env):
+            env.values[slot] = value(env)
+
+        return run
+
+    def visit_block(self, block: Block) -> StmtFn:
+        if block.counted_loop is not None:
+            body = guarded(self.compile_counted_loop(block.counted_loop))
+        else:
+            body = guarded(self.compile_list(block.statements))
+        size = block.slot_count
+        if not size:
+            return body
+        return lambda env: body(Environment(env, size))
+
+    def compile_counted_loop(self, loop: CountedLoop) -> StmtFn:
+        # Same loop as Interpreter.count.
+        init = loop.variable.accept(self)
+        slot = loop.variable.slot
+        condition = loop.loop.condition
+        comparison = condition.operator
+        holds = COUNTED_ORDERS[comparison.ttype]
+        constant_limit = type(condition.right) is Literal
+        limit = self.compile_expr(condition.right)
+        step = counted_step(loop.increment.value)
+        body = self.compile_list(loop.loop.body.statements[:-1])
+
+        def run(env):
+            init(env)
+            values = env.values
+            i = values[slot]
+
+            if constant_limit:
+                steps = counted_range(comparison.ttype, i, limit(env), step)
+                if steps is not None:
+                    for i in steps:
+                        values[slot] = i
+                        try:
+                            result = body(env)
+                        except InterpretationError as err:
+                            runtime_error(err)
+                            break
+                        if result is not None:
+                            return None if result is BREAK else result
+                    else:
+                        values[slot] = steps.start + len(steps) * steps.step
+                        return None
+
+            while True:
+                bound = limit(env)
+                if not (isinstance(i, NUMBER) and isinstance(bound, NUMBER)):
+                    check_both_number_operands(comparison, i, bound)
+                if not holds(i, bound):
+                    return None
+                try:
+                    result = body(env)
+                    if result is not None:
+                        return None if result is BREAK else result
+                    i = values[slot] = i + step
+                except InterpretationError as err:
+                    runtime_error(err)
+
+        return run
+
+    def visit_hit(self, hit: Hit) -> StmtFn:
+        statement = hit.statement.accept(self)
+        line = hit.line
+        enter = hit.heatmap.enter
+        exit = hit.heatmap.exit
+
+        def run(env):
+            enter(line)
+            try:
+                return statement(env)
+            finally:
+                exit()
+
+        return run
+
+    def visit_print(self, print_stmt: Print) -> StmtFn:
+        expr = self.compile_expr(print_stmt.expression)
+
+        def run(env):
+            print(stringify(expr(env)))
+
+        return run
+
+    def visit_expression(self, stmt: Expression) -> StmtFn:
+        expr = self.compile_expr(stmt.expression)
+
+        def run(env):
+            expr(env)
+
+        return run
+
+    def visit_if(self, if_stmt: If) -> StmtFn:
+        condition = self.compile_expr(if_stmt.condition)
+        then_branch = if_stmt.then_branch.accept(self)
+
+        if not if_stmt.else_branch:
+
+            def run(env):
+                value = condition(env)
+                if value is not None and value is not False:
+                    return then_branch(env)
+
+            return run
+
+        else_branch = if_stmt.else_branch.accept(self)
+
+        def run_else(env):
+            value = condition(env)
+            if value is not None and value is not False:
+                return then_branch(env)
+            return else_branch(env)
+
+        return run_else
+
+    def visit_while(self, while_stmt: While) -> StmtFn:
+        condition = self.compile_expr(while_stmt.condition)
+        body = while_stmt.body.accept(self)
+
+        def run(env):
+            while True:
+                value = condition(env)
+                if value is None or value is False:
+                    break
+                result = body(env)
+                if result is not None:
+                    if result is BREAK:
+                        break
+                    return result
+
+        return run
+
+    def visit_var(self, var_stmt: Var) -> StmtFn:
+        initializer = lambda env: None
+        if var_stmt.initializer is not None:
+            initializer = self.compile_expr(var_stmt.initializer)
+
+        return self.define(var_stmt.slot, var_stmt.name.lexeme, initializer)
+
+    def visit_function(self, func_stmt: Function) -> StmtFn:
+        body = guarded(self.compile_list(func_stmt.body))
+        return self.define(
+            func_stmt.slot,
+            func_stmt.name.lexeme,
+            lambda env: CompiledFunction(func_stmt, env, False, body),
+        )
+
+    def visit_return(self, return_stmt: Return) -> StmtFn:
+        if return_stmt.value is None:
+            return lambda env: (None,)
+
+        value = self.compile_expr(return_stmt.value)
+        return lambda env: (value(env),)
+
+    def visit_break(self, break_stmt: Break) -> StmtFn:
+        return lambda env: BREAK
+
+    def visit_class(self, stmt: Class) -> StmtFn:
+        name = stmt.name.lexeme
+        methods = [
+            (
+                method,
+                method.name.lexeme,
+                method.name.lexeme == "init",
+                guarded(self.compile_list(method.body)),
+            )
+            for method in stmt.methods
+        ]
+
+        superclass_expr = None
+        if stmt.superclass:
+            superclass_expr = self.compile_expr(stmt.superclass)
+        superclass_token = stmt.superclass.name if stmt.superclass else None
+        # Globals are keyed by name, locals by slot.
+        target = self.globals.values if stmt.slot is None else None
+        key = name if stmt.slot is None else stmt.slot
+
+        def run(env):
+            superclass = None
+            if superclass_expr:
+                superclass = superclass_expr(env)
+                if not isinstance(superclass, LoxClass):
+                    raise InterpretationError(
+                        superclass_token, "Superclass must be a class."
+                    )
+
+            values = env.values if target is None else target
+            values[key] = None
+
+            method_env = env
+            if superclass_expr:
+                method_env = Environment(env, 1)
+                method_env.values[0] = superclass
+
+            klass = LoxClass(
+                name,
+                superclass,
+                {
+                    method_name: CompiledFunction(decl, method_env, is_init, body)
+                    for (decl, method_name, is_init, body) in methods
+                },
+            )
+            values[key] = klass
+
+        return run
+
+    def visit_variable(self, expr: Variable) -> ExprFn:
+        return self.lookup_variable(expr.name, expr)
+
+    def visit_assign(self, expr: Assign) -> ExprFn:
+        value = self.compile_expr(expr.value)
+        name = expr.name.lexeme
+        distance = expr.depth
+        slot = expr.slot
+
+        if distance is None:
+            values = self.globals.values
+
+            def run_global(env):
+                values[name] = result = value(env)
+                return result
+
+            return run_global
+
+        if distance == 0:
+
+            def run_local(env):
+                env.values[slot] = result = value(env)
+                return result
+
+            return run_local
+
+        def run(env):
+            result = value(env)
+            env.ancestor(distance).values[slot] = result
+            return result
+
+        return run
+
+    def visit_call(self, call_expr: Call) -> ExprFn:
+        if type(call_expr.callee) is Get:
+            return self.invoke(call_expr, call_expr.callee)
+
+        callee = self.compile_expr(call_expr.callee)
+        arguments = tuple(self.compile_expr(arg) for arg in call_expr.arguments)
+        token = call_expr.token
+        interpreter = self.interpreter
+
+        def run(env):
+            function = callee(env)
+            args = [arg(env) for arg in arguments]
+
+            if (
+                type(function) is CompiledFunction
+                and len(args) == function.param_count
+            ):
+                return function.call(interpreter, args)
+
+            if not isinstance(function, LoxCallable):
+                raise InterpretationError(token, f"{function} is not callable")
+
+            if len(args) != function.arity:
+                raise InterpretationError(
+                    token,
+                    f"Expected {function.arity} arguments, but got {len(args)}.",
+                )
+
+            try:
+                return function.call(interpreter, args)
+            except NativeError as err:
+                raise InterpretationError(token, err.message) from None
+
+        return run
+
+    def invoke(self, call_expr: Call, get: Get) -> ExprFn:
+        """Compiles `obj.name(...)` to call the method without binding it."""
+        obj = self.compile_expr(get.object)
+        arguments = tuple(self.compile_expr(arg) for arg in call_expr.arguments)
+        name = get.name
+        key = name.lexeme
+        token = call_expr.token
+        interpreter = self.interpreter
+        cache: Dict[LoxClass, CompiledFunction] = {}
+        self.caches.append(cache)
+
+        def run(env):
+            instance = obj(env)
+
+            if not isinstance(instance, LoxInstance):
+                raise InterpretationError(name, "Only instances have properties")
+
+            slot = instance.shape.slots.get(key)
+            if slot is not None:
+                function = instance.values[slot]
+                args = [arg(env) for arg in arguments]
+
+                if not isinstance(function, LoxCallable):
+                    raise InterpretationError(token, f"{function} is not callable")
+
+                if len(args) != function.arity:
+                    raise InterpretationError(
+                        token,
+                        f"Expected {function.arity} arguments, but got {len(args)}.",
+                    )
+
+                try:
+                    return function.call(interpreter, args)
+                except NativeError as err:
+                    raise InterpretationError(token, err.message) from None
+
+            klass = instance.klass
+            if klass in cache:
+                method = cache[klass]
+            else:
+                method = klass.find_method(key)
+                if method is None:
+                    raise InterpretationError(name, f"Undefined property '{key}'.")
+                if len(cache) < INLINE_CACHE_SIZE:
+                    cache[klass] = method
+
+            args = [arg(env) for arg in arguments]
+
+            if len(args) != method.param_count:
+                raise InterpretationError(
+                    token,
+                    f"Expected {method.param_count} arguments, but got {len(args)}.",
+                )
+
+            return method.call_method(interpreter, instance, args)
+
+        return run
+
+    def visit_literal(self, literal: Literal) -> ExprFn:
+        value = literal.value
+        return lambda env: value
+
+    def visit_grouping(self, grouping: Grouping) -> ExprFn:
+        return self.compile_expr(grouping.expression)
+
+    def visit_unary(self, unary: Unary) -> ExprFn:
+        right = self.compile_expr(unary.right)
+
+        if unary.operator.ttype == TokenType.MINUS:
+            return lambda env: -right(env)
+        elif unary.operator.ttype == TokenType.BANG:
+            return lambda env: not is_truthy(right(env))
+
+        operator = unary.operator
+
+        def run(env):
+            right(env)
+            raise InterpretationError(operator, "Invalid unary operator")
+
+        return run
+
+    def visit_binary(self, binary: Binary) -> ExprFn:
+        left = self.compile_expr(binary.left)
+        right = self.compile_expr(binary.right)
+        operator = binary.operator
+        ttype = operator.ttype
+
+        def operands_error():
+            return InterpretationError(operator, "Operands must be numbers")
+
+        if ttype == TokenType.MINUS:
+
+            def run(env):
+                a = left(env)
+                b = right(env)
+                if isinstance(a, NUMBER) and isinstance(b, NUMBER):
+                    return a - b
+                raise operands_error()
+
+        elif ttype == TokenType.SLASH:
+
+            def run(env):
+                a = left(env)
+                b = right(env)
+                if isinstance(a, NUMBER) and isinstance(b, NUMBER):
+                    if b == 0:
+                        raise InterpretationError(operator, "Division by zero")
+                    return a / b
+                raise operands_error()
+
+        elif ttype == TokenType.STAR:
+
+            def run(env):
+                a = left(env)
+                b = right(env)
+                if isinstance(a, NUMBER) and isinstance(b, NUMBER):
+                    return a * b
+                raise operands_error()
+
+        elif ttype == TokenType.PLUS:
+
+            def run(env):
+                a = left(env)
+                b = right(env)
+                if isinstance(a, NUMBER) and isinstance(b, NUMBER):
+                    return a + b
+                if isinstance(a, str) and isinstance(b, str):
+                    return a + b
+                raise operands_error()
+
+        elif ttype == TokenType.GREATER:
+
+            def run(env):
+                a = left(env)
+                b = right(env)
+                if isinstance(a, NUMBER) and isinstance(b, NUMBER):
+                    return a > b
+                raise operands_error()
+
+        elif ttype == TokenType.GREATER_EQUAL:
+
+            def run(env):
+                a = left(env)
+                b = right(env)
+                if isinstance(a, NUMBER) and isinstance(b, NUMBER):
+                    return a >= b
+                raise operands_error()
+
+        elif ttype == TokenType.LESS:
+
+            def run(env):
+                a = left(env)
+                b = right(env)
+                if isinstance(a, NUMBER) and isinstance(b, NUMBER):
+                    return a < b
+                raise operands_error()
+
+        elif ttype == TokenType.LESS_EQUAL:
+
+            def run(env):
+                a = left(env)
+                b = right(env)
+                if isinstance(a, NUMBER) and isinstance(b, NUMBER):
+                    return a <= b
+                raise operands_error()
+
+        elif ttype == TokenType.BANG_EQUAL:
+
+            def run(env):
+                return left(env) != right(env)
+
+        elif ttype == TokenType.EQUAL_EQUAL:
+
+            def run(env):
+                return left(env) == right(env)
+
+        else:
+
+            def run(env):
+                left(env)
+                right(env)
+                raise InterpretationError(operator, "Unsupported binary operator")
+
+        return run
+
+    def visit_logical(self, logical: Logical) -> ExprFn:
+        left = self.compile_expr(logical.left)
+        right = self.compile_expr(logical.right)
+
+        if logical.operator.ttype == TokenType.OR:
+
+            def run_or(env):
+                value = left(env)
+                if is_truthy(value):
+                    return value
+                return right(env)
+
+            return run_or
+        elif logical.operator.ttype == TokenType.AND:
+
+            def run_and(env):
+                value = left(env)
+                if is_truthy(value):
+                    return right(env)
+                return value
+
+            return run_and
+
+        operator = logical.operator
+
+        def run(env):
+            raise InterpretationError(operator, "Invalid logical operator")
+
+        return run
+
+    def visit_get(self, expr: Get) -> ExprFn:
+        obj = self.compile_expr(expr.object)
+        name = expr.name
+        key = name.lexeme
+        # Receiver class -> method for this access site.
+        cache: Dict[LoxClass, LoxFunction] = {}
+        self.caches.append(cache)
+
+        def run(env):
+            instance = obj(env)
+
+            if not isinstance(instance, LoxInstance):
+                raise InterpretationError(name, "Only instances have properties")
+
+            slot = instance.shape.slots.get(key)
+            if slot is not None:
+                return instance.values[slot]
+
+            klass = instance.klass
+            if klass in cache:
+                return cache[klass].bind(instance)
+
+            method = klass.find_method(key)
+            if method is None:
+                raise InterpretationError(name, f"Undefined property '{key}'.")
+
+            if len(cache) < INLINE_CACHE_SIZE:
+                cache[klass] = method
+            return method.bind(instance)
+
+        return run
+
+    def visit_set(self, expr: Set) -> ExprFn:
+        obj = self.compile_expr(expr.object)
+        value = self.compile_expr(expr.value)
+        name = expr.name
+        key = name.lexeme
+
+        def run(env):
+            instance = obj(env)
+            result = value(env)
+
+            if not isinstance(instance, LoxInstance):
+                raise InterpretationError(name, "Only instances have fields")
+
+            instance.set_field(key, result)
+            return result
+
+        return run
+
+    def visit_this(self, expr: This) -> ExprFn:
+        return self.lookup_variable(expr.keyword, expr)
+
+    def visit_super(self, expr: Super) -> ExprFn:
+        distance = expr.depth
+        method_token = expr.method
+
+        def run(env):
+            superclass = env.get_at(distance, 0)
+            instance = env.get_at(distance - 1, 0)
+
+            method = superclass.find_method(method_token.lexeme)
+
+            if not method:
+                raise InterpretationError(
+                    method_token, f"Undefined property '{method_token.lexeme}'."
+                )
+
+            return method.bind(instance)
+
+        return run
+
+    def visit_inlined(self, expr: Inlined) -> ExprFn:
+        body = self.compile_expr(expr.body)
+
+        def run(env):
+            try:
+                return body(env)
+            except InterpretationError as err:
+                runtime_error(err)
+
+        return run
+
+
+class ClosureInterpreter(AbstractInterpreter[Any]):
+    """Runs a resolved program by compiling it to closures first.
+
+    Drop-in replacement for Interpreter: it reads the same slots the
+    Resolver assigns, and the compiled program shares LoxClass, LoxInstance
+    and the runtime error reporting with the tree-walker.
+    """
+
+    def __init__(self):
+        self.globals = gen_globals()
+
+    def visit_statements(self, stmts: List[Stmt], env: Optional[Environment] = None):
+        if env is None:
+            env = self.globals
+
+        ClosureCompiler(self).compile(stmts)(env)
@@ -0,0 +1,334 @@
+"""`pylox.py --serve`: a daemon that runs scripts sent by client.py.
+
+The daemon imports the interpreter once and forks worker processes
+ahead of time, so a script pays neither Python's start-up nor the
+imports. Each worker runs one script and exits, so no state carries
+over from one script to the next.
+
+An asyncio loop accepts connections on a Unix socket and passes each
+one to a ready worker, along with its file descriptor (SCM_RIGHTS). The
+worker reads the request, runs pylox.py's own main() with framed
+stdout and stderr, and sends the exit status last. When it is done, it
+tells the daemon which script it ran. The daemon loads that program, on
+a thread so the loop keeps serving, before forking the replacement,
+which then shares it copy-on-write through program_cache.preloaded.
+Objects the daemon holds are moved out of the collector's reach with
+gc.freeze() before forking, so collections in a worker don't dirty the
+pages they live on.
+
+Only the daemon's user can connect: whoever can runs scripts, and
+writes files, as that user.
+"""
+import argparse
+import asyncio
+import gc
+import io
+import os
+import signal
+import socket
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Set, Tuple
+
+import program_cache
+from client import (
+    ARGUMENT,
+    CWD,
+    EXIT,
+    RUN,
+    SOURCE,
+    STDERR,
+    STDOUT,
+    receive_frame,
+    send_frame,
+)
+from errors import ErrorReport, Globals
+from program_cache import load_program, source_digest
+from pylox import build_parser, main, parse_program, run
+from scanner import read_chunks
+
+# Programs the daemon keeps loaded; the least recently run are dropped.
+PRELOAD_LIMIT = 256
+
+
+class FrameWriter(io.RawIOBase):
+    """Sends what is written to it to the client as frames of `kind`."""
+
+    def __init__(self, conn: socket.socket, kind: bytes):
+        self.conn = conn
+        self.kind = kind
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        send_frame(self.conn, self.kind, bytes(data))
+        return len(data)
+
+
+def run_request(request: dict, args: argparse.Namespace) -> None:
+    """Runs what the client asked for in this process, ending with
+    SystemExit where pylox.py would."""
+    if args.serve or args.script == "rprompt":
+        print("client.py: runs scripts only", file=sys.stderr)
+        sys.exit(64)
+
+    source = request["source"]
+    if source is None:
+        sys.argv = ["pylox.py", *request["argv"]]
+        main()
+        return
+
+    if args.profile or args.heatmap or args.batch is not None:
+        print(
+            "client.py: --profile, --heatmap and --batch need a script path",
+            file=sys.stderr,
+        )
+        sys.exit(64)
+
+    run(
+        source,
+        args.engine,
+        args.disassemble,
+        args.stats,
+        args.max_depth,
+        args.optimize,
+        args.inline_size,
+    )
+    if Globals.had_error:
+        sys.exit(65)
+    if Globals.had_runtime_error:
+        sys.exit(70)
+
+
+def read_request(conn: socket.socket) -> dict:
+    request = {"cwd": None, "argv": [], "source": None}
+    while True:
+        (kind, payload) = receive_frame(conn)
+        if kind == RUN:
+            return request
+        if kind == CWD:
+            request["cwd"] = payload.decode()
+        elif kind == ARGUMENT:
+            request["argv"].append(payload.decode())
+        elif kind == SOURCE:
+            request["source"] = payload.decode()
+
+
+def handle(conn: socket.socket) -> Optional[str]:
+    """Serves the client on `conn`: reads its request, streams the output
+    and sends the exit status. Returns the path of the script it ran."""
+    request = read_request(conn)
+    sys.stdout = io.TextIOWrapper(FrameWriter(conn, STDOUT), line_buffering=True)
+    sys.stderr = io.TextIOWrapper(FrameWriter(conn, STDERR), line_buffering=True)
+    sys.stdin = io.StringIO()
+
+    path = None
+    status = 0
+    try:
+        os.chdir(request["cwd"])
+        args = build_parser().parse_args(request["argv"])
+        script = args.script
+        if request["source"] is None and script and script.endswith((".lox", ".pylox")):
+            path = os.path.abspath(script)
+        run_request(request, args)
+    except SystemExit as exit:
+        status = exit.code if isinstance(exit.code, int) else 1
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    send_frame(conn, EXIT, str(status).encode())
+    return path
+
+
+def work(control: socket.socket) -> None:
+    """What a worker does once forked: waits for a connection, serves it
+    and reports the script it ran. Never returns."""
+    try:
+        (_, fds, _, _) = socket.recv_fds(control, 1, 1)
+        if fds:
+            with socket.socket(fileno=fds[0]) as conn:
+                # Accepted by the daemon's event loop, so non-blocking.
+                conn.setblocking(True)
+                path = handle(conn)
+            control.send((path or "").encode())
+    except BaseException:
+        # The client went away; there is nobody left to tell.
+        pass
+    finally:
+        os._exit(0)
+
+
+class Worker:
+    __slots__ = ("pid", "control")
+
+    def __init__(self, pid: int, control: socket.socket):
+        self.pid = pid
+        self.control = control
+
+
+class Daemon:
+    def __init__(self, path: str, workers: int):
+        self.path = path
+        self.size = workers
+        self.workers: Set[Worker] = set()
+        self.ready: "asyncio.Queue[Worker]" = asyncio.Queue()
+        self.tasks: Set[asyncio.Task] = set()
+        self.listener: Optional[socket.socket] = None
+        # Loads programs off the event loop, one at a time: parse_quietly
+        # swaps the process-wide error state.
+        self.loader = ThreadPoolExecutor(max_workers=1)
+
+    async def serve(self) -> None:
+        loop = asyncio.get_running_loop()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self.listener.listen(128)
+        self.listener.setblocking(False)
+
+        stop = loop.create_future()
+        stopping = lambda: stop.done() or stop.set_result(None)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stopping)
+        loop.add_signal_handler(signal.SIGCHLD, reap)
+
+        gc.collect()
+        gc.freeze()
+        for _ in range(self.size):
+            self.spawn()
+        print(
+            f"pylox: serving on {self.path} with {self.size} workers",
+            file=sys.stderr,
+        )
+
+        accepting = asyncio.create_task(self.accept())
+        try:
+            await stop
+        finally:
+            accepting.cancel()
+            self.loader.shutdown(cancel_futures=True)
+            self.listener.close()
+            os.unlink(self.path)
+            for worker in self.workers:
+                # A worker still waiting for a connection exits on EOF.
+                worker.control.close()
+
+    def spawn(self) -> None:
+        (ours, theirs) = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        pid = os.fork()
+        if pid == 0:
+            for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGCHLD):
+                signal.signal(signum, signal.SIG_DFL)
+            signal.set_wakeup_fd(-1)
+            # The loader thread may have been parsing when we forked.
+            Globals.had_error = False
+            Globals.reports = None
+            self.listener.close()
+            ours.close()
+            for worker in self.workers:
+                worker.control.close()
+            work(theirs)
+
+        theirs.close()
+        ours.setblocking(False)
+        worker = Worker(pid, ours)
+        self.workers.add(worker)
+        self.ready.put_nowait(worker)
+
+    async def accept(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            (conn, _) = await loop.sock_accept(self.listener)
+            with conn:
+                while True:
+                    worker = await self.ready.get()
+                    try:
+                        socket.send_fds(worker.control, [b"r"], [conn.fileno()])
+                        break
+                    except OSError:
+                        # It died waiting; finish() replaces it.
+                        pass
+            task = asyncio.create_task(self.finish(worker))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def finish(self, worker: Worker) -> None:
+        """Waits for `worker` to be done and forks its replacement."""
+        loop = asyncio.get_running_loop()
+        try:
+            path = (await loop.sock_recv(worker.control, 4096)).decode()
+        except OSError:
+            path = ""
+        worker.control.close()
+        self.workers.discard(worker)
+        if path:
+            entry = program_cache.preloaded.get(path)
+            loaded = await loop.run_in_executor(self.loader, load, path, entry)
+            preload(path, loaded)
+        self.spawn()
+
+
+def load(path: str, entry: Optional[Tuple[bytes, object]]):
+    """The (digest, program) to preload for `path`: `entry` if the script
+    has not changed since, else the program loaded from the cache or
+    parsed, or None if it is gone or has errors. Runs on the loader
+    thread, so it may take as long as the script needs."""
+    try:
+        digest = source_digest(path)
+    except OSError:
+        return None
+    if entry is not None and entry[0] == digest:
+        return entry
+    program = load_program(path, digest)
+    if program is None:
+        program = parse_quietly(path)
+    if program is None:
+        return None
+    return (digest, program)
+
+
+def preload(path: str, entry: Optional[Tuple[bytes, object]]) -> None:
+    """Puts what `load` returned for `path` into program_cache.preloaded,
+    as the most recently run, and freezes it for the workers forked next."""
+    previous = program_cache.preloaded.pop(path, None)
+    if entry is None:
+        return
+    if entry is not previous:
+        gc.freeze()
+    program_cache.preloaded[path] = entry
+    if len(program_cache.preloaded) > PRELOAD_LIMIT:
+        del program_cache.preloaded[next(iter(program_cache.preloaded))]
+
+
+def parse_quietly(path: str):
+    """The program at `path`, or None if it has errors, which the worker
+    that ran it has already reported."""
+    (had_error, reports) = (Globals.had_error, Globals.reports)
+    errors: List[ErrorReport] = []
+    try:
+        Globals.had_error = False
+        Globals.reports = errors
+        return parse_program(read_chunks(path))
+    finally:
+        (Globals.had_error, Globals.reports) = (had_error, reports)
+
+
+def reap() -> None:
+    while True:
+        try:
+            (pid, _) = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+
+
+def serve(path: str, workers: int) -> None:
+    asyncio.run(Daemon(path, workers).serve())
@@ -0,0 +1,86 @@
+from bytecode import *
+from bytecode import Chunk, FunctionProto
+
+JUMPS = {
+    JUMP,
+    POP_JUMP_IF_FALSE,
+    JUMP_IF_FALSE_OR_POP,
+    JUMP_IF_TRUE_OR_POP,
+    PUSH_HANDLER,
+}
+
+NAME_OPERANDS = {
+    GET_GLOBAL,
+    DEFINE_GLOBAL,
+    SET_GLOBAL,
+    GET_PROPERTY,
+    SET_PROPERTY,
+    GET_SUPER,
+    GET_METHOD,
+}
+
+
+def format_constant(value: Any) -> str:
+    if isinstance(value, str):
+        return f'"{value}"'
+    return str(value)
+
+
+class Disassembler:
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def disassemble_program(self, proto: FunctionProto) -> str:
+        self.disassemble(proto)
+        return "\n".join(self.lines)
+
+    def disassemble(self, proto: FunctionProto):
+        """Disassembles `proto`, then every function defined inside it."""
+        chunk = proto.chunk
+        self.lines.append(f"== {proto} ==")
+
+        nested = []
+        offset = 0
+        while offset < len(chunk.code):
+            offset = self.instruction(chunk, offset, nested)
+
+        for inner in nested:
+            self.lines.append("")
+            self.disassemble(inner)
+
+    def instruction(self, chunk: Chunk, offset: int, nested: List[FunctionProto]) -> int:
+        op = chunk.code[offset]
+        line = chunk.lines[offset]
+        same_line = offset > 0 and chunk.lines[offset - 1] == line
+        prefix = f"{offset:04d} {'   |' if same_line else f'{line:4d}'} "
+        name = OPCODE_NAMES[op]
+        operands = list(chunk.code[offset + 1 : offset + 1 + OPERAND_COUNTS[op]])
+
+        if op == CONSTANT:
+            text = f"{name:<20} {operands[0]:4d} {format_constant(chunk.constants[operands[0]])}"
+        elif op in NAME_OPERANDS:
+            text = f"{name:<20} {operands[0]:4d} '{chunk.constants[operands[0]]}'"
+        elif op in JUMPS:
+            text = f"{name:<20} -> {operands[0]:04d}"
+        elif op == CLASS:
+            text = f"{name:<20} {operands[0]:4d} '{chunk.constants[operands[0]]}' ({operands[1]} methods)"
+        elif op == CLOSURE:
+            proto = chunk.constants[operands[0]]
+            nested.append(proto)
+            text = f"{name:<20} {operands[0]:4d} {proto}"
+            self.lines.append(prefix + text)
+            offset += 2
+            for _ in range(proto.upvalue_count):
+                is_local = chunk.code[offset]
+                index = chunk.code[offset + 1]
+                kind = "local" if is_local else "upvalue"
+                self.lines.append(f"{offset:04d}    |   {'':<20} {kind} {index}")
+                offset += 2
+            return offset
+        elif operands:
+            text = f"{name:<20} {operands[0]:4d}"
+        else:
+            text = name
+
+        self.lines.append(prefix + text)
+        return offset + 1 + len(operands)
@@ -0,0 +1,224 @@
+"""Running Lox from Python, without pylox.py's printing and exit codes.
+
+    engine = LoxEngine()
+    program = engine.compile("print greeting + name;")
+    result = engine.execute(program, globals={"greeting": "hi ", "name": "lox"})
+    result.output  # "hi lox\\n"
+
+A Program is scanned, parsed and resolved once and can be executed any
+number of times. An engine keeps its globals from one execution to the
+next until `reset`, which only refills the global table.
+"""
+import inspect
+import io
+from contextlib import redirect_stdout
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, TextIO
+
+from AstPrinter import *
+from bytecode import Compiler
+from closure_compiler import ClosureCompiler, ClosureInterpreter
+from errors import ErrorReport, Globals, NativeError, runtime_error, stack_overflow
+from interpret import NativeFunction, gen_globals
+from optimizer import INLINE_SIZE, Optimizer, walk
+from pylox import ENGINES, parse_program
+from vm import VM
+
+# Names every engine's global table starts with.
+NATIVES = frozenset(gen_globals().values)
+
+
+class CompileError(Exception):
+    """Source that does not scan, parse or resolve."""
+
+    def __init__(self, errors: List[ErrorReport]):
+        super().__init__("\n".join(str(error) for error in errors))
+        self.errors = errors
+
+
+class Program:
+    """A resolved program, ready to be executed by the engine that
+    compiled it, or another of the same kind."""
+
+    def __init__(self, engine: str, statements: List[Stmt]):
+        self.engine = engine
+        self.statements = statements
+        # The inline caches filled while it runs, which hold on to the
+        # classes of the last execution: those of its Get nodes, and of
+        # the closures it was compiled to.
+        self.gets = [node for node in walk(statements) if type(node) is Get]
+        self.caches: List[Dict[Any, Any]] = []
+        self.executed = False
+        # What the closure and vm engines compiled the statements to, and
+        # for which interpreter.
+        self.runnable: Optional[Callable[[], Any]] = None
+        self.interpreter: Any = None
+
+    def forget_classes(self) -> None:
+        for get in self.gets:
+            get.cache = None
+        for cache in self.caches:
+            cache.clear()
+
+
+@dataclass
+class Result:
+    """What an execution printed, unless it was given a stream to print
+    to, and the runtime errors it reported. A runtime error at the top
+    level stops the program, as in pylox.py."""
+
+    output: str
+    errors: List[ErrorReport] = field(default_factory=list)
+    # The globals the program and the host defined, natives left out.
+    globals: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def lox_value(name: str, value: Any) -> Any:
+    """`value` as a Lox value: Python functions become natives, taking as
+    many arguments as they require. To give the arity yourself, e.g. for a
+    builtin without a signature, pass NativeFunction(name, arity, f)."""
+    if isinstance(value, NativeFunction):
+        return NativeFunction(name, value.arity, host_function(name, value._f))
+    if callable(value) and not isinstance(value, LoxCallable):
+        return NativeFunction(name, required_arity(name, value), host_function(name, value))
+    return value
+
+
+def required_arity(name: str, f: Callable[..., Any]) -> int:
+    try:
+        parameters = inspect.signature(f).parameters.values()
+    except (TypeError, ValueError):
+        raise TypeError(
+            f"can't tell how many arguments {name!r} takes; "
+            f"pass NativeFunction({name!r}, arity, f) instead"
+        ) from None
+    return sum(
+        1
+        for parameter in parameters
+        if parameter.kind in (parameter.POSITIONAL_ONLY, parameter.POSITIONAL_OR_KEYWORD)
+        and parameter.default is parameter.empty
+    )
+
+
+def host_function(name: str, f: Callable[..., Any]) -> Callable[..., Any]:
+    """`f`, raising what it raises as a Lox runtime error at the call."""
+
+    def call(*arguments):
+        try:
+            return f(*arguments)
+        except NativeError:
+            raise
+        except Exception as err:
+            raise NativeError(f"{name}: {type(err).__name__}: {err}") from err
+
+    return call
+
+
+class LoxEngine:
+    def __init__(
+        self, engine: str = "tree", optimize: bool = False, inline_size: int = INLINE_SIZE
+    ):
+        self.engine = engine
+        self.optimize = optimize
+        self.inline_size = inline_size
+        self.interpreter = ENGINES[engine]()
+
+    def compile(self, source: str) -> Program:
+        """Scans, parses and resolves `source`; raises CompileError with
+        every error found."""
+        (had_error, reports) = (Globals.had_error, Globals.reports)
+        errors: List[ErrorReport] = []
+        try:
+            Globals.had_error = False
+            Globals.reports = errors
+            statements = parse_program(source)
+        finally:
+            (Globals.had_error, Globals.reports) = (had_error, reports)
+
+        if statements is None or errors:
+            raise CompileError(errors)
+        if self.optimize:
+            statements = Optimizer(self.inline_size).optimize(statements)
+        return Program(self.engine, statements)
+
+    def execute(
+        self,
+        program: Program,
+        globals: Optional[Dict[str, Any]] = None,
+        stdout: Optional[TextIO] = None,
+    ) -> Result:
+        """Runs `program` after defining `globals`. What it prints goes to
+        `stdout` when given, else into the result.
+
+        Not thread-safe: redirect_stdout swaps sys.stdout for the whole
+        process while the program runs, and the error state is global too.
+        Run one execution at a time per process."""
+        if program.engine != self.engine:
+            raise ValueError(
+                f"program compiled for the {program.engine} engine, "
+                f"not {self.engine}"
+            )
+
+        values = self.interpreter.globals.values
+        if globals:
+            for (name, value) in globals.items():
+                values[name] = lox_value(name, value)
+
+        if program.executed:
+            program.forget_classes()
+        program.executed = True
+
+        out = io.StringIO() if stdout is None else stdout
+        errors: List[ErrorReport] = []
+        (had_runtime_error, reports) = (Globals.had_runtime_error, Globals.reports)
+        try:
+            Globals.had_runtime_error = False
+            Globals.reports = errors
+            with redirect_stdout(out):
+                try:
+                    self.runnable(program)()
+                except RecursionError as err:
+                    runtime_error(stack_overflow(err))
+        finally:
+            (Globals.had_runtime_error, Globals.reports) = (had_runtime_error, reports)
+            if isinstance(self.interpreter, VM):
+                # Whatever escaped left the frames it was running in.
+                self.interpreter.reset_stack()
+
+        return Result(
+            out.getvalue() if stdout is None else "",
+            errors,
+            {name: value for (name, value) in values.items() if name not in NATIVES},
+        )
+
+    def runnable(self, program: Program) -> Callable[[], Any]:
+        interpreter = self.interpreter
+        if program.interpreter is interpreter:
+            return program.runnable
+
+        if isinstance(interpreter, VM):
+            proto = Compiler().compile(program.statements)
+            runnable = lambda: interpreter.interpret(proto)
+        elif isinstance(interpreter, ClosureInterpreter):
+            compiler = ClosureCompiler(interpreter)
+            body = compiler.compile(program.statements)
+            runnable = lambda: body(interpreter.globals)
+            program.caches = compiler.caches
+        else:
+            return lambda: interpreter.visit_statements(program.statements)
+
+        # Compiled code reads the globals through the dict of the engine it
+        # was compiled for, which reset keeps.
+        program.runnable = runnable
+        program.interpreter = interpreter
+        return runnable
+
+    def reset(self) -> None:
+        """Forgets every global the programs and the host defined."""
+        values = self.interpreter.globals.values
+        values.clear()
+        values.update(gen_globals().values)
@@ -1,21 +1,19 @@
-from typing import Dict, cast
+from typing import Any, Dict, List, Union, cast
 from errors import InterpretationError
 from AstPrinter import *
 from tokens import *
 
 
-class Environment:
-    def __init__(self, enclosing: Optional["Environment"] = None):
+class GlobalEnvironment:
+    """The top-level scope. Globals are late bound, so they stay keyed by name."""
+
+    def __init__(self):
         self.values: Dict[str, Any] = {}
-        self.enclosing = enclosing
 
     def __getitem__(self, name: Token):
         if name.lexeme in self.values:
             return self.values[name.lexeme]
 
-        if self.enclosing is not None:
-            return self.enclosing[name]
-
         raise InterpretationError(name, f"Undefined variable: '{name.lexeme}'")
 
     def __setitem__(self, name: str, value: Any):
@@ -26,12 +24,23 @@ class Environment:
             self.values[name.lexeme] = value
             return
 
-        if self.enclosing is not None:
-            self.enclosing.assign(name, value)
-            return
-
         raise InterpretationError(name, f"Undefined variable '{name.lexeme}'")
 
+
+class Environment:
+    """A local scope. The Resolver gives every local a slot in its scope, so
+    values is a fixed-size list indexed by slot instead of a dict."""
+
+    __slots__ = ("values", "enclosing")
+
+    def __init__(
+        self,
+        enclosing: Union["Environment", GlobalEnvironment, None] = None,
+        size: int = 0,
+    ):
+        self.values: List[Any] = [None] * size
+        self.enclosing = enclosing
+
     def ancestor(self, distance: int) -> "Environment":
         env = self
 
@@ -41,8 +50,8 @@ class Environment:
 
         return env
 
-    def get_at(self, distance: int, name: str) -> Any:
-        return self.ancestor(distance).values[name]
+    def get_at(self, distance: int, slot: int) -> Any:
+        return self.ancestor(distance).values[slot]
 
-    def assign_at(self, distance: int, name: str, value: Any):
-        self.ancestor(distance).values[name] = value
+    def assign_at(self, distance: int, slot: int, value: Any):
+        self.ancestor(distance).values[slot] = value
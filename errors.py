@@ -1,3 +1,6 @@
+from dataclasses import dataclass
+from typing import List, Optional
+
 from tokens import Token, TokenType
 
 
@@ -5,19 +8,76 @@ def error(line, message):
     report(line, "", message)
 
 
+@dataclass
+class ErrorReport:
+    """An error as reported, for hosts that collect errors instead of
+    printing them. `where` is e.g. " at 'x'" for a syntax error and empty
+    for a runtime error."""
+
+    line: int
+    message: str
+    where: str = ""
+    runtime: bool = False
+
+    def __str__(self):
+        if self.runtime:
+            return f"[line {self.line}] Runtime error: {self.message}"
+        return f"[line {self.line}] Error{self.where}: {self.message}"
+
+
 class Globals:
     had_error = False
     had_runtime_error = False
+    # Runtime errors reported so far, e.g. to tell whether a call failed.
+    runtime_errors = 0
+    # When set, errors are appended here instead of printed.
+    reports: Optional[List[ErrorReport]] = None
 
 
 def report(line, where, message):
-    print(f"[line {line}] Error{where}: {message}")
+    if Globals.reports is None:
+        print(f"[line {line}] Error{where}: {message}")
+    else:
+        Globals.reports.append(ErrorReport(line, message, where))
     Globals.had_error = True
 
 
 def runtime_error(error):
-    print(f"[line {error.token.line}] Runtime error: {error.message}")
+    if Globals.reports is None:
+        print(f"[line {error.token.line}] Runtime error: {error.message}")
+    else:
+        Globals.reports.append(
+            ErrorReport(error.token.line, error.message, runtime=True)
+        )
     Globals.had_runtime_error = True
+    Globals.runtime_errors += 1
+
+
+def depth_line(error: RecursionError) -> int:
+    """The line the program nested, or recursed, too deeply on, as near as
+    the frames `error` unwound tell: that of the innermost token they held,
+    or of a node holding one."""
+    frames = []
+    tb = error.__traceback__
+    while tb is not None:
+        frames.append(tb.tb_frame)
+        tb = tb.tb_next
+    for frame in reversed(frames):
+        for value in frame.f_locals.values():
+            if isinstance(value, Token):
+                return value.line
+            for field in getattr(type(value), "__slots__", ()):
+                token = getattr(value, field, None)
+                if isinstance(token, Token):
+                    return token.line
+    return 0
+
+
+def stack_overflow(error: RecursionError) -> "InterpretationError":
+    """The runtime error to report for a program that ran out of Python
+    stack, e.g. on a chain of operators too long to evaluate."""
+    token = Token(TokenType.EOF, "", None, depth_line(error))
+    return InterpretationError(token, "Stack overflow.")
 
 
 def add_error(token: Token, msg):
@@ -31,3 +91,11 @@ class InterpretationError(Exception):
     def __init__(self, token, message):
         self.token = token
         self.message = message
+
+
+class NativeError(Exception):
+    """Raised by a native function, which has no token of its own. The
+    engine reports it as a runtime error on the line of the call."""
+
+    def __init__(self, message):
+        self.message = message
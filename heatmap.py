@@ -0,0 +1,136 @@
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, TextIO
+
+from AstPrinter import *
+from optimizer import walk
+from tokens import Token
+
+
+def statement_line(stmt: Stmt) -> Optional[int]:
+    """The line of the first token in `stmt`, None when it has none, like
+    `print 1;`: literals do not keep theirs."""
+    for node in walk(stmt):
+        for field in node.__slots__:
+            value = getattr(node, field)
+            if isinstance(value, Token):
+                return value.line
+    return None
+
+
+class HeatMap:
+    """Per-line statement counts for `pylox.py --heatmap`.
+
+    `instrument` wraps every statement of a resolved program in a Hit,
+    which the engines run by calling `enter` and `exit` around the
+    statement, so a program that was not instrumented pays nothing.
+    Time is measured with time.perf_counter_ns, and a line is only
+    charged the time its statements did not spend in other statements,
+    such as the ones in a loop body or a called function.
+
+    A counted `for` loop runs from its CountedLoop rather than from its
+    statements, so its header is hit once for the whole loop. Statements
+    without a token of their own are not counted.
+
+    Leaving it writes the annotated source of `script` to `output`, or
+    stderr when that is None, or a JSON report when `output` ends in
+    .json.
+    """
+
+    def __init__(self, script: Path, output: Optional[Path] = None):
+        self.script = script
+        self.output = output
+        # Line -> runs and nanoseconds, for every line with a statement.
+        self.hits: Dict[int, int] = {}
+        self.time: Dict[int, int] = {}
+        # [line, start, time spent in nested statements]
+        self.stack: List[List[int]] = []
+
+    def __enter__(self) -> "HeatMap":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        # run_file ends with exit() when the script failed; report anyway.
+        if self.output is None:
+            self.annotate(sys.stderr)
+        elif self.output.suffix == ".json":
+            with open(self.output, "w", encoding="utf8") as out:
+                json.dump(self.report(), out, indent=2)
+                out.write("\n")
+        else:
+            with open(self.output, "w", encoding="utf8") as out:
+                self.annotate(out)
+
+    def instrument(self, stmts: List[Stmt]) -> None:
+        for (i, stmt) in enumerate(stmts):
+            stmts[i] = self.wrap(stmt)
+
+    def wrap(self, stmt: Stmt) -> Stmt:
+        line = statement_line(stmt)
+        kind = type(stmt)
+        if kind is Block:
+            if stmt.counted_loop is None:
+                self.instrument(stmt.statements)
+                return stmt
+            self.instrument(stmt.counted_loop.loop.body.statements)
+        elif kind is If:
+            stmt.then_branch = self.wrap(stmt.then_branch)
+            if stmt.else_branch is not None:
+                stmt.else_branch = self.wrap(stmt.else_branch)
+        elif kind is While:
+            stmt.body = self.wrap(stmt.body)
+        elif kind is Function:
+            self.instrument(stmt.body)
+        elif kind is Class:
+            for method in stmt.methods:
+                self.instrument(method.body)
+
+        if line is None:
+            return stmt
+        self.hits.setdefault(line, 0)
+        self.time.setdefault(line, 0)
+        return Hit(stmt, line, self)
+
+    def enter(self, line: int) -> None:
+        self.hits[line] += 1
+        self.stack.append([line, time.perf_counter_ns(), 0])
+
+    def exit(self) -> None:
+        (line, start, nested) = self.stack.pop()
+        elapsed = time.perf_counter_ns() - start
+        self.time[line] += elapsed - nested
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    def source(self) -> List[str]:
+        return self.script.read_text(encoding="utf8").splitlines()
+
+    def report(self) -> Dict[str, Any]:
+        source = self.source()
+        return {
+            "script": str(self.script),
+            "lines": [
+                {
+                    "line": line,
+                    "hits": self.hits[line],
+                    "self_ms": self.time[line] / 1e6,
+                    "source": source[line - 1] if line <= len(source) else "",
+                }
+                for line in sorted(self.hits)
+            ],
+        }
+
+    def annotate(self, out: TextIO) -> None:
+        """Writes the script with the runs and self time of each line in
+        front of it; lines without statements get neither."""
+        print(f"{'hits':>10} {'self ms':>12}  {'line':>5}  source", file=out)
+        for (number, text) in enumerate(self.source(), 1):
+            if number in self.hits:
+                hits = f"{self.hits[number]:>10}"
+                ms = f"{self.time[number] / 1e6:>12.3f}"
+            else:
+                hits = f"{'':>10}"
+                ms = f"{'':>12}"
+            print(f"{hits} {ms}  {number:>5}  {text}", file=out)
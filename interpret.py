@@ -1,13 +1,18 @@
 from typing import cast; import time
-from environment import Environment
-from errors import InterpretationError,runtime_error
+import math
+from operator import ge, gt, le, lt
+from environment import Environment, GlobalEnvironment
+from errors import InterpretationError, NativeError, runtime_error
+from memoize import Memoize
 from AstPrinter import *
 from tokens import *
 
 
-class ReturnException(Exception):
-    def __init__(self, value):
-        self.value = value
+# Executing a statement returns its completion: None when it completes
+# normally, a 1-tuple holding the value of an executed `return`, or BREAK.
+# Loops and function calls consume the signals, so neither unwinds with an
+# exception.
+BREAK = object()
 
 def is_truthy(value):
     if (value is None) or (value is False):
@@ -52,7 +57,148 @@ def check_both_number_operands(token, left, right):
     raise InterpretationError(token, "Operands must be numbers")
 
 
+def negate(operator, right):
+    return -right
+
+
+def logical_not(operator, right):
+    return not is_truthy(right)
+
+
+UNARY_OPERATIONS = {
+    TokenType.MINUS: negate,
+    TokenType.BANG: logical_not,
+}
+
+
+def evaluate_unary(operator: Token, right):
+    if operator.ttype in UNARY_OPERATIONS:
+        return UNARY_OPERATIONS[operator.ttype](operator, right)
+    raise InterpretationError(operator, "Invalid unary operator")
+
+
+def subtract(operator, left, right):
+    check_both_number_operands(operator, left, right)
+    return left - right
+
+
+def divide(operator, left, right):
+    check_both_number_operands(operator, left, right)
+    if right == 0:
+        raise InterpretationError(operator, "Division by zero")
+    return left / right
+
+
+def multiply(operator, left, right):
+    check_both_number_operands(operator, left, right)
+    return left * right
+
+
+def add(operator, left, right):
+    if isinstance(left, str) and isinstance(right, str):
+        return left + right
+    check_both_number_operands(operator, left, right)
+    return left + right
+
+
+def greater(operator, left, right):
+    check_both_number_operands(operator, left, right)
+    return left > right
+
+
+def greater_equal(operator, left, right):
+    check_both_number_operands(operator, left, right)
+    return left >= right
+
+
+def less(operator, left, right):
+    check_both_number_operands(operator, left, right)
+    return left < right
+
+
+def less_equal(operator, left, right):
+    check_both_number_operands(operator, left, right)
+    return left <= right
+
+
+def not_equal(operator, left, right):
+    return not is_equal(left, right)
+
+
+def equal(operator, left, right):
+    return is_equal(left, right)
+
+
+# The generic operation for each binary operator, shared by the tree-walker
+# and the deoptimized nodes of the quickening interpreter.
+BINARY_OPERATIONS = {
+    TokenType.MINUS: subtract,
+    TokenType.SLASH: divide,
+    TokenType.STAR: multiply,
+    TokenType.PLUS: add,
+    TokenType.GREATER: greater,
+    TokenType.GREATER_EQUAL: greater_equal,
+    TokenType.LESS: less,
+    TokenType.LESS_EQUAL: less_equal,
+    TokenType.BANG_EQUAL: not_equal,
+    TokenType.EQUAL_EQUAL: equal,
+}
+
+
+def evaluate_binary(operator: Token, left, right):
+    if operator.ttype in BINARY_OPERATIONS:
+        return BINARY_OPERATIONS[operator.ttype](operator, left, right)
+    raise InterpretationError(operator, "Unsupported binary operator")
+
+
+def counted_range(comparison: TokenType, start, limit, step) -> Optional[range]:
+    """The values a counted loop's variable takes, as a range, when they
+    are integers and `limit` is a number that cannot change."""
+    if type(start) is not int or type(step) is not int:
+        return None
+    if type(limit) is float:
+        if not math.isfinite(limit):
+            return None
+    elif type(limit) is not int:
+        return None
+
+    if step > 0 and comparison is TokenType.LESS:
+        stop = math.ceil(limit)
+    elif step > 0 and comparison is TokenType.LESS_EQUAL:
+        stop = math.floor(limit) + 1
+    elif step < 0 and comparison is TokenType.GREATER:
+        stop = math.floor(limit)
+    elif step < 0 and comparison is TokenType.GREATER_EQUAL:
+        stop = math.ceil(limit) - 1
+    else:
+        return None
+    return range(start, stop, step)
+
+
+# How a counted loop's condition compares two numbers.
+COUNTED_ORDERS = {
+    TokenType.LESS: lt,
+    TokenType.LESS_EQUAL: le,
+    TokenType.GREATER: gt,
+    TokenType.GREATER_EQUAL: ge,
+}
+
+NUMBER = (int, float)
+
+
+def counted_step(increment: Binary):
+    step = increment.right.value
+    return -step if increment.operator.ttype is TokenType.MINUS else step
+
+
+# Number of receiver classes a property access site remembers. Sites that
+# see more classes than this keep using the method tables directly.
+INLINE_CACHE_SIZE = 4
+
+
 class LoxFunction(LoxCallable):
+    __slots__ = ("declaration", "closure", "is_initializer")
+
     def __init__(
         self, declaration: Function, closure: Environment, is_initializer: bool
     ):
@@ -65,67 +211,160 @@ class LoxFunction(LoxCallable):
         return len(self.declaration.params)
 
     def call(self, interpreter: AbstractInterpreter[Any], arguments: List[Any]) -> Any:
-        local = Environment(self.closure)
-        for (param, arg) in zip(self.declaration.params, arguments):
-            local[param.lexeme] = arg
-        try:
-            interpreter.visit_statements(self.declaration.body, local)
-        except ReturnException as ret:
-            if self.is_initializer:
-                return self.closure.get_at(0, "this")
-
-            return ret.value
+        local = Environment(self.closure, self.declaration.slot_count)
+        local.values[: len(arguments)] = arguments
+        return self.run(interpreter, local)
+
+    def call_method(
+        self, interpreter: AbstractInterpreter[Any], this: Any, arguments: List[Any]
+    ) -> Any:
+        # A method keeps `this` in slot 0 of its own scope, before the params.
+        local = Environment(self.closure, self.declaration.slot_count)
+        values = local.values
+        values[0] = this
+        values[1 : len(arguments) + 1] = arguments
+        return self.run(interpreter, local)
+
+    def run(self, interpreter: AbstractInterpreter[Any], local: Environment) -> Any:
+        completion = interpreter.visit_statements(self.declaration.body, local)
 
         if self.is_initializer:
-            return self.closure.get_at(0, "this")
+            return local.values[0]
+
+        if completion is not None:
+            return completion[0]
 
         return None
 
     def bind(self, instance: "LoxInstance"):
-        env = Environment(self.closure)
-        env["this"] = instance
-        return LoxFunction(self.declaration, env, self.is_initializer)
+        return BoundMethod(instance, self)
+
+    def __str__(self):
+        return f"<fn {self.declaration.name.lexeme}>"
+
+
+class BoundMethod(LoxCallable):
+    """A method read as a value, e.g. `var m = obj.m;`. Calls written as
+    `obj.m()` invoke the method directly and never create one."""
+
+    __slots__ = ("receiver", "method")
+
+    def __init__(self, receiver: "LoxInstance", method: Any):
+        self.receiver = receiver
+        self.method = method
+
+    @property
+    def arity(self) -> int:
+        return self.method.arity
+
+    def call(self, interpreter: AbstractInterpreter[Any], arguments: List[Any]) -> Any:
+        return self.method.call_method(interpreter, self.receiver, arguments)
+
+    def __str__(self):
+        return str(self.method)
 
 
 class LoxClass(LoxCallable):
+    __slots__ = (
+        "name",
+        "superclass",
+        "methods",
+        "method_table",
+        "initializer",
+        "empty_shape",
+    )
+
     def __init__(self, name: str, superclass: Optional["LoxClass"], methods):
         self.name = name
         self.superclass = superclass
         self.methods = methods
+        # The root of the shapes its instances take, freed with the class.
+        self.empty_shape = Shape({})
+        # Classes never change once created, so inherited methods are
+        # copied in up front and a lookup is a single dict access.
+        if superclass:
+            self.method_table = {**superclass.method_table, **methods}
+        else:
+            self.method_table = dict(methods)
+        self.initializer = self.method_table.get("init")
 
     def find_method(self, name: str) -> Optional[LoxFunction]:
-        if name in self.methods:
-            return self.methods[name]
-
-        if self.superclass:
-            return self.superclass.find_method(name)
+        return self.method_table.get(name)
 
     def __str__(self):
         return f"<class {self.name}>"
 
     def call(self, interpreter: AbstractInterpreter[Any], arguments: List[Any]) -> Any:
         instance = LoxInstance(self)
-        initializer = self.find_method("init")
-        if initializer:
-            initializer.bind(instance).call(interpreter, arguments)
+        if self.initializer:
+            self.initializer.call_method(interpreter, instance, arguments)
         return instance
 
     @property
     def arity(self) -> int:
-        initializer = self.find_method("init")
-        if initializer:
-            return initializer.arity
+        if self.initializer:
+            return self.initializer.arity
         return 0
 
 
+# Fields an instance can have on shared shapes. Each shape copies the
+# slots of the one before it, so past this an instance moves to a shape of
+# its own that it adds fields to in place, like a plain dict.
+MAX_SHARED_FIELDS = 32
+
+
+class Shape:
+    """Maps field names to indexes into LoxInstance.values.
+
+    Instances of a class that get the same fields in the same order share
+    one shape, so a field name costs a dict entry per shape rather than per
+    instance. Adding a field moves the instance to the next shape, and the
+    transition is recorded so the following instances reuse it. A shape
+    without transitions belongs to a single instance.
+    """
+
+    __slots__ = ("slots", "transitions")
+
+    def __init__(self, slots: Dict[str, int], shared: bool = True):
+        self.slots = slots
+        self.transitions: Optional[Dict[str, "Shape"]] = {} if shared else None
+
+    def with_field(self, name: str) -> "Shape":
+        transitions = self.transitions
+        if transitions is None:
+            self.slots[name] = len(self.slots)
+            return self
+
+        shape = transitions.get(name)
+        if shape is None:
+            slots = {**self.slots, name: len(self.slots)}
+            if len(slots) > MAX_SHARED_FIELDS:
+                return Shape(slots, shared=False)
+            shape = Shape(slots)
+            transitions[name] = shape
+        return shape
+
+
 class LoxInstance:
+    __slots__ = ("klass", "shape", "values")
+
     def __init__(self, klass: LoxClass):
         self.klass = klass
-        self.fields = {}
+        self.shape = klass.empty_shape
+        self.values: List[Any] = []
+
+    def set_field(self, name: str, value: Any):
+        slot = self.shape.slots.get(name)
+        if slot is None:
+            self.shape = self.shape.with_field(name)
+            self.values.append(value)
+        else:
+            self.values[slot] = value
 
     def __getitem__(self, key: Token):
-        if key.lexeme in self.fields:
-            return self.fields[key.lexeme]
+        slot = self.shape.slots.get(key.lexeme)
+        if slot is not None:
+            return self.values[slot]
 
         method = self.klass.find_method(key.lexeme)
 
@@ -135,13 +374,16 @@ class LoxInstance:
         raise InterpretationError(key, f"Undefined property '{key.lexeme}'.")
 
     def __setitem__(self, key: Token, value: Any):
-        self.fields[key.lexeme] = value
+        self.set_field(key.lexeme, value)
 
     def __str__(self):
         return f"<instance of {self.klass.name}>"
 
 class NativeFunction(LoxCallable):
-    def __init__(self, arity, f):
+    __slots__ = ("name", "_arity", "_f")
+
+    def __init__(self, name, arity, f):
+        self.name = name
         self._arity = arity
         self._f = f
 
@@ -152,10 +394,14 @@ class NativeFunction(LoxCallable):
     def call(self, _: AbstractInterpreter[Any], arguments: List[Any]) -> Any:
         return self._f(*arguments)
 
+    def __str__(self):
+        return "<native fn>"
+
 
 def gen_globals():
-    env = Environment()
-    env["clock"] = NativeFunction(0, lambda: time.time())
+    env = GlobalEnvironment()
+    env["clock"] = NativeFunction("clock", 0, lambda: time.time())
+    env["memoize"] = Memoize()
     return env
 
 
@@ -163,8 +409,6 @@ class Interpreter(StmtVisitor[None], ExprVisitor[Any], AbstractInterpreter[Any])
     def __init__(self):
         self.globals = gen_globals()
         self.environment = self.globals
-        self.local_vars = {}
-        self.breaks = False
 
     def visit_statements(self, stmts: List[Stmt], env: Optional[Environment] = None):
         if env is None:
@@ -175,67 +419,161 @@ class Interpreter(StmtVisitor[None], ExprVisitor[Any], AbstractInterpreter[Any])
         try:
             self.environment = env
             for stmt in stmts:
-                self.visit_stmt(stmt)
+                completion = stmt.accept(self)
+                if completion is not None:
+                    return completion
         except InterpretationError as err:
             runtime_error(err)
         finally:
             self.environment = previous
 
     def visit_stmt(self, stmt: Stmt):
-        stmt.accept(self)
+        return stmt.accept(self)
 
     def visit_expr(self, expr: Expr):
         return expr.accept(self)
 
     def visit_block(self, block: Block):
-        self.visit_statements(block.statements, Environment(self.environment))
+        if block.slot_count:
+            env = Environment(self.environment, block.slot_count)
+        else:
+            env = self.environment
+        if block.counted_loop is not None:
+            return self.visit_counted_loop(block.counted_loop, env)
+        return self.visit_statements(block.statements, env)
+
+    def visit_counted_loop(self, loop: CountedLoop, env: Environment):
+        previous = self.environment
+
+        try:
+            self.environment = env
+            return self.count(loop)
+        except InterpretationError as err:
+            runtime_error(err)
+        finally:
+            self.environment = previous
+
+    def count(self, loop: CountedLoop):
+        """Runs a counted loop the way the statements it desugars to would,
+        but with the variable kept in a Python local. It is still written
+        to its slot every iteration, for the body and any closures."""
+        self.visit_var(loop.variable)
+        values = self.environment.values
+        slot = loop.variable.slot
+        condition = loop.loop.condition
+        comparison = condition.operator
+        holds = COUNTED_ORDERS[comparison.ttype]
+        limit = condition.right
+        step = counted_step(loop.increment.value)
+        body = loop.loop.body.statements[:-1]
+        i = values[slot]
+
+        if type(limit) is Literal:
+            steps = counted_range(comparison.ttype, i, limit.value, step)
+            if steps is not None:
+                for i in steps:
+                    values[slot] = i
+                    try:
+                        for stmt in body:
+                            completion = stmt.accept(self)
+                            if completion is not None:
+                                return None if completion is BREAK else completion
+                    except InterpretationError as err:
+                        # The increment is skipped; the general loop below
+                        # picks up from the same value.
+                        runtime_error(err)
+                        break
+                else:
+                    values[slot] = steps.start + len(steps) * steps.step
+                    return None
+
+        while True:
+            bound = limit.accept(self)
+            if not (isinstance(i, NUMBER) and isinstance(bound, NUMBER)):
+                check_both_number_operands(comparison, i, bound)
+            if not holds(i, bound):
+                return None
+            try:
+                for stmt in body:
+                    completion = stmt.accept(self)
+                    if completion is not None:
+                        return None if completion is BREAK else completion
+                # Only a number gets past the condition, and adding the
+                # numeric step keeps it one.
+                i = values[slot] = i + step
+            except InterpretationError as err:
+                runtime_error(err)
+
+    def visit_hit(self, hit: Hit):
+        heatmap = hit.heatmap
+        heatmap.enter(hit.line)
+        try:
+            return hit.statement.accept(self)
+        finally:
+            heatmap.exit()
 
     def visit_print(self, print_stmt: Print):
         value = self.visit_expr(print_stmt.expression)
         print(stringify(value))
 
     def visit_expression(self, expr: Expression):
-        return self.visit_expr(expr.expression)
+        self.visit_expr(expr.expression)
 
     def visit_if(self, if_stmt: If):
         if is_truthy(self.visit_expr(if_stmt.condition)):
-            self.visit_stmt(if_stmt.then_branch)
+            return self.visit_stmt(if_stmt.then_branch)
         elif if_stmt.else_branch:
-            self.visit_stmt(if_stmt.else_branch)
+            return self.visit_stmt(if_stmt.else_branch)
 
     def visit_while(self, while_stmt: While):
         while is_truthy(self.visit_expr(while_stmt.condition)):
-            if self.breaks:
-                break
-            self.visit_stmt(while_stmt.body)
+            completion = self.visit_stmt(while_stmt.body)
+            if completion is not None:
+                if completion is BREAK:
+                    break
+                return completion
 
     def visit_var(self, var_stmt: Var):
         value = None
         if var_stmt.initializer is not None:
             value = self.visit_expr(var_stmt.initializer)
-        self.environment[var_stmt.name.lexeme] = value
+        self.define(var_stmt.name, var_stmt.slot, value)
 
     def visit_function(self, func_stmt: Function):
-        self.environment[func_stmt.name.lexeme] = LoxFunction(
-            func_stmt, self.environment, False
+        self.define(
+            func_stmt.name,
+            func_stmt.slot,
+            LoxFunction(func_stmt, self.environment, False),
         )
 
+    def define(self, name: Token, slot: Optional[int], value: Any):
+        if slot is None:
+            self.globals[name.lexeme] = value
+        else:
+            self.environment.values[slot] = value
+
     def visit_variable(self, expr: Variable) -> Any:
         return self.lookup_variable(expr.name, expr)
 
     def lookup_variable(self, name: Token, expr: Expr) -> Any:
-        distance = self.local_vars.get(id(expr), None)
-        if distance is not None:
-            return self.environment.get_at(distance, name.lexeme)
+        depth = expr.depth
+        if depth == 0:
+            return self.environment.values[expr.slot]
+        elif depth == 1:
+            return self.environment.enclosing.values[expr.slot]
+        elif depth is not None:
+            return self.environment.get_at(depth, expr.slot)
         else:
             return self.globals[name]
 
     def visit_assign(self, expr: Assign):
         value = self.visit_expr(expr.value)
-        distance = self.local_vars.get(id(expr), None)
 
-        if distance is not None:
-            self.environment.assign_at(distance, expr.name.lexeme, value)
+        depth = expr.depth
+        if depth == 0:
+            self.environment.values[expr.slot] = value
+        elif depth is not None:
+            self.environment.assign_at(depth, expr.slot, value)
         else:
             self.globals[expr.name.lexeme] = value
         return value
@@ -244,18 +582,44 @@ class Interpreter(StmtVisitor[None], ExprVisitor[Any], AbstractInterpreter[Any])
         value = None
         if return_stmt.value is not None:
             value = self.visit_expr(return_stmt.value)
-        raise ReturnException(value)
-    
+        return (value,)
+
     def visit_break(self, break_stmt: Break):
-        if break_stmt.loop_depth == 0:
-            raise Exception("Break cannot outside loop!")
-        else:
-            self.breaks = True
+        return BREAK
 
     def visit_call(self, call_expr: Call):
+        if type(call_expr.callee) is Get:
+            return self.invoke(call_expr, call_expr.callee)
+
         callee = self.visit_expr(call_expr.callee)
         arguments = [self.visit_expr(arg) for arg in call_expr.arguments]
+        return self.call_value(call_expr, callee, arguments)
+
+    def invoke(self, call_expr: Call, get: Get):
+        """Calls `obj.name(...)` without creating a bound method."""
+        instance = self.visit_expr(get.object)
+
+        if not isinstance(instance, LoxInstance):
+            raise InterpretationError(get.name, "Only instances have properties")
+
+        slot = instance.shape.slots.get(get.name.lexeme)
+        if slot is not None:
+            callee = instance.values[slot]
+            arguments = [self.visit_expr(arg) for arg in call_expr.arguments]
+            return self.call_value(call_expr, callee, arguments)
+
+        method = self.lookup_method(get, instance.klass)
+        arguments = [self.visit_expr(arg) for arg in call_expr.arguments]
+
+        if len(arguments) != method.arity:
+            raise InterpretationError(
+                call_expr.token,
+                f"Expected {method.arity} arguments, but got {len(arguments)}.",
+            )
 
+        return method.call_method(self, instance, arguments)
+
+    def call_value(self, call_expr: Call, callee: Any, arguments: List[Any]):
         if not isinstance(callee, LoxCallable):
             raise InterpretationError(call_expr.token, f"{callee} is not callable")
 
@@ -265,7 +629,10 @@ class Interpreter(StmtVisitor[None], ExprVisitor[Any], AbstractInterpreter[Any])
                 f"Expected {callee.arity} arguments, but got {len(arguments)}.",
             )
 
-        return callee.call(self, arguments)
+        try:
+            return callee.call(self, arguments)
+        except NativeError as err:
+            raise InterpretationError(call_expr.token, err.message) from None
 
     def visit_literal(self, literal: Literal):
         return literal.value
@@ -275,51 +642,12 @@ class Interpreter(StmtVisitor[None], ExprVisitor[Any], AbstractInterpreter[Any])
 
     def visit_unary(self, unary: Unary):
         right = self.visit_expr(unary.right)
-        if unary.operator.ttype == TokenType.MINUS:
-            return -right
-        elif unary.operator.ttype == TokenType.BANG:
-            return not is_truthy(right)
-        else:
-            raise InterpretationError(unary.operator, "Invalid unary operator")
+        return evaluate_unary(unary.operator, right)
 
     def visit_binary(self, binary: Binary):
         left = self.visit_expr(binary.left)
         right = self.visit_expr(binary.right)
-
-        if binary.operator.ttype == TokenType.MINUS:
-            check_both_number_operands(binary.operator, left, right)
-            return left - right
-        elif binary.operator.ttype == TokenType.SLASH:
-            check_both_number_operands(binary.operator, left, right)
-            if right == 0:
-                raise InterpretationError(binary.operator, "Division by zero")
-            return left / right
-        elif binary.operator.ttype == TokenType.STAR:
-            check_both_number_operands(binary.operator, left, right)
-            return left * right
-        elif binary.operator.ttype == TokenType.PLUS:
-            if isinstance(left, str) and isinstance(right, str):
-                return left + right
-            check_both_number_operands(binary.operator, left, right)
-            return left + right
-        elif binary.operator.ttype == TokenType.GREATER:
-            check_both_number_operands(binary.operator, left, right)
-            return left > right
-        elif binary.operator.ttype == TokenType.GREATER_EQUAL:
-            check_both_number_operands(binary.operator, left, right)
-            return left >= right
-        elif binary.operator.ttype == TokenType.LESS:
-            check_both_number_operands(binary.operator, left, right)
-            return left < right
-        elif binary.operator.ttype == TokenType.LESS_EQUAL:
-            check_both_number_operands(binary.operator, left, right)
-            return left <= right
-        elif binary.operator.ttype == TokenType.BANG_EQUAL:
-            return not is_equal(left, right)
-        elif binary.operator.ttype == TokenType.EQUAL_EQUAL:
-            return is_equal(left, right)
-        else:
-            raise InterpretationError(binary.operator, "Unsupported binary operator")
+        return evaluate_binary(binary.operator, left, right)
 
     def visit_logical(self, logical: Logical):
         if logical.operator.ttype == TokenType.OR:
@@ -344,11 +672,11 @@ class Interpreter(StmtVisitor[None], ExprVisitor[Any], AbstractInterpreter[Any])
                     stmt.superclass.name, "Superclass must be a class."
                 )
 
-        self.environment[stmt.name.lexeme] = None
+        self.define(stmt.name, stmt.slot, None)
 
         if stmt.superclass:
-            self.environment = Environment(self.environment)
-            self.environment["super"] = superclass
+            self.environment = Environment(self.environment, 1)
+            self.environment.values[0] = superclass
 
         klass = LoxClass(
             stmt.name.lexeme,
@@ -362,7 +690,7 @@ class Interpreter(StmtVisitor[None], ExprVisitor[Any], AbstractInterpreter[Any])
         if stmt.superclass and self.environment.enclosing:
             self.environment = self.environment.enclosing
 
-        self.environment[stmt.name.lexeme] = klass
+        self.define(stmt.name, stmt.slot, klass)
 
     def visit_get(self, expr: Get) -> Any:
         instance = self.visit_expr(expr.object)
@@ -370,7 +698,28 @@ class Interpreter(StmtVisitor[None], ExprVisitor[Any], AbstractInterpreter[Any])
         if not isinstance(instance, LoxInstance):
             raise InterpretationError(expr.name, "Only instances have properties")
 
-        return instance[expr.name]
+        slot = instance.shape.slots.get(expr.name.lexeme)
+        if slot is not None:
+            return instance.values[slot]
+
+        return self.lookup_method(expr, instance.klass).bind(instance)
+
+    def lookup_method(self, expr: Get, klass: LoxClass) -> LoxFunction:
+        cache = expr.cache
+        if cache is not None and klass in cache:
+            return cache[klass]
+
+        method = klass.find_method(expr.name.lexeme)
+        if method is None:
+            raise InterpretationError(
+                expr.name, f"Undefined property '{expr.name.lexeme}'."
+            )
+
+        if cache is None:
+            expr.cache = {klass: method}
+        elif len(cache) < INLINE_CACHE_SIZE:
+            cache[klass] = method
+        return method
 
     def visit_set(self, expr: Set) -> Any:
         object = self.visit_expr(expr.object)
@@ -379,16 +728,16 @@ class Interpreter(StmtVisitor[None], ExprVisitor[Any], AbstractInterpreter[Any])
         if not isinstance(object, LoxInstance):
             raise InterpretationError(expr.name, "Only instances have fields")
 
-        object[expr.name] = value
+        object.set_field(expr.name.lexeme, value)
         return value
 
     def visit_this(self, expr: This) -> Any:
         return self.lookup_variable(expr.keyword, expr)
 
     def visit_super(self, expr: Super) -> Any:
-        distance = self.local_vars[id(expr)]
-        superclass = cast(LoxClass, self.environment.get_at(distance, "super"))
-        object = cast(LoxInstance, self.environment.get_at(distance - 1, "this"))
+        distance = cast(int, expr.depth)
+        superclass = cast(LoxClass, self.environment.get_at(distance, 0))
+        object = cast(LoxInstance, self.environment.get_at(distance - 1, 0))
 
         method = superclass.find_method(expr.method.lexeme)
 
@@ -398,3 +747,11 @@ class Interpreter(StmtVisitor[None], ExprVisitor[Any], AbstractInterpreter[Any])
             )
 
         return method.bind(object)
+
+    def visit_inlined(self, expr: Inlined) -> Any:
+        # Same boundary as the body of the function that was inlined.
+        try:
+            return expr.body.accept(self)
+        except InterpretationError as err:
+            runtime_error(err)
+            return None
@@ -0,0 +1,158 @@
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+from AstPrinter import *
+from bytecode import constant_key
+from errors import Globals, NativeError
+
+# Results each memoized function keeps before evicting the least recently
+# used one.
+MEMO_SIZE = 1 << 16
+
+# Argument types a result can be cached under.
+KEY_TYPES = (int, float, str, bool, type(None))
+
+
+def impurity(node: Any, function: Function, depth: int = 0) -> Optional[str]:
+    """Why a call of `function` might do more than compute its result from
+    its arguments, judging by `node`, part of its body nested `depth`
+    scopes deep. None when it can't.
+
+    Only the function's own locals and parameters may be used, besides
+    the function itself for recursive calls: calls to anything else,
+    globals, captured variables, fields and `print` all disqualify it.
+    """
+    if isinstance(node, list):
+        for item in node:
+            reason = impurity(item, function, depth)
+            if reason is not None:
+                return reason
+        return None
+
+    kind = type(node)
+    if kind is Print:
+        return "it prints"
+    if kind in (Get, Set):
+        return "it uses fields"
+    if kind in (Function, Class):
+        return f"it declares '{node.name.lexeme}'"
+    if kind is Variable and not is_local(node, depth):
+        if not is_itself(node, function, depth):
+            return f"it reads '{node.name.lexeme}'"
+    if kind is Assign and not is_local(node, depth):
+        return f"it assigns '{node.name.lexeme}'"
+    if kind is Call and not is_itself(node.callee, function, depth):
+        return "it calls other functions"
+    if kind is Block and node.slot_count:
+        depth += 1
+
+    for field in node.__slots__:
+        value = getattr(node, field)
+        if isinstance(value, list) or hasattr(value, "accept"):
+            reason = impurity(value, function, depth)
+            if reason is not None:
+                return reason
+    return None
+
+
+def is_local(expr: Union[Variable, Assign], depth: int) -> bool:
+    return expr.depth is not None and expr.depth <= depth
+
+
+def is_itself(expr: Expr, function: Function, depth: int) -> bool:
+    return (
+        type(expr) is Variable
+        and expr.name.lexeme == function.name.lexeme
+        and (expr.depth is None or expr.depth == depth + 1)
+    )
+
+
+class MemoizedFunction(LoxCallable):
+    """A pure Lox function that remembers its results by argument values,
+    as returned by `memoize(fn)`."""
+
+    __slots__ = ("function", "name", "size", "results", "hits", "misses", "evictions")
+
+    def __init__(self, function: LoxCallable, name: str, size: int = MEMO_SIZE):
+        self.function = function
+        self.name = name
+        self.size = size
+        self.results: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def arity(self) -> int:
+        return self.function.arity
+
+    def call(self, interpreter: AbstractInterpreter[Any], arguments: List[Any]) -> Any:
+        for argument in arguments:
+            if type(argument) not in KEY_TYPES:
+                self.misses += 1
+                return self.function.call(interpreter, arguments)
+
+        # 1, 1.0 and true are equal in Python but print differently in Lox.
+        key = tuple([constant_key(argument) for argument in arguments])
+        results = self.results
+        if key in results:
+            self.hits += 1
+            results.move_to_end(key)
+            return results[key]
+
+        self.misses += 1
+        errors = Globals.runtime_errors
+        result = self.function.call(interpreter, arguments)
+        # A call that failed returned nil; the next one has to fail again.
+        if Globals.runtime_errors == errors:
+            results[key] = result
+            if len(results) > self.size:
+                results.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def __str__(self):
+        return str(self.function)
+
+
+class Memoize(LoxCallable):
+    """The `memoize(fn)` native. It keeps the functions it memoized, so
+    `pylox.py --stats` can report how their caches did."""
+
+    __slots__ = ("functions",)
+
+    def __init__(self):
+        self.functions: List[MemoizedFunction] = []
+
+    @property
+    def arity(self) -> int:
+        return 1
+
+    def call(self, interpreter: AbstractInterpreter[Any], arguments: List[Any]) -> Any:
+        function = arguments[0]
+        if type(function) is MemoizedFunction:
+            return function
+
+        declaration = getattr(function, "declaration", None)
+        if type(declaration) is not Function:
+            raise NativeError("Can only memoize functions.")
+
+        name = declaration.name.lexeme
+        reason = impurity(declaration.body, declaration)
+        if reason is not None:
+            raise NativeError(f"Can't memoize '{name}': {reason}.")
+
+        memoized = MemoizedFunction(function, name)
+        self.functions.append(memoized)
+        return memoized
+
+    def __str__(self):
+        return "<native fn>"
+
+    def report(self) -> str:
+        """How the cache of each function it memoized did, for --stats."""
+        return "\n".join(
+            f"memoize: {function.name}: {function.hits} hits, "
+            f"{function.misses} misses, {function.evictions} evictions"
+            for function in self.functions
+        )
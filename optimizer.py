@@ -0,0 +1,367 @@
+from collections import Counter
+from dataclasses import replace
+from typing import Any, Dict, Iterator, List, Optional
+from AstPrinter import *
+from tokens import TokenType
+from bytecode import constant_key
+from interpret import evaluate_binary, evaluate_unary, is_truthy
+from resolver import counted_loop
+
+
+# Largest function body, counted in AST nodes, that calls are inlined to.
+INLINE_SIZE = 16
+
+
+def walk(node: Any) -> Iterator[Any]:
+    """Every AST node in `node`, a node or a list of them, parents first.
+    Iterative, so a long chain of operators does not overflow the stack."""
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, list):
+            pending.extend(reversed(node))
+        elif hasattr(node, "accept"):
+            yield node
+            pending.extend(getattr(node, field) for field in reversed(node.__slots__))
+
+
+def local_names(program: Program) -> set[str]:
+    """Every name the program declares outside the global scope."""
+    names = set()
+    for node in walk(program):
+        if type(node) in (Var, Function, Class) and node.slot is not None:
+            names.add(node.name.lexeme)
+        if type(node) is Function:
+            names.update(param.lexeme for param in node.params)
+    return names
+
+
+def fixed_globals(program: Program) -> set[str]:
+    """Globals declared once and never assigned: whatever is bound to them
+    when they are declared is what they hold from then on."""
+    declared = Counter(
+        stmt.name.lexeme for stmt in program if type(stmt) in (Var, Function, Class)
+    )
+    assigned = {
+        node.name.lexeme
+        for node in walk(program)
+        if type(node) is Assign and node.depth is None
+    }
+    return {name for (name, count) in declared.items() if count == 1} - assigned
+
+
+def substitute(expr: Expr, arguments: List[Expr]) -> Expr:
+    """A copy of `expr`, the body of a function, with the parameters
+    replaced by the arguments of a call."""
+    if type(expr) is Variable and expr.depth == 0:
+        return arguments[expr.slot]
+
+    changes = {}
+    for field in expr.__slots__:
+        value = getattr(expr, field)
+        if isinstance(value, list):
+            changes[field] = [substitute(item, arguments) for item in value]
+        elif hasattr(value, "accept"):
+            changes[field] = substitute(value, arguments)
+    return replace(expr, **changes)
+
+
+class Optimizer(StmtVisitor[Optional[Stmt]], ExprVisitor[Expr]):
+    """AST-to-AST pass run on resolved programs with `pylox.py -O`.
+
+    Operators whose operands are constants are evaluated once, with the
+    interpreter's own operations. When that raises, as `1 / 0` does, the
+    node is left alone so the error still happens at run time, on the same
+    line. `if` branches and `while` loops that a constant condition never
+    selects are dropped, and equal constants share one Literal.
+
+    Every statement list is a runtime-error boundary: an error abandons the
+    rest of the list and execution resumes after it. Blocks are therefore
+    only merged where that cannot change what runs after an error. Nothing
+    here moves a declaration between scopes, so the Resolver's slots stay
+    valid.
+
+    Calls to global functions whose body is a single small `return` are
+    replaced by that expression, with the arguments substituted. Only
+    functions that are never redefined or assigned, and only calls made
+    after the declaration, are inlined, so the call could not have found
+    anything else. Arguments must be cheap and unable to fail or change,
+    so it makes no difference when, or how often, the body reads them.
+    The inlined body stays a runtime-error boundary (see Inlined), and its
+    nodes keep their tokens, so errors report the same lines.
+    """
+
+    def __init__(self, inline_size: int = INLINE_SIZE):
+        self.literals: Dict[Any, Literal] = {}
+        self.inline_size = inline_size
+        self.inlining = False
+        # Functions calls may be inlined to, and the globals declared so
+        # far, in program order.
+        self.inlinable: Dict[str, Function] = {}
+        self.declared: set[str] = set()
+        self.fixed: set[str] = set()
+        self.local_names: set[str] = set()
+
+    def optimize(self, program: Program) -> Program:
+        if self.inline_size > 0:
+            self.inlining = True
+            self.fixed = fixed_globals(program)
+            self.local_names = local_names(program)
+        return self.optimize_list(program)
+
+    def optimize_list(self, stmts: List[Stmt]) -> List[Stmt]:
+        result = []
+        for stmt in stmts:
+            stmt = stmt.accept(self)
+            if stmt is not None:
+                result.append(stmt)
+
+        # A block that declares nothing at the end of a list adds a boundary
+        # that ends exactly where the enclosing one does.
+        if result and type(result[-1]) is Block and not result[-1].slot_count:
+            result[-1:] = result[-1].statements
+        return result
+
+    def optimize_stmt(self, stmt: Stmt) -> Stmt:
+        """Optimizes a statement in a place that needs one, like a loop body."""
+        optimized = stmt.accept(self)
+        return Block([]) if optimized is None else optimized
+
+    def optimize_expr(self, expr: Expr) -> Expr:
+        return expr.accept(self)
+
+    def literal(self, value: Any) -> Literal:
+        key = constant_key(value)
+        literal = self.literals.get(key)
+        if literal is None:
+            literal = self.literals[key] = Literal(value)
+        return literal
+
+    def visit_expression(self, stmt: Expression) -> Optional[Stmt]:
+        stmt.expression = self.optimize_expr(stmt.expression)
+        if type(stmt.expression) is Literal:
+            return None
+        return stmt
+
+    def visit_print(self, stmt: Print) -> Stmt:
+        stmt.expression = self.optimize_expr(stmt.expression)
+        return stmt
+
+    def visit_var(self, stmt: Var) -> Stmt:
+        if stmt.initializer is not None:
+            stmt.initializer = self.optimize_expr(stmt.initializer)
+        self.declare(stmt)
+        return stmt
+
+    def declare(self, stmt: Union[Var, Function, Class]) -> None:
+        if stmt.slot is None:
+            self.declared.add(stmt.name.lexeme)
+
+    def visit_block(self, stmt: Block) -> Optional[Stmt]:
+        stmt.statements = self.optimize_list(stmt.statements)
+        if stmt.counted_loop is not None:
+            # A loop whose condition folded to false is gone.
+            stmt.counted_loop = counted_loop(stmt)
+        if not stmt.slot_count:
+            if not stmt.statements:
+                return None
+            # The inner block already stops every error that could reach
+            # this one: `for` loops without an increment desugar to this.
+            if len(stmt.statements) == 1 and type(stmt.statements[0]) is Block:
+                return stmt.statements[0]
+        return stmt
+
+    def visit_if(self, stmt: If) -> Optional[Stmt]:
+        condition = self.optimize_expr(stmt.condition)
+        if type(condition) is Literal:
+            if is_truthy(condition.value):
+                return stmt.then_branch.accept(self)
+            if stmt.else_branch is None:
+                return None
+            return stmt.else_branch.accept(self)
+
+        stmt.condition = condition
+        stmt.then_branch = self.optimize_stmt(stmt.then_branch)
+        if stmt.else_branch is not None:
+            stmt.else_branch = stmt.else_branch.accept(self)
+        return stmt
+
+    def visit_while(self, stmt: While) -> Optional[Stmt]:
+        condition = self.optimize_expr(stmt.condition)
+        if type(condition) is Literal and not is_truthy(condition.value):
+            return None
+
+        stmt.condition = condition
+        stmt.body = self.optimize_stmt(stmt.body)
+        return stmt
+
+    def visit_function(self, stmt: Function) -> Stmt:
+        stmt.body = self.optimize_list(stmt.body)
+        self.declare(stmt)
+        if self.inlining and self.can_inline(stmt):
+            self.inlinable[stmt.name.lexeme] = stmt
+        return stmt
+
+    def can_inline(self, stmt: Function) -> bool:
+        name = stmt.name.lexeme
+        if stmt.slot is not None or name not in self.fixed:
+            return False
+        if len(stmt.body) != 1 or type(stmt.body[0]) is not Return:
+            return False
+        value = stmt.body[0].value
+        if value is None:
+            return False
+
+        nodes = list(walk(value))
+        if len(nodes) > self.inline_size:
+            return False
+        for node in nodes:
+            if type(node) is Assign:
+                return False
+            # The bytecode compiler looks names up at the call site, where
+            # a local could hide the global the body means.
+            if type(node) is Variable and node.depth is None:
+                if node.name.lexeme == name or node.name.lexeme in self.local_names:
+                    return False
+        return True
+
+    def visit_return(self, stmt: Return) -> Stmt:
+        if stmt.value is not None:
+            stmt.value = self.optimize_expr(stmt.value)
+        return stmt
+
+    def visit_break(self, stmt: Break) -> Stmt:
+        return stmt
+
+    def visit_class(self, stmt: Class) -> Stmt:
+        for method in stmt.methods:
+            method.body = self.optimize_list(method.body)
+        self.declare(stmt)
+        return stmt
+
+    def visit_literal(self, expr: Literal) -> Expr:
+        return self.literal(expr.value)
+
+    def visit_grouping(self, expr: Grouping) -> Expr:
+        # Parentheses only matter to the parser.
+        return self.optimize_expr(expr.expression)
+
+    def visit_unary(self, expr: Unary) -> Expr:
+        expr.right = self.optimize_expr(expr.right)
+        if type(expr.right) is Literal:
+            try:
+                return self.literal(evaluate_unary(expr.operator, expr.right.value))
+            except Exception:
+                pass
+        return expr
+
+    def visit_binary(self, expr: Binary) -> Expr:
+        # A left-leaning chain, like a long sum, is folded from its
+        # innermost operand out rather than by recursing down it.
+        chain = []
+        while type(expr) is Binary:
+            chain.append(expr)
+            expr = expr.left
+        left = self.optimize_expr(expr)
+        for expr in reversed(chain):
+            expr.left = left
+            expr.right = self.optimize_expr(expr.right)
+            left = expr
+            if type(expr.left) is Literal and type(expr.right) is Literal:
+                try:
+                    left = self.literal(
+                        evaluate_binary(expr.operator, expr.left.value, expr.right.value)
+                    )
+                except Exception:
+                    pass
+        return left
+
+    def visit_logical(self, expr: Logical) -> Expr:
+        chain = []
+        while type(expr) is Logical:
+            chain.append(expr)
+            expr = expr.left
+        left = self.optimize_expr(expr)
+        for expr in reversed(chain):
+            if type(left) is Literal:
+                # The result is the left operand when it decides the
+                # outcome, and otherwise whatever the right one evaluates to.
+                if is_truthy(left.value) != (expr.operator.ttype == TokenType.OR):
+                    left = self.optimize_expr(expr.right)
+                continue
+            expr.left = left
+            expr.right = self.optimize_expr(expr.right)
+            left = expr
+        return left
+
+    def visit_call(self, expr: Call) -> Expr:
+        expr.callee = self.optimize_expr(expr.callee)
+        expr.arguments = [self.optimize_expr(argument) for argument in expr.arguments]
+        if self.inlining:
+            return self.inline(expr)
+        return expr
+
+    def inline(self, expr: Call) -> Expr:
+        callee = expr.callee
+        if type(callee) is not Variable or callee.depth is not None:
+            return expr
+        function = self.inlinable.get(callee.name.lexeme)
+        if function is None or len(function.params) != len(expr.arguments):
+            return expr
+
+        value = function.body[0].value
+        calls = any(type(node) is Call for node in walk(value))
+        for argument in expr.arguments:
+            if type(argument) in (Literal, This):
+                continue
+            # A call in the body could assign the variable before the body
+            # reads it, which it would not have done to the parameter.
+            if type(argument) is Variable and not calls and self.cannot_fail(argument):
+                continue
+            return expr
+
+        # The copy is only folded: the functions it calls were declared
+        # before this one and already inlined where they could be.
+        self.inlining = False
+        try:
+            body = self.optimize_expr(substitute(value, expr.arguments))
+        finally:
+            self.inlining = True
+        if self.cannot_fail(body):
+            return body
+        return Inlined(function.name, body)
+
+    def cannot_fail(self, expr: Expr) -> bool:
+        if type(expr) in (Literal, This):
+            return True
+        if type(expr) is Variable:
+            return expr.depth is not None or expr.name.lexeme in self.declared
+        return False
+
+    def visit_variable(self, expr: Variable) -> Expr:
+        return expr
+
+    def visit_assign(self, expr: Assign) -> Expr:
+        expr.value = self.optimize_expr(expr.value)
+        return expr
+
+    def visit_get(self, expr: Get) -> Expr:
+        expr.object = self.optimize_expr(expr.object)
+        return expr
+
+    def visit_set(self, expr: Set) -> Expr:
+        expr.object = self.optimize_expr(expr.object)
+        expr.value = self.optimize_expr(expr.value)
+        return expr
+
+    def visit_this(self, expr: This) -> Expr:
+        return expr
+
+    def visit_super(self, expr: Super) -> Expr:
+        return expr
+
+    def visit_inlined(self, expr: Inlined) -> Expr:
+        expr.body = self.optimize_expr(expr.body)
+        if self.cannot_fail(expr.body):
+            return expr.body
+        return expr
@@ -1,4 +1,5 @@
-from typing import List
+from enum import IntEnum
+from typing import Callable, Iterable, List, NamedTuple
 
 from AstPrinter import *
 from tokens import Token, TokenType
@@ -9,10 +10,39 @@ class ParseError(Exception):
     pass
 
 
+class Precedence(IntEnum):
+    """Binding power of infix operators, loosest first."""
+
+    NONE = 0
+    ASSIGNMENT = 1
+    OR = 2
+    AND = 3
+    EQUALITY = 4
+    COMPARISON = 5
+    TERM = 6
+    FACTOR = 7
+    UNARY = 8
+    CALL = 9
+
+
+class InfixRule(NamedTuple):
+    precedence: Precedence
+    node: Callable[[Expr, Token, Expr], Expr]
+
+
 class Parser:
-    def __init__(self, tokens: List[Token]) -> None:
-        self.tokens = tokens
-        self.current = 0
+    """Recursive descent parser over a stream of tokens. Expressions are
+    parsed by precedence climbing over PREFIX_RULES and INFIX_RULES.
+
+    Tokens are pulled from `tokens` one at a time; only the current and the
+    previous token are kept, so a lazy source such as Scanner.scan() is
+    never materialised as a list.
+    """
+
+    def __init__(self, tokens: Iterable[Token]) -> None:
+        self.tokens = iter(tokens)
+        self.current = next(self.tokens)
+        self.last = None
         self.loop_depth = 0
 
     def parse(self):
@@ -76,7 +106,14 @@ class Parser:
                 )
         self.consume(TokenType.RIGHT_PAREN, f"Expect ')' after {kind} parameters.")
         self.consume(TokenType.LEFT_BRACE, "Expect '{' before the " f"{kind} body.")
-        body = self.block()
+        # A break can't leave the function it's in, so loops around the
+        # declaration don't count.
+        enclosing_loop_depth = self.loop_depth
+        self.loop_depth = 0
+        try:
+            body = self.block()
+        finally:
+            self.loop_depth = enclosing_loop_depth
         return Function(name, params, body)
 
     def parameters(self):
@@ -93,6 +130,8 @@ class Parser:
             return self.while_statement()
         if self.match(TokenType.FOR):
             return self.for_statement()
+        if self.match(TokenType.BREAK):
+            return self.break_statement()
         if self.match(TokenType.LEFT_BRACE):
             return Block(self.block())
 
@@ -107,10 +146,8 @@ class Parser:
         return Return(keyword, value)
 
     def break_statement(self):
-        # print(self.loop_depth)
+        # A break outside any loop is reported by the Resolver.
         keyword = self.previous()
-        if self.loop_depth == 0:
-            self.error(TokenType.BREAK, "Must be inside loop")
         self.consume(TokenType.SEMICOLON, "Expect ';' after break.")
         return Break(keyword, self.loop_depth)
     
@@ -192,14 +229,13 @@ class Parser:
         return Expression(expr)
 
     def expression(self):
-        return self.assignment()
-
-    def assignment(self):
-        expr = self.logical_or()
+        # Assignment is the loosest level and right-associative, so it is
+        # handled here rather than in the infix table.
+        expr = self.parse_precedence(Precedence.OR)
 
-        if self.match(TokenType.EQUAL):
-            equals = self.previous()
-            value = self.assignment()
+        if self.current.ttype is TokenType.EQUAL:
+            equals = self.advance()
+            value = self.expression()
 
             if isinstance(expr, Variable):
                 return Assign(expr.name, value)
@@ -210,72 +246,32 @@ class Parser:
 
         return expr
 
-    def logical_or(self):
-        expr = self.logical_and()
-
-        while self.match(TokenType.OR):
-            expr = Logical(expr, self.previous(), self.logical_and())
-
-        return expr
-
-    def logical_and(self):
-        expr = self.equality()
-
-        while self.match(TokenType.AND):
-            expr = Logical(expr, self.previous(), self.equality())
-
-        return expr
-
-    def equality(self):
-        left = self.comparison()
-
-        while self.match(TokenType.BANG_EQUAL, TokenType.EQUAL_EQUAL):
-            left = Binary(left, self.previous(), self.comparison())
-
-        return left
-
-    def comparison(self):
-        left = self.term()
-
-        while self.match(
-            TokenType.GREATER,
-            TokenType.GREATER_EQUAL,
-            TokenType.LESS,
-            TokenType.LESS_EQUAL,
-        ):
-            left = Binary(left, self.previous(), self.term())
-
-        return left
-
-    def term(self):
-        left = self.factor()
-
-        while self.match(TokenType.MINUS, TokenType.PLUS):
-            left = Binary(left, self.previous(), self.factor())
-
-        return left
-
-    def factor(self):
-        left = self.unary()
-
-        while self.match(TokenType.SLASH, TokenType.STAR):
-            left = Binary(left, self.previous(), self.unary())
-
-        return left
-
-    def unary(self) -> Expr:
-        if self.match(TokenType.MINUS, TokenType.BANG):
-            return Unary(self.previous(), self.unary())
-        else:
-            return self.call()
-
-    def call(self):
-        expr = self.primary()
+    def parse_precedence(self, precedence: "Precedence") -> Expr:
+        """Parses an expression whose infix operators all bind at least as
+        tightly as `precedence`. Operators of one level are folded in a
+        loop, so a long chain like `1 + 2 + ... + n` does not recurse."""
+        token = self.current
+        prefix = PREFIX_RULES.get(token.ttype)
+        if prefix is None:
+            raise self.error(token, "Expect expression")
+        self.advance()
+        left = self.call(prefix(self, token))
 
         while True:
-            if self.match(TokenType.LEFT_PAREN):
+            rule = INFIX_RULES.get(self.current.ttype)
+            if rule is None or rule.precedence < precedence:
+                return left
+            operator = self.advance()
+            right = self.parse_precedence(rule.precedence + 1)
+            left = rule.node(left, operator, right)
+
+    def call(self, expr: Expr) -> Expr:
+        while True:
+            if self.current.ttype is TokenType.LEFT_PAREN:
+                self.advance()
                 expr = self.finish_call(expr)
-            if self.match(TokenType.DOT):
+            if self.current.ttype is TokenType.DOT:
+                self.advance()
                 name = self.consume(
                     TokenType.IDENTIFIER, "Expect property name after '.'."
                 )
@@ -296,32 +292,38 @@ class Parser:
         paren = self.consume(TokenType.RIGHT_PAREN, "Expect ')' after arguments.")
         return Call(expr, paren, arguments)
 
-    def primary(self) -> Expr:
-        if self.match(TokenType.FALSE):
-            return Literal(False)
-        elif self.match(TokenType.TRUE):
-            return Literal(True)
-        elif self.match(TokenType.NIL):
-            return Literal(None)
-        elif self.match(TokenType.NUMBER, TokenType.STRING):
-            return Literal(self.previous().literal)
-        elif self.match(TokenType.THIS):
-            return This(self.previous())
-        elif self.match(TokenType.BREAK):
-            return Break(self.previous(), self.loop_depth)
-        elif self.match(TokenType.SUPER):
-            keyword = self.previous()
-            self.consume(TokenType.DOT, "Expect '.' after 'super'")
-            method = self.consume(TokenType.IDENTIFIER, "Expect superclass method name")
-            return Super(keyword, method)
-        elif self.match(TokenType.IDENTIFIER):
-            return Variable(self.previous())
-        elif self.match(TokenType.LEFT_PAREN):
-            expr = self.expression()
-            self.consume(TokenType.RIGHT_PAREN, "Expect ')' after expression")
-            return Grouping(expr)
-        else:
-            raise self.error(self.peek(), "Expect expression")
+    def unary(self, operator: Token) -> Expr:
+        # A run of prefix operators is collected first, so `- - - x`
+        # does not recurse once per operator.
+        operators = [operator]
+        while self.current.ttype in UNARY_OPERATORS:
+            operators.append(self.advance())
+        expr = self.parse_precedence(Precedence.UNARY)
+        for operator in reversed(operators):
+            expr = Unary(operator, expr)
+        return expr
+
+    def literal(self, token: Token) -> Expr:
+        return Literal(token.literal)
+
+    def keyword_literal(self, token: Token) -> Expr:
+        return Literal(KEYWORD_LITERALS[token.ttype])
+
+    def variable(self, token: Token) -> Expr:
+        return Variable(token)
+
+    def this(self, token: Token) -> Expr:
+        return This(token)
+
+    def super(self, keyword: Token) -> Expr:
+        self.consume(TokenType.DOT, "Expect '.' after 'super'")
+        method = self.consume(TokenType.IDENTIFIER, "Expect superclass method name")
+        return Super(keyword, method)
+
+    def grouping(self, _: Token) -> Expr:
+        expr = self.expression()
+        self.consume(TokenType.RIGHT_PAREN, "Expect ')' after expression")
+        return Grouping(expr)
 
     def error(self, token: Token, msg: str):
         add_error(token, msg)
@@ -334,32 +336,31 @@ class Parser:
         raise self.error(self.peek(), msg)
 
     def match(self, *tys):
-        for ttype in tys:
-            if self.check(ttype):
-                self.advance()
-                return True
+        # No caller asks for EOF, so a plain identity test on the current
+        # token is enough.
+        if self.current.ttype in tys:
+            self.advance()
+            return True
         return False
 
     def check(self, ttype: TokenType):
-        if self.is_at_end():
-            return False
-        else:
-            return self.peek().ttype == ttype
+        return self.current.ttype is ttype
 
     def advance(self):
         if not self.is_at_end():
-            self.current += 1
+            self.last = self.current
+            self.current = next(self.tokens)
 
-        return self.previous()
+        return self.last
 
     def is_at_end(self):
-        return self.peek().ttype == TokenType.EOF
+        return self.current.ttype is TokenType.EOF
 
     def previous(self):
-        return self.tokens[self.current - 1]
+        return self.last
 
     def peek(self):
-        return self.tokens[self.current]
+        return self.current
 
     def synchronize(self):
         self.advance()
@@ -381,3 +382,43 @@ class Parser:
                 return
 
             self.advance()
+
+
+# Parses the expression that starts with a given token, once that token
+# has been consumed.
+PREFIX_RULES = {
+    TokenType.NUMBER: Parser.literal,
+    TokenType.STRING: Parser.literal,
+    TokenType.FALSE: Parser.keyword_literal,
+    TokenType.TRUE: Parser.keyword_literal,
+    TokenType.NIL: Parser.keyword_literal,
+    TokenType.IDENTIFIER: Parser.variable,
+    TokenType.THIS: Parser.this,
+    TokenType.SUPER: Parser.super,
+    TokenType.LEFT_PAREN: Parser.grouping,
+    TokenType.MINUS: Parser.unary,
+    TokenType.BANG: Parser.unary,
+}
+
+INFIX_RULES = {
+    TokenType.OR: InfixRule(Precedence.OR, Logical),
+    TokenType.AND: InfixRule(Precedence.AND, Logical),
+    TokenType.BANG_EQUAL: InfixRule(Precedence.EQUALITY, Binary),
+    TokenType.EQUAL_EQUAL: InfixRule(Precedence.EQUALITY, Binary),
+    TokenType.GREATER: InfixRule(Precedence.COMPARISON, Binary),
+    TokenType.GREATER_EQUAL: InfixRule(Precedence.COMPARISON, Binary),
+    TokenType.LESS: InfixRule(Precedence.COMPARISON, Binary),
+    TokenType.LESS_EQUAL: InfixRule(Precedence.COMPARISON, Binary),
+    TokenType.MINUS: InfixRule(Precedence.TERM, Binary),
+    TokenType.PLUS: InfixRule(Precedence.TERM, Binary),
+    TokenType.SLASH: InfixRule(Precedence.FACTOR, Binary),
+    TokenType.STAR: InfixRule(Precedence.FACTOR, Binary),
+}
+
+UNARY_OPERATORS = (TokenType.MINUS, TokenType.BANG)
+
+KEYWORD_LITERALS = {
+    TokenType.FALSE: False,
+    TokenType.TRUE: True,
+    TokenType.NIL: None,
+}
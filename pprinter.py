@@ -141,3 +141,6 @@ class LispPrinter(ExprVisitor[str], StmtVisitor[str]):
 
     def visit_super(self, expr: Super) -> str:
         return f"({expr.keyword.lexeme} {expr.method.lexeme})"
+
+    def visit_inlined(self, expr: Inlined) -> str:
+        return f"(inlined {expr.name.lexeme} {expr.body.accept(self)})"
@@ -0,0 +1,153 @@
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, TextIO, Tuple
+
+from closure_compiler import CompiledFunction
+from interpret import LoxFunction, NativeFunction
+
+# A profiled function: its name and the line it is declared on, None for
+# natives.
+Key = Tuple[str, Optional[int]]
+
+SCRIPT: Key = ("<script>", None)
+
+
+def function_key(function: LoxFunction) -> Key:
+    name = function.declaration.name
+    return (name.lexeme, name.line)
+
+
+def native_key(function: NativeFunction) -> Key:
+    return (function.name, None)
+
+
+# The methods the engines call a function through, and how to name it.
+# CompiledFunction overrides both of LoxFunction's.
+PROFILED: List[Tuple[type, str, Callable[[Any], Key]]] = [
+    (LoxFunction, "call", function_key),
+    (LoxFunction, "call_method", function_key),
+    (CompiledFunction, "call", function_key),
+    (CompiledFunction, "call_method", function_key),
+    (NativeFunction, "call", native_key),
+]
+
+
+class Frame:
+    __slots__ = ("key", "path", "start", "children")
+
+    def __init__(self, key: Key, path: str, start: int):
+        self.key = key
+        self.path = path
+        self.start = start
+        # Time spent in calls made from this one.
+        self.children = 0
+
+
+class Profiler:
+    """Deterministic per-function profiler for `pylox.py --profile`.
+
+    Entering it wraps the methods every call of a Lox function or native
+    goes through with ones that time the call, and leaving it puts the
+    originals back, so a run without --profile pays nothing. Calls the VM
+    makes inside its dispatch loop are invisible to it.
+
+    Time is measured with time.perf_counter_ns. Inclusive time counts a
+    recursive function once, for its outermost call; self time leaves out
+    the calls it made. The `<script>` row covers the whole run, loading
+    the script included. On leaving, the table goes to stderr and the call
+    stacks to `output`.
+    """
+
+    def __init__(self, output: Path):
+        self.output = output
+        self.calls: Dict[Key, int] = {}
+        self.inclusive: Dict[Key, int] = {}
+        self.exclusive: Dict[Key, int] = {}
+        # Self time by call stack, `<script>;outer;inner`, for flame graphs.
+        self.stacks: Dict[str, int] = {}
+        self.frames: List[Frame] = []
+        # How many calls of each function are running.
+        self.active: Dict[Key, int] = {}
+        self.originals: List[Tuple[type, str, Any]] = []
+
+    def __enter__(self) -> "Profiler":
+        for (cls, name, key) in PROFILED:
+            method = cls.__dict__[name]
+            self.originals.append((cls, name, method))
+            setattr(cls, name, self.timed(method, key))
+        self.enter(SCRIPT)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        while self.frames:
+            self.exit()
+        for (cls, name, method) in self.originals:
+            setattr(cls, name, method)
+        self.originals.clear()
+        # run_file ends with exit() when the script failed; report anyway.
+        self.report(sys.stderr)
+        self.write_stacks(self.output)
+
+    def timed(self, method: Callable, key: Callable[[Any], Key]) -> Callable:
+        enter = self.enter
+        exit = self.exit
+
+        def profiled(function, *arguments):
+            enter(key(function))
+            try:
+                return method(function, *arguments)
+            finally:
+                exit()
+
+        return profiled
+
+    def enter(self, key: Key) -> None:
+        frames = self.frames
+        path = f"{frames[-1].path};{label(key)}" if frames else label(key)
+        self.active[key] = self.active.get(key, 0) + 1
+        frames.append(Frame(key, path, time.perf_counter_ns()))
+
+    def exit(self) -> None:
+        frame = self.frames.pop()
+        elapsed = time.perf_counter_ns() - frame.start
+        key = frame.key
+        own = elapsed - frame.children
+
+        self.calls[key] = self.calls.get(key, 0) + 1
+        self.exclusive[key] = self.exclusive.get(key, 0) + own
+        self.stacks[frame.path] = self.stacks.get(frame.path, 0) + own
+        self.active[key] -= 1
+        if not self.active[key]:
+            self.inclusive[key] = self.inclusive.get(key, 0) + elapsed
+        if self.frames:
+            self.frames[-1].children += elapsed
+
+    def report(self, out: TextIO) -> None:
+        """Prints a table of the profiled functions, most self time first."""
+        print(f"{'calls':>10} {'total ms':>12} {'self ms':>12}  function", file=out)
+        for key in sorted(self.calls, key=lambda key: -self.exclusive[key]):
+            print(
+                f"{self.calls[key]:>10} {self.inclusive[key] / 1e6:>12.3f} "
+                f"{self.exclusive[key] / 1e6:>12.3f}  {describe(key)}",
+                file=out,
+            )
+
+    def write_stacks(self, path: Path) -> None:
+        """Writes self time in microseconds per call stack, in the collapsed
+        format flamegraph.pl and speedscope read."""
+        with open(path, "w", encoding="utf8") as f:
+            for (stack, nanoseconds) in self.stacks.items():
+                f.write(f"{stack} {nanoseconds // 1000}\n")
+
+
+def label(key: Key) -> str:
+    (name, line) = key
+    return name if line is None else f"{name}:{line}"
+
+
+def describe(key: Key) -> str:
+    (name, line) = key
+    if key == SCRIPT:
+        return name
+    return f"{name} (native)" if line is None else f"{name} (line {line})"
@@ -0,0 +1,145 @@
+import dataclasses
+import gc
+import hashlib
+import io
+import os
+import pickle
+import sys
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import AstPrinter
+from AstPrinter import Program
+from scanner import CHUNK_SIZE
+from tokens import Token, TokenType
+
+# Bump when the meaning of a stored program changes without its node
+# layout changing, e.g. when the resolver numbers slots differently.
+FORMAT_VERSION = 1
+
+MAGIC = b"LOXC"
+
+NODE_CLASSES = [
+    value
+    for value in vars(AstPrinter).values()
+    if dataclasses.is_dataclass(value) and isinstance(value, type)
+]
+
+
+def layout_digest() -> bytes:
+    """Identifies the interpreter's program layout: a cache file written for
+    other node classes, fields or token types is stale."""
+    parts = [str(FORMAT_VERSION)]
+    for cls in sorted(NODE_CLASSES + [Token], key=lambda cls: cls.__name__):
+        fields = ",".join(field.name for field in dataclasses.fields(cls))
+        parts.append(f"{cls.__name__}({fields})")
+    parts.append(",".join(ttype.name for ttype in TokenType))
+    return hashlib.blake2b(";".join(parts).encode(), digest_size=8).digest()
+
+
+HEADER = MAGIC + layout_digest()
+
+# Programs a `pylox.py --serve` daemon loaded before forking the processes
+# that run them, by absolute path, with the digest of their source. The
+# forked processes share them copy-on-write instead of unpickling them.
+preloaded: Dict[str, Tuple[bytes, Program]] = {}
+
+
+def reduce_node(node):
+    return (type(node), tuple([getattr(node, name) for name in node.__slots__]))
+
+
+# Nodes and tokens are stored as their class and field values, so loading
+# one is a single constructor call made from C.
+DISPATCH_TABLE = {cls: reduce_node for cls in NODE_CLASSES + [Token]}
+
+ALLOWED_CLASSES = {
+    (cls.__module__, cls.__qualname__): cls for cls in NODE_CLASSES + [Token, TokenType]
+}
+
+
+class ProgramUnpickler(pickle.Unpickler):
+    """Only rebuilds AST nodes and tokens, so a damaged or foreign cache
+    file fails to load instead of running arbitrary code."""
+
+    def find_class(self, module, name):
+        try:
+            return ALLOWED_CLASSES[(module, name)]
+        except KeyError:
+            raise pickle.UnpicklingError(f"{module}.{name} is not part of a program")
+
+
+def cache_path(script) -> Path:
+    """Where the compiled form of `script` is kept, next to it in
+    __pycache__ the way Python stores .pyc files."""
+    script = Path(script)
+    tag = sys.implementation.cache_tag
+    return script.parent / "__pycache__" / f"{script.stem}.{tag}.loxc"
+
+
+def source_digest(script) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(script, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def load_program(script, digest: bytes) -> Optional[Program]:
+    """Returns the resolved program cached for `script`, or None when there
+    is no cache file or it is stale or unreadable."""
+    if preloaded:
+        entry = preloaded.get(os.path.abspath(script))
+        if entry is not None and entry[0] == digest:
+            return entry[1]
+
+    try:
+        data = cache_path(script).read_bytes()
+    except OSError:
+        return None
+
+    prefix = HEADER + digest
+    if not data.startswith(prefix):
+        return None
+
+    # Nothing being loaded can form a cycle; the collector would only walk
+    # the growing tree over and over.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        program = ProgramUnpickler(io.BytesIO(data[len(prefix):])).load()
+    except Exception:
+        return None
+    finally:
+        if enabled:
+            gc.enable()
+
+    return program if isinstance(program, list) else None
+
+
+def save_program(script, digest: bytes, program: Program) -> None:
+    """Writes `program`, freshly resolved from `script`, to its cache file.
+    Failing to write the cache is not an error."""
+    if sys.dont_write_bytecode:
+        return
+
+    buffer = io.BytesIO()
+    buffer.write(HEADER + digest)
+    pickler = pickle.Pickler(buffer, pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = DISPATCH_TABLE
+    try:
+        pickler.dump(program)
+    except RecursionError:
+        return
+
+    path = cache_path(script)
+    temporary = path.with_name(f"{path.name}.{os.getpid()}")
+    try:
+        path.parent.mkdir(exist_ok=True)
+        temporary.write_bytes(buffer.getvalue())
+        os.replace(temporary, path)
+    except OSError:
+        try:
+            temporary.unlink()
+        except OSError:
+            pass
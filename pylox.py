@@ -1,58 +1,339 @@
-import sys,os
+import gc, os, sys, argparse
+from contextlib import nullcontext
 from pathlib import Path
 
-from scanner import Scanner
+from scanner import Scanner, read_chunks
 from parsers import Parser
 from interpret import Interpreter
+from closure_compiler import ClosureInterpreter
+from quicken import QuickeningInterpreter
+from vm import VM
+from bytecode import Compiler
+from disassembler import Disassembler
 from errors import *
 from resolver import Resolver
+from program_cache import load_program, save_program, source_digest
+from optimizer import INLINE_SIZE, Optimizer
+from memoize import Memoize
+from profiler import Profiler
+from heatmap import HeatMap
+from client import DEFAULT_SOCKET
 
+ENGINES = {
+    "tree": Interpreter,
+    "quicken": QuickeningInterpreter,
+    "closure": ClosureInterpreter,
+    "vm": VM,
+}
 
-def run(source):
-    scanner = Scanner(source)
-    tokens = scanner.scan_tokens()
-    parser = Parser(tokens)
-    result = parser.parse()
 
-    if result is None or Globals.had_error:
-        return
-
-    interpreter = Interpreter()
-    resolver = Resolver(interpreter)
-    resolver.resolve_list(result)
+def parse_program(source, resolver=None):
+    parser = Parser(Scanner(source).scan())
+    try:
+        program = parser.parse()
+        if program is None or Globals.had_error:
+            return None
+        (resolver or Resolver()).resolve_list(program)
+    except RecursionError as err:
+        error(depth_line(err), "Too deeply nested.")
+        return None
 
     if Globals.had_error:
-        return
+        return None
+    return program
+
+
+def run_program(program, engine="tree", disassemble=False, stats=False, max_depth=None):
+    if max_depth is None:
+        interpreter = ENGINES[engine]()
+    else:
+        interpreter = ENGINES[engine](max_depth=max_depth)
+
+    try:
+        if disassemble:
+            print(Disassembler().disassemble_program(Compiler().compile(program)))
+            return
+        interpreter.visit_statements(program)
+    except RecursionError as err:
+        runtime_error(stack_overflow(err))
+
+    if stats:
+        if hasattr(interpreter, "stats"):
+            print(interpreter.stats, file=sys.stderr)
+        memoize = interpreter.globals.values.get("memoize")
+        if isinstance(memoize, Memoize) and memoize.functions:
+            print(memoize.report(), file=sys.stderr)
+
+
+def run(
+    source,
+    engine="tree",
+    disassemble=False,
+    stats=False,
+    max_depth=None,
+    optimize=False,
+    inline_size=INLINE_SIZE,
+):
+    program = parse_program(source)
+    if program is not None:
+        if optimize:
+            program = Optimizer(inline_size).optimize(program)
+        run_program(program, engine, disassemble, stats, max_depth)
 
-    interpreter.visit_statements(result)
 
+def run_file(
+    f,
+    engine="tree",
+    disassemble=False,
+    stats=False,
+    max_depth=None,
+    cache=True,
+    optimize=False,
+    inline_size=INLINE_SIZE,
+    heatmap=None,
+):
+    program = None
+    if cache:
+        digest = source_digest(f)
+        program = load_program(f, digest)
+
+    if program is None:
+        program = parse_program(read_chunks(f))
+        if cache and program is not None:
+            save_program(f, digest, program)
+
+    if program is not None:
+        # The cache holds the program as written, so -O does not change it.
+        if optimize:
+            program = Optimizer(inline_size).optimize(program)
+        if heatmap is not None:
+            heatmap.instrument(program)
+        # The program lives until exit and holds no garbage cycles, so keep
+        # the collector from walking it on every full collection.
+        gc.freeze()
+        run_program(program, engine, disassemble, stats, max_depth)
 
-def run_file(f):
-    run(Path(f).read_text(encoding="utf8"))
     if Globals.had_error:
         exit(65)
     if Globals.had_runtime_error:
         exit(70)
 
 
-def run_prompt():
+class Session:
+    """One interpreter and resolver that a series of inputs all run in, so
+    the globals, functions and classes one declares are there for the
+    next. Each input is only scanned, parsed and resolved on its own."""
+
+    def __init__(self, engine="tree", optimize=False):
+        self.interpreter = ENGINES[engine]()
+        self.resolver = Resolver()
+        self.optimize = optimize
+
+    def run(self, source):
+        program = parse_program(source, self.resolver)
+        if program is None:
+            return
+        if self.optimize:
+            # A later input can redefine a function an earlier one inlined.
+            program = Optimizer(inline_size=0).optimize(program)
+        try:
+            self.interpreter.visit_statements(program)
+        except RecursionError as err:
+            runtime_error(stack_overflow(err))
+
+
+def run_prompt(engine="tree", optimize=False):
+    session = Session(engine, optimize)
     while True:
         print("> ", end="", flush=True)
         inp = sys.stdin.readline()
         if len(inp) == 0:
             break
-        run(inp)
+        session.run(inp)
         Globals.had_error = False
 
-curr_file = os.getcwd()
-file = os.path.basename(curr_file)
-if len(sys.argv) > 2:
-    print(f"Usage: {file} [script] or {file} rprompt")
-    exit(64)
-elif len(sys.argv) == 2 and sys.argv[1].endswith((".lox", ".pylox")):
-    run_file(sys.argv[1])
-elif sys.argv[0] == "rprompt":
-    run_prompt()
-else:
-    print(f"Usage: {file} [script] or {file} rprompt")
-    exit(64)
+
+def profiling(args):
+    """What the run happens in: a Profiler with --profile, else nothing."""
+    if not args.profile:
+        return nullcontext()
+    if args.profile_output is not None:
+        return Profiler(Path(args.profile_output))
+    return Profiler(Path(args.script).with_suffix(".collapsed"))
+
+
+def heat_mapping(args):
+    """A HeatMap for the script with --heatmap, else nothing."""
+    if not args.heatmap:
+        return nullcontext()
+    output = None if args.heatmap_output is None else Path(args.heatmap_output)
+    return HeatMap(Path(args.script), output)
+
+
+class ArgumentParser(argparse.ArgumentParser):
+    def error(self, message):
+        self.print_usage(sys.stderr)
+        print(f"{self.prog}: error: {message}", file=sys.stderr)
+        exit(64)
+
+
+def build_parser():
+    parser = ArgumentParser(prog="pylox.py", usage="%(prog)s [options] [script] or %(prog)s rprompt")
+    parser.add_argument("script", nargs="?")
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="tree",
+        help="execution engine: tree-walking interpreter, quickening tree-walker, "
+        "compiled closures or bytecode VM",
+    )
+    parser.add_argument(
+        "--disassemble",
+        action="store_true",
+        help="print the bytecode compiled for the script instead of running it",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print engine counters to stderr after running, e.g. quickened "
+        "nodes or memoize cache hits",
+    )
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        help="maximum Lox call depth for the vm engine, whose call frames live "
+        "on the heap rather than the Python stack",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="always scan, parse and resolve the script instead of using or "
+        "writing its compiled form in __pycache__",
+    )
+    parser.add_argument(
+        "-O",
+        "--optimize",
+        action="store_true",
+        help="fold constant expressions, drop unreachable branches and "
+        "loops and inline small functions before running",
+    )
+    parser.add_argument(
+        "--inline-size",
+        type=int,
+        default=INLINE_SIZE,
+        metavar="N",
+        help=f"largest function body, in AST nodes, that -O inlines into "
+        f"calls; 0 turns inlining off (default {INLINE_SIZE})",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="time every function and print a table of calls, total and self "
+        "time to stderr; not available with --engine vm",
+    )
+    parser.add_argument(
+        "--profile-output",
+        metavar="FILE",
+        help="where --profile writes its call stacks in collapsed format, for "
+        "flame graphs (default: the script's name with .collapsed)",
+    )
+    parser.add_argument(
+        "--heatmap",
+        action="store_true",
+        help="count and time the statements run on each line and print the "
+        "script annotated with them to stderr; not available with --engine vm",
+    )
+    parser.add_argument(
+        "--heatmap-output",
+        metavar="FILE",
+        help="write the --heatmap annotated script to FILE instead, or a JSON "
+        "report if FILE ends in .json",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="run as a daemon that keeps forked interpreter processes ready "
+        "for scripts sent with client.py",
+    )
+    parser.add_argument(
+        "--socket",
+        default=DEFAULT_SOCKET,
+        metavar="PATH",
+        help=f"Unix socket --serve listens on (default {DEFAULT_SOCKET})",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        metavar="N",
+        help="scripts --serve runs at once (default: the number of CPUs)",
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="DIR|GLOB",
+        help="run every script under DIR, or matching GLOB, each on its own "
+        "and in parallel, and print their output in order",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        metavar="N",
+        help="scripts --batch runs at once (default: the number of CPUs)",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="have --batch print a line of JSON per script, with its output, "
+        "exit status and timings",
+    )
+    return parser
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+
+    if args.max_depth is not None and args.engine != "vm":
+        parser.error("--max-depth requires --engine vm")
+    if args.profile and args.engine == "vm":
+        parser.error("--profile does not support --engine vm")
+    if args.heatmap and (args.engine == "vm" or args.disassemble):
+        parser.error("--heatmap does not support --engine vm")
+    if args.batch is not None and (args.script or args.profile or args.heatmap or args.serve):
+        parser.error("--batch takes no script and no --profile, --heatmap or --serve")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    if args.serve:
+        # The daemon runs scripts through this module.
+        from daemon import serve
+
+        serve(args.socket, args.workers)
+    elif args.batch is not None:
+        from batch import run_batch
+
+        exit(run_batch(args))
+    elif args.script == "rprompt":
+        run_prompt(args.engine, args.optimize)
+    elif args.script and args.script.endswith((".lox", ".pylox")):
+        with profiling(args), heat_mapping(args) as heatmap:
+            run_file(
+                args.script,
+                args.engine,
+                args.disassemble,
+                args.stats,
+                args.max_depth,
+                not args.no_cache,
+                args.optimize,
+                args.inline_size,
+                heatmap,
+            )
+    else:
+        parser.print_usage()
+        exit(64)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import operator
+from typing import Dict, Tuple, Type
+from interpret import (
+    BINARY_OPERATIONS,
+    UNARY_OPERATIONS,
+    Interpreter,
+    evaluate_binary,
+    evaluate_unary,
+)
+from errors import InterpretationError
+from AstPrinter import *
+from tokens import *
+
+
+class QuickeningStats:
+    def __init__(self):
+        # Nodes rewritten to a type-specialized fast path.
+        self.specialized = 0
+        # Specialized nodes that saw another type and fell back to the generic path.
+        self.deoptimized = 0
+        # Nodes that went straight to the generic path (==, !, mixed operands...).
+        self.generic = 0
+
+    def __str__(self):
+        return (
+            f"quickening: {self.specialized} specialized, "
+            f"{self.deoptimized} deoptimized, {self.generic} generic"
+        )
+
+
+class GenericBinary(Binary):
+    """A Binary whose operator has already been looked up. This is also the
+    final state of a deoptimized node, so a node never flips back and forth."""
+
+    # No slots of its own: the node's __class__ can only be swapped between
+    # classes with the same layout.
+    __slots__ = ()
+    operation = staticmethod(evaluate_binary)
+
+    def accept(self, visitor: "ExprVisitor[T]") -> T:
+        left = self.left.accept(visitor)
+        right = self.right.accept(visitor)
+        return self.operation(self.operator, left, right)
+
+
+class SpecializedBinary(Binary):
+    """A Binary that has only seen operands of `operand_type` so far."""
+
+    __slots__ = ()
+    operand_type: type = object
+    operation = staticmethod(operator.add)
+
+    def accept(self, visitor: "ExprVisitor[T]") -> T:
+        # Read before evaluating the operands: a recursive call inside them
+        # may deoptimize this very node.
+        operand_type = self.operand_type
+        left = self.left.accept(visitor)
+        right = self.right.accept(visitor)
+        if type(left) is operand_type and type(right) is operand_type:
+            return self.operation(left, right)
+        return visitor.deoptimize_binary(self, left, right)
+
+
+class SpecializedDivide(SpecializedBinary):
+    __slots__ = ()
+
+    def accept(self, visitor: "ExprVisitor[T]") -> T:
+        # Read before evaluating the operands: a recursive call inside them
+        # may deoptimize this very node.
+        operand_type = self.operand_type
+        left = self.left.accept(visitor)
+        right = self.right.accept(visitor)
+        if type(left) is operand_type and type(right) is operand_type:
+            if right == 0:
+                raise InterpretationError(self.operator, "Division by zero")
+            return left / right
+        return visitor.deoptimize_binary(self, left, right)
+
+
+class GenericUnary(Unary):
+    __slots__ = ()
+    operation = staticmethod(evaluate_unary)
+
+    def accept(self, visitor: "ExprVisitor[T]") -> T:
+        return self.operation(self.operator, self.right.accept(visitor))
+
+
+class SpecializedNegate(Unary):
+    __slots__ = ()
+    operand_type: type = object
+
+    def accept(self, visitor: "ExprVisitor[T]") -> T:
+        operand_type = self.operand_type
+        right = self.right.accept(visitor)
+        if type(right) is operand_type:
+            return -right
+        return visitor.deoptimize_unary(self, right)
+
+
+SPECIALIZED_OPERATIONS = {
+    TokenType.MINUS: operator.sub,
+    TokenType.STAR: operator.mul,
+    TokenType.PLUS: operator.add,
+    TokenType.GREATER: operator.gt,
+    TokenType.GREATER_EQUAL: operator.ge,
+    TokenType.LESS: operator.lt,
+    TokenType.LESS_EQUAL: operator.le,
+}
+
+
+def build_specializations() -> Dict[Tuple[TokenType, type], Type[Binary]]:
+    specializations: Dict[Tuple[TokenType, type], Type[Binary]] = {}
+    for operand_type in (int, float):
+        for (ttype, operation) in SPECIALIZED_OPERATIONS.items():
+            specializations[(ttype, operand_type)] = type(
+                f"{operand_type.__name__.capitalize()}{ttype.name.title()}",
+                (SpecializedBinary,),
+                {
+                    "__slots__": (),
+                    "operand_type": operand_type,
+                    "operation": staticmethod(operation),
+                },
+            )
+        specializations[(TokenType.SLASH, operand_type)] = type(
+            f"{operand_type.__name__.capitalize()}Slash",
+            (SpecializedDivide,),
+            {"__slots__": (), "operand_type": operand_type},
+        )
+    specializations[(TokenType.PLUS, str)] = type(
+        "StrPlus",
+        (SpecializedBinary,),
+        {"__slots__": (), "operand_type": str, "operation": staticmethod(operator.add)},
+    )
+    return specializations
+
+
+BINARY_SPECIALIZATIONS = build_specializations()
+
+GENERIC_BINARIES = {
+    ttype: type(
+        f"Generic{ttype.name.title()}",
+        (GenericBinary,),
+        {"__slots__": (), "operation": staticmethod(operation)},
+    )
+    for (ttype, operation) in BINARY_OPERATIONS.items()
+}
+
+NEGATE_SPECIALIZATIONS = {
+    operand_type: type(
+        f"{operand_type.__name__.capitalize()}Negate",
+        (SpecializedNegate,),
+        {"__slots__": (), "operand_type": operand_type},
+    )
+    for operand_type in (int, float)
+}
+
+GENERIC_UNARIES = {
+    ttype: type(
+        f"Generic{ttype.name.title()}",
+        (GenericUnary,),
+        {"__slots__": (), "operation": staticmethod(operation)},
+    )
+    for (ttype, operation) in UNARY_OPERATIONS.items()
+}
+
+
+class QuickeningInterpreter(Interpreter):
+    """Tree-walker that rewrites Binary and Unary nodes in place.
+
+    The first evaluation of a node records its operand types and swaps the
+    node's class for one with a fast path for those types (int, float, or
+    str for `+`). When a specialized node later sees other operand types it
+    deoptimizes to the generic operation for good. Rewritten nodes evaluate
+    themselves in `accept`, so they are only meant to be run by this
+    interpreter.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.stats = QuickeningStats()
+
+    def visit_binary(self, binary: Binary):
+        left = self.visit_expr(binary.left)
+        right = self.visit_expr(binary.right)
+
+        ttype = binary.operator.ttype
+        if type(binary) is not Binary:
+            # Already rewritten by a recursive evaluation of its operands.
+            pass
+        elif type(left) is type(right) and (ttype, type(left)) in BINARY_SPECIALIZATIONS:
+            binary.__class__ = BINARY_SPECIALIZATIONS[(ttype, type(left))]
+            self.stats.specialized += 1
+        elif ttype in GENERIC_BINARIES:
+            binary.__class__ = GENERIC_BINARIES[ttype]
+            self.stats.generic += 1
+
+        return evaluate_binary(binary.operator, left, right)
+
+    def deoptimize_binary(self, binary: Binary, left: Any, right: Any):
+        if isinstance(binary, SpecializedBinary):
+            binary.__class__ = GENERIC_BINARIES[binary.operator.ttype]
+            self.stats.deoptimized += 1
+        return evaluate_binary(binary.operator, left, right)
+
+    def visit_unary(self, unary: Unary):
+        right = self.visit_expr(unary.right)
+
+        ttype = unary.operator.ttype
+        if type(unary) is not Unary:
+            # Already rewritten by a recursive evaluation of its operand.
+            pass
+        elif ttype == TokenType.MINUS and type(right) in NEGATE_SPECIALIZATIONS:
+            unary.__class__ = NEGATE_SPECIALIZATIONS[type(right)]
+            self.stats.specialized += 1
+        elif ttype in GENERIC_UNARIES:
+            unary.__class__ = GENERIC_UNARIES[ttype]
+            self.stats.generic += 1
+
+        return evaluate_unary(unary.operator, right)
+
+    def deoptimize_unary(self, unary: Unary, right: Any):
+        if isinstance(unary, SpecializedNegate):
+            unary.__class__ = GENERIC_UNARIES[unary.operator.ttype]
+            self.stats.deoptimized += 1
+        return evaluate_unary(unary.operator, right)
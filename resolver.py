@@ -2,6 +2,7 @@ from AstPrinter import *
 from collections import deque
 from errors import add_error, error
 from enum import Enum, auto
+from tokens import TokenType
 
 
 class FunctionType(Enum):
@@ -17,38 +18,123 @@ class ClassType(Enum):
     SUBCLASS = auto()
 
 
+def declares_names(stmts: List[Stmt]) -> bool:
+    return any(isinstance(stmt, (Var, Function, Class)) for stmt in stmts)
+
+
+COUNTED_COMPARISONS = (
+    TokenType.LESS,
+    TokenType.LESS_EQUAL,
+    TokenType.GREATER,
+    TokenType.GREATER_EQUAL,
+)
+
+
+def assigns(node: Any, name: str) -> bool:
+    """Whether anything in `node`, a node or a list of them, assigns to a
+    variable called `name`, including inside nested functions."""
+    if isinstance(node, list):
+        return any(assigns(item, name) for item in node)
+    if not hasattr(node, "accept"):
+        return False
+    if type(node) is Assign and node.name.lexeme == name:
+        return True
+    return any(assigns(getattr(node, field), name) for field in node.__slots__)
+
+
+def is_local(expr: Expr, var: Var) -> bool:
+    return (
+        type(expr) is Variable
+        and expr.name.lexeme == var.name.lexeme
+        and expr.depth == 0
+        and expr.slot == var.slot
+    )
+
+
+def counted_loop(block: Block) -> Optional[CountedLoop]:
+    """Recognizes the block a `for` loop over a number desugars to, once
+    its names are resolved. The variable must only be assigned by the
+    loop's own increment, so it moves by the same step every iteration."""
+    if len(block.statements) != 2:
+        return None
+    var, loop = block.statements
+    if type(var) is not Var or type(loop) is not While:
+        return None
+
+    condition = loop.condition
+    if (
+        type(condition) is not Binary
+        or condition.operator.ttype not in COUNTED_COMPARISONS
+        or not is_local(condition.left, var)
+    ):
+        return None
+
+    body = loop.body
+    if type(body) is not Block or body.slot_count or not body.statements:
+        return None
+    last = body.statements[-1]
+    if type(last) is not Expression or type(last.expression) is not Assign:
+        return None
+
+    increment = last.expression
+    step = increment.value
+    if (
+        increment.name.lexeme != var.name.lexeme
+        or increment.depth != 0
+        or increment.slot != var.slot
+        or type(step) is not Binary
+        or step.operator.ttype not in (TokenType.PLUS, TokenType.MINUS)
+        or not is_local(step.left, var)
+        or type(step.right) is not Literal
+        or type(step.right.value) not in (int, float)
+    ):
+        return None
+
+    name = var.name.lexeme
+    if assigns(condition.right, name) or assigns(body.statements[:-1], name):
+        return None
+    return CountedLoop(var, loop, increment)
+
+
 class Resolver(StmtVisitor[None], ExprVisitor[None]):
-    def __init__(self, interpreter):
+    def __init__(self):
+        # Each scope maps a name to (slot, defined).
         self.scopes = deque()
-        self.interpreter = interpreter
         self.current_function = FunctionType.NONE
         self.current_class = ClassType.NONE
 
     def begin_scope(self):
         self.scopes.append({})
 
-    def end_scope(self):
-        self.scopes.pop()
+    def end_scope(self) -> int:
+        """Closes the innermost scope and returns how many slots it used."""
+        return len(self.scopes.pop())
 
-    def declare(self, name: Token) -> None:
+    def declare(self, name: Token) -> Optional[int]:
         if len(self.scopes) == 0:
-            return
+            return None
         scope = self.scopes[-1]
 
         if name.lexeme in scope:
             add_error(name, "Variable with this name already declared in this scope.")
+            slot = scope[name.lexeme][0]
+        else:
+            slot = len(scope)
 
-        scope[name.lexeme] = False
+        scope[name.lexeme] = (slot, False)
+        return slot
 
     def define(self, name: Token) -> None:
         if len(self.scopes) == 0:
             return
-        self.scopes[-1][name.lexeme] = True
+        scope = self.scopes[-1]
+        scope[name.lexeme] = (scope[name.lexeme][0], True)
 
     def resolve_local(self, expr: Expr, name: Token) -> None:
         for i, scope in enumerate(reversed(self.scopes)):
             if name.lexeme in scope:
-                self.interpreter.local_vars[id(expr)] = i
+                expr.depth = i
+                expr.slot = scope[name.lexeme][0]
                 return
 
     def resolve_list(self, statements: List[Stmt]):
@@ -60,18 +146,27 @@ class Resolver(StmtVisitor[None], ExprVisitor[None]):
         self.current_function = function_type
 
         self.begin_scope()
+        if function_type in (FunctionType.METHOD, FunctionType.INITIALIZER):
+            # The receiver is installed in slot 0 of the method's own scope.
+            self.scopes[-1]["this"] = (0, True)
         for param in func.params:
             self.declare(param)
             self.define(param)
         self.resolve_list(func.body)
-        self.end_scope()
+        func.slot_count = self.end_scope()
 
         self.current_function = enclosing_function
 
     def visit_block(self, stmt: Block) -> None:
+        if not declares_names(stmt.statements):
+            stmt.slot_count = 0
+            self.resolve_list(stmt.statements)
+            return
+
         self.begin_scope()
         self.resolve_list(stmt.statements)
-        self.end_scope()
+        stmt.slot_count = self.end_scope()
+        stmt.counted_loop = counted_loop(stmt)
 
     def resolve_stmt(self, stmt: Stmt) -> None:
         stmt.accept(self)
@@ -80,14 +175,18 @@ class Resolver(StmtVisitor[None], ExprVisitor[None]):
         expr.accept(self)
 
     def visit_var(self, stmt: Var) -> None:
-        self.declare(stmt.name)
+        stmt.slot = self.declare(stmt.name)
         if stmt.initializer:
             self.resolve_expr(stmt.initializer)
         self.define(stmt.name)
 
     def visit_variable(self, expr: Variable) -> None:
-        if self.scopes and self.scopes[-1].get(expr.name.lexeme) is False:
-            add_error(expr.name, "Cannot read local variable in its own initializer.")
+        if self.scopes:
+            local = self.scopes[-1].get(expr.name.lexeme)
+            if local is not None and not local[1]:
+                add_error(
+                    expr.name, "Cannot read local variable in its own initializer."
+                )
         self.resolve_local(expr, expr.name)
 
     def visit_assign(self, expr: Assign) -> None:
@@ -95,7 +194,7 @@ class Resolver(StmtVisitor[None], ExprVisitor[None]):
         self.resolve_local(expr, expr.name)
 
     def visit_function(self, func: Function) -> None:
-        self.declare(func.name)
+        func.slot = self.declare(func.name)
         self.define(func.name)
 
         self.resolve_function(func, FunctionType.FUNCTION)
@@ -133,8 +232,7 @@ class Resolver(StmtVisitor[None], ExprVisitor[None]):
         self.resolve_stmt(stmt.body)
 
     def visit_binary(self, expr: Binary) -> None:
-        self.resolve_expr(expr.left)
-        self.resolve_expr(expr.right)
+        self.resolve_chain(expr)
 
     def visit_call(self, expr: Call) -> None:
         self.resolve_expr(expr.callee)
@@ -148,8 +246,18 @@ class Resolver(StmtVisitor[None], ExprVisitor[None]):
         pass
 
     def visit_logical(self, expr: Logical) -> None:
-        self.resolve_expr(expr.left)
-        self.resolve_expr(expr.right)
+        self.resolve_chain(expr)
+
+    def resolve_chain(self, expr: Expr) -> None:
+        """Resolves a left-leaning chain of binary and logical operators,
+        such as a long sum, without recursing down its left operands."""
+        rights = []
+        while type(expr) is Binary or type(expr) is Logical:
+            rights.append(expr.right)
+            expr = expr.left
+        self.resolve_expr(expr)
+        for right in reversed(rights):
+            self.resolve_expr(right)
 
     def visit_unary(self, expr: Unary) -> None:
         self.resolve_expr(expr.right)
@@ -158,7 +266,7 @@ class Resolver(StmtVisitor[None], ExprVisitor[None]):
         enclosing = self.current_class
         self.current_class = ClassType.CLASS
 
-        self.declare(stmt.name)
+        stmt.slot = self.declare(stmt.name)
         self.define(stmt.name)
 
         if stmt.superclass:
@@ -168,10 +276,7 @@ class Resolver(StmtVisitor[None], ExprVisitor[None]):
                 add_error(stmt.superclass.name, "A class can't inherit from itself")
 
             self.begin_scope()
-            self.scopes[-1]["super"] = True
-
-        self.begin_scope()
-        self.scopes[-1]["this"] = True
+            self.scopes[-1]["super"] = (0, True)
 
         for method in stmt.methods:
             declaration = FunctionType.METHOD
@@ -182,7 +287,6 @@ class Resolver(StmtVisitor[None], ExprVisitor[None]):
         if stmt.superclass:
             self.end_scope()
 
-        self.end_scope()
         self.current_class = enclosing
 
     def visit_get(self, expr: Get) -> None:
@@ -205,3 +309,6 @@ class Resolver(StmtVisitor[None], ExprVisitor[None]):
             add_error(expr.keyword, "Can't use 'super' in a class with no superclass.")
 
         self.resolve_local(expr, expr.keyword)
+
+    def visit_inlined(self, expr: Inlined) -> None:
+        self.resolve_expr(expr.body)
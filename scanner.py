@@ -1,3 +1,5 @@
+import re
+import sys
 from tokens import *
 from errors import *
 
@@ -22,149 +24,125 @@ keywords = {
 }
 
 
+OPERATORS = {
+    "(": TokenType.LEFT_PAREN,
+    ")": TokenType.RIGHT_PAREN,
+    "{": TokenType.LEFT_BRACE,
+    "}": TokenType.RIGHT_BRACE,
+    ",": TokenType.COMMA,
+    ".": TokenType.DOT,
+    "-": TokenType.MINUS,
+    "+": TokenType.PLUS,
+    ";": TokenType.SEMICOLON,
+    "/": TokenType.SLASH,
+    "*": TokenType.STAR,
+    "!": TokenType.BANG,
+    "!=": TokenType.BANG_EQUAL,
+    "=": TokenType.EQUAL,
+    "==": TokenType.EQUAL_EQUAL,
+    ">": TokenType.GREATER,
+    ">=": TokenType.GREATER_EQUAL,
+    "<": TokenType.LESS,
+    "<=": TokenType.LESS_EQUAL,
+}
+
+# Operators and keywords map straight to their type; any other word is an
+# identifier.
+FIXED_TOKENS = {**OPERATORS, **keywords}
+
+# Matches one whole token per step, after skipping blanks on the same line.
+# The group that matched tells what kind of lexeme it is.
+TOKEN_PATTERN = re.compile(
+    r"""[ \r\t]*(?:
+        (//[^\n]*)                                # 1: comment
+      | ([^\W\d][^\W_]*|[!=<>]=?|[(){},.\-+;*/])  # 2: word or operator
+      | (\n[ \r\t\n]*)                           # 3: newlines
+      | (\d+(\.\d+)?)                             # 4: number, 5: fraction
+      | ("[^"]*"?)                                 # 6: string
+      | \Z                                        # trailing blanks
+      | (.)                                        # 7: unexpected character
+    )""",
+    re.VERBOSE | re.DOTALL,
+)
+COMMENT, WORD, NEWLINES, NUMBER, FRACTION, STRING, UNEXPECTED = range(1, 8)
+
+
+# Source files are read and scanned this many characters at a time.
+CHUNK_SIZE = 1 << 20
+
+
+def read_chunks(path, size=CHUNK_SIZE):
+    """Yields the text of the file at `path` in chunks of `size` characters."""
+    with open(path, encoding="utf8") as f:
+        while chunk := f.read(size):
+            yield chunk
+
+
 class Scanner:
+    """Splits source into tokens with TOKEN_PATTERN, one match per token.
+
+    The source is either a string or an iterable of string chunks, such as
+    read_chunks(path). `scan` yields tokens as it goes, so neither the whole
+    file nor the whole token list has to be held in memory; `scan_tokens`
+    collects them into a list.
+
+    Identifier lexemes are interned, so every occurrence of a name shares
+    one string.
+    """
+
     def __init__(self, source):
-        self.source = source
+        self.source = [source] if isinstance(source, str) else source
         self.tokens = []
-        self.start = 0
-        self.current = 0
         self.line = 1
 
-    def is_at_end(self):
-        return self.current >= len(self.source)
-
-    def advance(self):
-        c = self.source[self.current]
-        self.current += 1
-        return c
-
-    def match_c(self, expected):
-        if self.is_at_end():
-            return False
-        elif self.source[self.current] != expected:
-            return False
-
-        self.current += 1
-        return True
-
-    def peek_next(self):
-        if self.current + 1 >= len(self.source):
-            return "\0"
-        else:
-            return self.source[self.current + 1]
-
-    def peek(self):
-        if self.is_at_end():
-            return "\0"
-        else:
-            return self.source[self.current]
-
-    def add_single_token(self, ttype: TokenType):
-        self.add_token(ttype, None)
-
-    def add_token(self, ttype: TokenType, literal):
-        text = self.source[self.start : self.current]
-        self.tokens.append(Token(ttype, text, literal, self.line))
-
-    def string(self):
-        while self.peek() != '"' and not self.is_at_end():
-            if self.peek() == "\n":
-                self.line += 1
-            self.advance()
-        if self.is_at_end():
-            error(self.line, "Unterminated string.")
-            return
-
-        self.advance()
-
-        value = self.source[self.start + 1 : self.current - 1]
-        self.add_token(TokenType.STRING, value)
-
-    def number(self):
-        while self.peek().isdigit():
-            self.advance()
-
-        if self.peek() == "." and self.peek_next().isnumeric():
-            self.advance()
-
-            while self.peek().isnumeric():
-                self.advance()
-
-            value = float(self.source[self.start : self.current])
-            self.add_token(TokenType.NUMBER, value)
-        else:
-            value = int(self.source[self.start : self.current])
-            self.add_token(TokenType.NUMBER, value)
-
-    def identifier(self):
-        while self.peek().isalnum():
-            self.advance()
-
-        text = self.source[self.start : self.current]
-        self.add_single_token(keywords.get(text, TokenType.IDENTIFIER))
-
-    def scan_token(self):
-        c = self.advance()
-
-        if c == "(":
-            self.add_single_token(TokenType.LEFT_PAREN)
-        elif c == ")":
-            self.add_single_token(TokenType.RIGHT_PAREN)
-        elif c == "{":
-            self.add_single_token(TokenType.LEFT_BRACE)
-        elif c == "}":
-            self.add_single_token(TokenType.RIGHT_BRACE)
-        elif c == ".":
-            self.add_single_token(TokenType.DOT)
-        elif c == ",":
-            self.add_single_token(TokenType.COMMA)
-        elif c == "-":
-            self.add_single_token(TokenType.MINUS)
-        elif c == "+":
-            self.add_single_token(TokenType.PLUS)
-        elif c == ";":
-            self.add_single_token(TokenType.SEMICOLON)
-        elif c == "*":
-            self.add_single_token(TokenType.STAR)
-        elif c == "!":
-            self.add_single_token(
-                TokenType.BANG_EQUAL if self.match_c("=") else TokenType.BANG
-            )
-        elif c == "=":
-            self.add_single_token(
-                TokenType.EQUAL_EQUAL if self.match_c("=") else TokenType.EQUAL
-            )
-        elif c == "<":
-            self.add_single_token(
-                TokenType.LESS_EQUAL if self.match_c("=") else TokenType.LESS
-            )
-        elif c == ">":
-            self.add_single_token(
-                TokenType.GREATER_EQUAL if self.match_c("=") else TokenType.GREATER
-            )
-        elif c == "/":
-            if self.match_c("/"):
-                while self.peek() != "\n" and not self.is_at_end():
-                    self.advance()
-            else:
-                self.add_single_token(TokenType.SLASH)
-        elif c in " \r\t":
-            pass
-        elif c == "\n":
-            self.line += 1
-        elif c == '"':
-            self.string()
-        else:
-            if c.isnumeric():
-                self.number()
-            elif c.isalpha() or c == "_":
-                self.identifier()
-            else:
-                error(self.line, "Unexpected character.")
-
     def scan_tokens(self):
-        while not self.is_at_end():
-            self.start = self.current
-            self.scan_token()
-        self.tokens.append(Token(TokenType.EOF, "", None, self.line))
+        self.tokens.extend(self.scan())
         return self.tokens
+
+    def scan(self):
+        line = self.line
+        intern = sys.intern
+        fixed = FIXED_TOKENS.get
+        identifier = TokenType.IDENTIFIER
+
+        chunks = iter(self.source)
+        chunk = next(chunks, None)
+        pending = ""
+        while chunk is not None:
+            following = next(chunks, None)
+            text = pending + chunk if pending else chunk
+            pending = ""
+            # Until the last chunk, a match that reaches the final character
+            # may continue in the next chunk ("1." then "5", "=" then "=").
+            # Leave it for the next round together with that chunk.
+            held = len(text) - 1 if following is not None else len(text) + 1
+
+            for match in TOKEN_PATTERN.finditer(text):
+                if match.end() >= held:
+                    pending = text[match.start():]
+                    break
+
+                kind = match.lastindex
+                if kind == WORD:
+                    lexeme = intern(match.group(WORD))
+                    yield Token(fixed(lexeme, identifier), lexeme, None, line)
+                elif kind == NEWLINES:
+                    line += match.group(NEWLINES).count("\n")
+                elif kind == NUMBER:
+                    lexeme = match.group(NUMBER)
+                    value = float(lexeme) if match.group(FRACTION) else int(lexeme)
+                    yield Token(TokenType.NUMBER, lexeme, value, line)
+                elif kind == STRING:
+                    lexeme = match.group(STRING)
+                    line += lexeme.count("\n")
+                    if len(lexeme) < 2 or lexeme[-1] != '"':
+                        error(line, "Unterminated string.")
+                    else:
+                        yield Token(TokenType.STRING, lexeme, lexeme[1:-1], line)
+                elif kind == UNEXPECTED:
+                    error(line, "Unexpected character.")
+
+            chunk = following
+
+        self.line = line
+        yield Token(TokenType.EOF, "", None, line)
@@ -53,7 +53,7 @@ class TokenType(Enum):
     EOF = auto()
 
 
-@dataclass
+@dataclass(slots=True)
 class Token:
     ttype: TokenType
     lexeme: str
@@ -0,0 +1,560 @@
+from bytecode import *
+from bytecode import FunctionProto
+from errors import InterpretationError, NativeError, runtime_error
+from interpret import BoundMethod, LoxClass, LoxInstance, gen_globals, stringify
+
+# Default maximum number of active Lox calls before reporting a stack
+# overflow. Frames live on the heap, so this is not tied to Python's
+# recursion limit and can be raised with VM(max_depth=...).
+FRAMES_MAX = 1024
+
+
+class Upvalue:
+    __slots__ = ("index", "value")
+
+    def __init__(self, index: int):
+        # While open, the variable still lives in the VM stack at `index`.
+        # Closing copies it into `value` and sets `index` to -1.
+        self.index = index
+        self.value = None
+
+
+class Closure(LoxCallable):
+    __slots__ = ("proto", "upvalues")
+
+    def __init__(self, proto: FunctionProto, upvalues: List[Upvalue]):
+        self.proto = proto
+        self.upvalues = upvalues
+
+    @property
+    def arity(self) -> int:
+        return self.proto.arity
+
+    @property
+    def declaration(self) -> Optional[Function]:
+        return self.proto.declaration
+
+    def call(self, interpreter: AbstractInterpreter[Any], arguments: List[Any]) -> Any:
+        return interpreter.call_function(self, None, arguments)
+
+    def call_method(
+        self, interpreter: AbstractInterpreter[Any], this: Any, arguments: List[Any]
+    ) -> Any:
+        return interpreter.call_function(self, this, arguments)
+
+    def bind(self, instance: LoxInstance):
+        return BoundMethod(instance, self)
+
+    def __str__(self):
+        return str(self.proto)
+
+
+class CallFrame:
+    __slots__ = ("closure", "ip", "base")
+
+    def __init__(self, closure: Closure, ip: int, base: int):
+        self.closure = closure
+        self.ip = ip
+        self.base = base
+
+
+class VMError(Exception):
+    pass
+
+
+class StackOverflow(InterpretationError):
+    """Raised when a call would exceed max_depth. Unlike other runtime
+    errors it is not resumed after: every frame is abandoned, as clox
+    does when it resets its stack."""
+
+
+def is_number(value):
+    return isinstance(value, (int, float))
+
+
+class VM(AbstractInterpreter[Any]):
+    """Stack-based virtual machine for the bytecode produced by bytecode.py.
+
+    Lox calls push a CallFrame instead of recursing in Python. Runtime
+    errors follow the tree-walker: the innermost enclosing block reports
+    the error and execution resumes after it; outside any block the
+    current call returns nil (or `this` from an initializer), and at the
+    top level the script stops. A stack overflow stops the script
+    wherever it happens.
+    """
+
+    def __init__(self, max_depth: int = FRAMES_MAX):
+        self.max_depth = max_depth
+        self.globals = gen_globals()
+        self.stack: List[Any] = []
+        self.frames: List[CallFrame] = []
+        # (frame depth, stack height, target ip) for each active block.
+        self.handlers: List[Tuple[int, int, int]] = []
+        self.open_upvalues: List[Upvalue] = []
+
+    def visit_statements(self, stmts: List[Stmt], env=None):
+        proto = Compiler().compile(stmts)
+        self.interpret(proto)
+
+    def interpret(self, proto: FunctionProto):
+        script = Closure(proto, [])
+        self.stack.append(script)
+        self.frames.append(CallFrame(script, 0, 0))
+        self.run(0)
+
+    def call_function(self, closure: Closure, receiver: Any, arguments: List[Any]):
+        """Calls a Lox function from Python, e.g. through LoxClass.call."""
+        frames = self.frames
+        depth = len(frames)
+        if depth >= self.max_depth:
+            raise self.stack_overflow()
+        self.stack.append(closure if receiver is None else receiver)
+        self.stack.extend(arguments)
+        frames.append(CallFrame(closure, 0, len(self.stack) - len(arguments) - 1))
+        try:
+            return self.run(depth)
+        except RecursionError:
+            # Each call through Python nests a run; Python's stack can run
+            # out before max_depth does.
+            del frames[depth:]
+            raise self.stack_overflow() from None
+
+    def stack_overflow(self) -> "StackOverflow":
+        """A stack overflow on the line of the call the current frame is
+        making, which is where its ip stops while the call runs."""
+        frame = self.frames[-1]
+        error = self.error(frame, frame.ip, "Stack overflow.")
+        return StackOverflow(error.token, error.message)
+
+    def reset_stack(self) -> None:
+        """Drops every frame, handler and value, as after the script ends."""
+        self.stack.clear()
+        self.frames.clear()
+        self.handlers.clear()
+        self.open_upvalues = []
+
+    def capture_upvalue(self, index: int) -> Upvalue:
+        for upvalue in self.open_upvalues:
+            if upvalue.index == index:
+                return upvalue
+        upvalue = Upvalue(index)
+        self.open_upvalues.append(upvalue)
+        return upvalue
+
+    def close_upvalues(self, last: int):
+        stack = self.stack
+        still_open = []
+        for upvalue in self.open_upvalues:
+            if upvalue.index >= last:
+                upvalue.value = stack[upvalue.index]
+                upvalue.index = -1
+            else:
+                still_open.append(upvalue)
+        self.open_upvalues = still_open
+
+    def error(self, frame: CallFrame, ip: int, message: str) -> InterpretationError:
+        line = frame.closure.proto.chunk.lines[ip - 1]
+        return InterpretationError(Token(TokenType.EOF, "", None, line), message)
+
+    def run(self, stop_depth: int) -> Any:
+        """Runs until the frame count drops back to `stop_depth` and returns
+        the value returned by the last frame."""
+        while True:
+            try:
+                return self.dispatch(stop_depth)
+            except StackOverflow as err:
+                self.abandon(stop_depth)
+                if stop_depth > 0:
+                    # Let the run that called into Python abandon its own.
+                    raise
+                runtime_error(err)
+                return None
+            except InterpretationError as err:
+                runtime_error(err)
+                (finished, result) = self.unwind(stop_depth)
+                if finished:
+                    return result
+
+    def unwind(self, stop_depth: int) -> Tuple[bool, Any]:
+        """Resumes after a runtime error. Returns (True, result) once the
+        frame that `run` was started for has been abandoned."""
+        frames = self.frames
+        handlers = self.handlers
+        depth = len(frames)
+
+        if handlers and handlers[-1][0] == depth:
+            (_, height, target) = handlers.pop()
+            self.close_upvalues(height)
+            del self.stack[height:]
+            frames[-1].ip = target
+            return (False, None)
+
+        frame = frames.pop()
+        self.close_upvalues(frame.base)
+        result = None
+        if frame.closure.proto.kind == FunctionType.INITIALIZER:
+            result = self.stack[frame.base]
+        del self.stack[frame.base :]
+
+        if len(frames) <= stop_depth:
+            return (True, result)
+
+        self.stack.append(result)
+        return (False, None)
+
+    def abandon(self, stop_depth: int) -> None:
+        """Drops every frame above `stop_depth`, with its handlers and
+        stack slots."""
+        frames = self.frames
+        base = frames[stop_depth].base
+        self.close_upvalues(base)
+        del frames[stop_depth:]
+        del self.stack[base:]
+        handlers = self.handlers
+        while handlers and handlers[-1][0] > stop_depth:
+            handlers.pop()
+
+    def dispatch(self, stop_depth: int) -> Any:
+        stack = self.stack
+        frames = self.frames
+        handlers = self.handlers
+        global_values = self.globals.values
+        max_depth = self.max_depth
+        push = stack.append
+        pop = stack.pop
+
+        frame = frames[-1]
+        closure = frame.closure
+        code = closure.proto.chunk.code
+        constants = closure.proto.chunk.constants
+        base = frame.base
+        ip = frame.ip
+
+        while True:
+            op = code[ip]
+            ip += 1
+
+            if op == GET_LOCAL:
+                push(stack[base + code[ip]])
+                ip += 1
+            elif op == CONSTANT:
+                push(constants[code[ip]])
+                ip += 1
+            elif op == GET_GLOBAL:
+                name = constants[code[ip]]
+                ip += 1
+                try:
+                    push(global_values[name])
+                except KeyError:
+                    raise self.error(frame, ip, f"Undefined variable: '{name}'")
+            elif op == POP_JUMP_IF_FALSE:
+                value = pop()
+                if value is None or value is False:
+                    ip = code[ip]
+                else:
+                    ip += 1
+            elif op == LESS:
+                b = pop()
+                a = pop()
+                if not (is_number(a) and is_number(b)):
+                    raise self.error(frame, ip, "Operands must be numbers")
+                push(a < b)
+            elif op == ADD:
+                b = pop()
+                a = pop()
+                if is_number(a) and is_number(b):
+                    push(a + b)
+                elif isinstance(a, str) and isinstance(b, str):
+                    push(a + b)
+                else:
+                    raise self.error(frame, ip, "Operands must be numbers")
+            elif op == SUBTRACT:
+                b = pop()
+                a = pop()
+                if not (is_number(a) and is_number(b)):
+                    raise self.error(frame, ip, "Operands must be numbers")
+                push(a - b)
+            elif CALL <= op <= TAIL_INVOKE:
+                argc = code[ip]
+                ip += 1
+                frame.ip = ip
+
+                if op == INVOKE or op == TAIL_INVOKE:
+                    # GET_METHOD left either the receiver and its method, or
+                    # the field value and None.
+                    callee = stack.pop(-1 - argc)
+                    if callee is None:
+                        callee = stack[-1 - argc]
+                else:
+                    callee = stack[-1 - argc]
+
+                receiver = None
+                if type(callee) is BoundMethod:
+                    receiver = callee.receiver
+                    callee = callee.method
+                elif type(callee) is LoxClass:
+                    receiver = LoxInstance(callee)
+                    initializer = callee.initializer
+                    if initializer is None:
+                        if argc != 0:
+                            raise self.error(
+                                frame,
+                                ip,
+                                f"Expected 0 arguments, but got {argc}.",
+                            )
+                        stack[-1] = receiver
+                        continue
+                    callee = initializer
+
+                if type(callee) is Closure:
+                    if argc != callee.proto.arity:
+                        raise self.error(
+                            frame,
+                            ip,
+                            f"Expected {callee.proto.arity} arguments, but got {argc}.",
+                        )
+
+                    start = len(stack) - argc - 1
+                    if receiver is not None:
+                        stack[start] = receiver
+
+                    if op >= TAIL_CALL:
+                        # The caller would only return the callee's result,
+                        # so the callee takes over its frame. The caller's
+                        # handlers can go: an error in the callee never
+                        # reaches them, its own body is the boundary.
+                        if self.open_upvalues:
+                            self.close_upvalues(base)
+                        depth = len(frames)
+                        while handlers and handlers[-1][0] == depth:
+                            handlers.pop()
+                        stack[base:] = stack[start:]
+                        frame.closure = callee
+                    else:
+                        if len(frames) >= max_depth:
+                            raise self.stack_overflow()
+                        base = start
+                        frame = CallFrame(callee, 0, base)
+                        frames.append(frame)
+
+                    closure = callee
+                    code = closure.proto.chunk.code
+                    constants = closure.proto.chunk.constants
+                    ip = 0
+                    continue
+
+                if not isinstance(callee, LoxCallable):
+                    raise self.error(frame, ip, f"{callee} is not callable")
+
+                if argc != callee.arity:
+                    raise self.error(
+                        frame,
+                        ip,
+                        f"Expected {callee.arity} arguments, but got {argc}.",
+                    )
+
+                arguments = stack[len(stack) - argc :]
+                try:
+                    result = callee.call(self, arguments)
+                except NativeError as err:
+                    raise self.error(frame, ip, err.message)
+                del stack[len(stack) - argc - 1 :]
+                push(result)
+            elif op == RETURN:
+                result = pop()
+                if self.open_upvalues:
+                    self.close_upvalues(base)
+                depth = len(frames)
+                while handlers and handlers[-1][0] == depth:
+                    handlers.pop()
+                frames.pop()
+                del stack[base:]
+
+                if len(frames) <= stop_depth:
+                    return result
+
+                push(result)
+                frame = frames[-1]
+                closure = frame.closure
+                code = closure.proto.chunk.code
+                constants = closure.proto.chunk.constants
+                base = frame.base
+                ip = frame.ip
+            elif op == SET_LOCAL:
+                stack[base + code[ip]] = stack[-1]
+                ip += 1
+            elif op == POP:
+                pop()
+            elif op == JUMP:
+                ip = code[ip]
+            elif op == GET_UPVALUE:
+                upvalue = closure.upvalues[code[ip]]
+                ip += 1
+                if upvalue.index >= 0:
+                    push(stack[upvalue.index])
+                else:
+                    push(upvalue.value)
+            elif op == SET_UPVALUE:
+                upvalue = closure.upvalues[code[ip]]
+                ip += 1
+                if upvalue.index >= 0:
+                    stack[upvalue.index] = stack[-1]
+                else:
+                    upvalue.value = stack[-1]
+            elif op == NIL:
+                push(None)
+            elif op == TRUE:
+                push(True)
+            elif op == FALSE:
+                push(False)
+            elif op == GREATER:
+                b = pop()
+                a = pop()
+                if not (is_number(a) and is_number(b)):
+                    raise self.error(frame, ip, "Operands must be numbers")
+                push(a > b)
+            elif op == GREATER_EQUAL:
+                b = pop()
+                a = pop()
+                if not (is_number(a) and is_number(b)):
+                    raise self.error(frame, ip, "Operands must be numbers")
+                push(a >= b)
+            elif op == LESS_EQUAL:
+                b = pop()
+                a = pop()
+                if not (is_number(a) and is_number(b)):
+                    raise self.error(frame, ip, "Operands must be numbers")
+                push(a <= b)
+            elif op == MULTIPLY:
+                b = pop()
+                a = pop()
+                if not (is_number(a) and is_number(b)):
+                    raise self.error(frame, ip, "Operands must be numbers")
+                push(a * b)
+            elif op == DIVIDE:
+                b = pop()
+                a = pop()
+                if not (is_number(a) and is_number(b)):
+                    raise self.error(frame, ip, "Operands must be numbers")
+                if b == 0:
+                    raise self.error(frame, ip, "Division by zero")
+                push(a / b)
+            elif op == EQUAL:
+                b = pop()
+                stack[-1] = stack[-1] == b
+            elif op == NOT_EQUAL:
+                b = pop()
+                stack[-1] = stack[-1] != b
+            elif op == NOT:
+                value = stack[-1]
+                stack[-1] = value is None or value is False
+            elif op == NEGATE:
+                stack[-1] = -stack[-1]
+            elif op == PRINT:
+                print(stringify(pop()))
+            elif op == DEFINE_GLOBAL:
+                global_values[constants[code[ip]]] = pop()
+                ip += 1
+            elif op == SET_GLOBAL:
+                global_values[constants[code[ip]]] = stack[-1]
+                ip += 1
+            elif op == JUMP_IF_FALSE_OR_POP:
+                value = stack[-1]
+                if value is None or value is False:
+                    ip = code[ip]
+                else:
+                    pop()
+                    ip += 1
+            elif op == JUMP_IF_TRUE_OR_POP:
+                value = stack[-1]
+                if value is None or value is False:
+                    pop()
+                    ip += 1
+                else:
+                    ip = code[ip]
+            elif op == PUSH_HANDLER:
+                handlers.append((len(frames), len(stack), code[ip]))
+                ip += 1
+            elif op == POP_HANDLER:
+                handlers.pop()
+            elif op == GET_PROPERTY:
+                instance = stack[-1]
+                name = constants[code[ip]]
+                ip += 1
+                if not isinstance(instance, LoxInstance):
+                    raise self.error(frame, ip, "Only instances have properties")
+
+                slot = instance.shape.slots.get(name)
+                if slot is not None:
+                    stack[-1] = instance.values[slot]
+                else:
+                    method = instance.klass.find_method(name)
+                    if method is None:
+                        raise self.error(frame, ip, f"Undefined property '{name}'.")
+                    stack[-1] = BoundMethod(instance, method)
+            elif op == GET_METHOD:
+                instance = stack[-1]
+                name = constants[code[ip]]
+                ip += 1
+                if not isinstance(instance, LoxInstance):
+                    raise self.error(frame, ip, "Only instances have properties")
+
+                slot = instance.shape.slots.get(name)
+                if slot is not None:
+                    stack[-1] = instance.values[slot]
+                    push(None)
+                else:
+                    method = instance.klass.find_method(name)
+                    if method is None:
+                        raise self.error(frame, ip, f"Undefined property '{name}'.")
+                    push(method)
+            elif op == SET_PROPERTY:
+                value = pop()
+                instance = pop()
+                name = constants[code[ip]]
+                ip += 1
+                if not isinstance(instance, LoxInstance):
+                    raise self.error(frame, ip, "Only instances have fields")
+                instance.set_field(name, value)
+                push(value)
+            elif op == GET_SUPER:
+                superclass = pop()
+                instance = pop()
+                name = constants[code[ip]]
+                ip += 1
+                method = superclass.find_method(name)
+                if method is None:
+                    raise self.error(frame, ip, f"Undefined property '{name}'.")
+                push(BoundMethod(instance, method))
+            elif op == CLOSURE:
+                proto = constants[code[ip]]
+                ip += 1
+                upvalues = []
+                for _ in range(proto.upvalue_count):
+                    is_local = code[ip]
+                    index = code[ip + 1]
+                    ip += 2
+                    if is_local:
+                        upvalues.append(self.capture_upvalue(base + index))
+                    else:
+                        upvalues.append(closure.upvalues[index])
+                push(Closure(proto, upvalues))
+            elif op == CLOSE_UPVALUE:
+                self.close_upvalues(len(stack) - 1)
+                pop()
+            elif op == CHECK_SUPERCLASS:
+                if not isinstance(stack[-1], LoxClass):
+                    raise self.error(frame, ip, "Superclass must be a class.")
+            elif op == CLASS:
+                name = constants[code[ip]]
+                count = code[ip + 1]
+                ip += 2
+                methods = {}
+                if count:
+                    for method in stack[-count:]:
+                        methods[method.proto.name] = method
+                    del stack[-count:]
+                superclass = pop()
+                push(LoxClass(name, superclass, methods))
+            else:
+                raise VMError(f"Unknown opcode {op}")